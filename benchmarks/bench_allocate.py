@@ -0,0 +1,48 @@
+"""Time the maximize_dims factor allocation for large capacities.
+
+Run from the repository root:
+    python -m benchmarks.bench_allocate [repeats]
+"""
+
+import sys
+import time
+
+from timeloopfe.v4.processors.constraint_macro import _allocate, greedy_allocate
+
+# (dimension sizes, capacity)
+CASES = [
+    ({"C": 64, "M": 64}, 1024),
+    ({"C": 64, "M": 64, "P": 14}, 1024),
+    ({"C": 96, "M": 90, "P": 56}, 1000),
+    ({"C": 96, "M": 90, "P": 56, "Q": 56}, 1000),
+    ({"C": 256, "M": 384, "P": 56, "Q": 56}, 4096),
+    ({"C": 1155, "M": 105, "P": 27, "Q": 25}, 4096),
+    ({"C": 512, "M": 768, "P": 112, "Q": 112}, 16384),
+]
+
+
+def main(repeats: int = 5):
+    print(
+        f"{'dimensions':<40} {'capacity':>8} {'cold':>10} {'warm':>10} "
+        f"{'states':>8} {'utilization':>12}"
+    )
+    for factors, capacity in CASES:
+        _allocate.cache_clear()
+        start = time.perf_counter()
+        _, util = greedy_allocate(factors, capacity)
+        cold = time.perf_counter() - start
+        states = _allocate.cache_info().currsize
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            greedy_allocate(factors, capacity)
+        warm = (time.perf_counter() - start) / repeats
+        dims = " ".join(f"{k}={v}" for k, v in factors.items())
+        print(
+            f"{dims:<40} {capacity:>8} {cold * 1e3:>8.1f}ms {warm * 1e6:>8.1f}us "
+            f"{states:>8} {100 * util / capacity:>11.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,58 @@
+"""Compare Node.clone() with copy.deepcopy() on the example specifications.
+
+Run from the repository root:
+    python -m benchmarks.bench_clone [repeats]
+"""
+
+import copy
+import sys
+import time
+import tracemalloc
+
+from benchmarks.examples import EXAMPLES, load_example
+from timeloopfe.common.nodes import Node
+
+
+def legacy_deepcopy(spec):
+    """copy.deepcopy without the Node.__deepcopy__ hook."""
+    hook = Node.__deepcopy__
+    del Node.__deepcopy__
+    try:
+        return copy.deepcopy(spec)
+    finally:
+        Node.__deepcopy__ = hook
+
+
+def _measure(f, spec, repeats: int):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f(spec)
+    elapsed = (time.perf_counter() - start) / repeats
+    tracemalloc.start()
+    f(spec)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(repeats: int = 5):
+    print(
+        f"{'example':<52} {'deepcopy':>10} {'clone':>10} {'speedup':>8} "
+        f"{'deepcopy KiB':>13} {'clone KiB':>10}"
+    )
+    for example in EXAMPLES:
+        processed = load_example(example)
+        processed.process()
+        for spec in (load_example(example), processed):
+            t_deep, m_deep = _measure(legacy_deepcopy, spec, repeats)
+            t_clone, m_clone = _measure(lambda s: s.clone(), spec, repeats)
+            name = example + (" (processed)" if spec is processed else "")
+            print(
+                f"{name:<52} {t_deep * 1e3:>8.2f}ms {t_clone * 1e3:>8.2f}ms "
+                f"{t_deep / t_clone:>7.1f}x {m_deep / 1024:>13.0f} "
+                f"{m_clone / 1024:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,42 @@
+"""Measure the memory held by loaded example specifications.
+
+Run from the repository root:
+    python -m benchmarks.bench_memory
+"""
+
+import gc
+import tracemalloc
+
+from benchmarks.examples import EXAMPLES, load_example
+from timeloopfe.common.nodes import Node
+
+
+def _held(keep_init_data: bool):
+    """Return (bytes held, number of nodes) after loading every example."""
+    Node.keep_init_data(keep_init_data)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        specs = [load_example(e) for e in EXAMPLES]
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        Node.keep_init_data(False)
+    n_nodes = sum(len(s.get_nodes_of_type(Node)) + 1 for s in specs)
+    return held, n_nodes
+
+
+def main():
+    compact, n_nodes = _held(False)
+    kept, _ = _held(True)
+    print(f"{n_nodes} nodes in {len(EXAMPLES)} examples")
+    print(f"keep_init_data(True):  {kept / 1024:>8.0f} KiB, {kept / n_nodes:>6.0f} B/node")
+    print(
+        f"keep_init_data(False): {compact / 1024:>8.0f} KiB, "
+        f"{compact / n_nodes:>6.0f} B/node ({100 * (1 - compact / kept):.0f}% less)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare reparse() after a variable change with parsing from scratch.
+
+Run from the repository root:
+    python -m benchmarks.bench_reparse [repeats]
+"""
+
+import sys
+import time
+
+from benchmarks.examples import EXAMPLES, load_example
+
+
+def _changed_variable(spec):
+    for k, v in spec.variables.items():
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return k, v
+    return None, None
+
+
+def main(repeats: int = 20):
+    print(f"{'example':<52} {'full parse':>11} {'reparse':>10} {'evaluated':>10}")
+    for example in EXAMPLES:
+        unparsed = load_example(example)
+        spec = unparsed.clone()
+        spec.parse_expressions(track_changes=True)
+        key, value = _changed_variable(spec)
+        if key is None:
+            continue
+
+        start = time.perf_counter()
+        for i in range(repeats):
+            s = unparsed.clone()
+            s.variables[key] = value + i + 1
+            s.parse_expressions()
+        t_full = (time.perf_counter() - start) / repeats
+
+        evaluated = 0
+        start = time.perf_counter()
+        for i in range(repeats):
+            spec.variables[key] = value + i + 1
+            evaluated += spec.reparse()
+        t_reparse = (time.perf_counter() - start) / repeats
+
+        print(
+            f"{example:<52} {t_full * 1e3:>9.2f}ms {t_reparse * 1e3:>8.3f}ms "
+            f"{evaluated / repeats:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
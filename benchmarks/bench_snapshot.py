@@ -0,0 +1,36 @@
+"""Compare loading example specifications from YAML with loading snapshots.
+
+Run from the repository root:
+    python -m benchmarks.bench_snapshot
+"""
+
+import os
+import tempfile
+import time
+
+from benchmarks.examples import EXAMPLES, load_example
+
+
+def main():
+    print(f"{'example':<52} {'yaml':>10} {'snapshot':>10} {'KiB':>6}")
+    with tempfile.TemporaryDirectory() as d:
+        for example in EXAMPLES:
+            start = time.perf_counter()
+            spec = load_example(example)
+            spec.process()
+            spec.parse_expressions()
+            t_yaml = time.perf_counter() - start
+
+            path = os.path.join(d, "spec.snapshot")
+            spec.save_snapshot(path)
+            start = time.perf_counter()
+            spec.load_snapshot(path)
+            t_snapshot = time.perf_counter() - start
+            print(
+                f"{example:<52} {t_yaml * 1e3:>8.1f}ms {t_snapshot * 1e3:>8.1f}ms "
+                f"{os.path.getsize(path) / 1024:>6.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
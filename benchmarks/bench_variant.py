@@ -0,0 +1,42 @@
+"""Compare the memory used by spec.variant() and Node.clone() for sweeps.
+
+Run from the repository root:
+    python -m benchmarks.bench_variant [variants]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from benchmarks.examples import EXAMPLES, load_example
+
+
+def _measure(f, n: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [f(i) for i in range(n)]
+    elapsed = (time.perf_counter() - start) / n
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return elapsed, current / n
+
+
+def main(n: int = 100):
+    print(
+        f"{'example':<52} {'clone':>10} {'variant':>10} "
+        f"{'clone KiB':>10} {'variant KiB':>12}"
+    )
+    for example in EXAMPLES:
+        spec = load_example(example)
+        path = ("variables", "sweep_value")
+        t_clone, m_clone = _measure(lambda i: spec.clone(), n)
+        t_variant, m_variant = _measure(lambda i: spec.variant({path: i}), n)
+        print(
+            f"{example:<52} {t_clone * 1e3:>8.2f}ms {t_variant * 1e3:>8.3f}ms "
+            f"{m_clone / 1024:>10.0f} {m_variant / 1024:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
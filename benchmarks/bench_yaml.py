@@ -0,0 +1,46 @@
+"""Compare YAML writing and reading with libyaml and with pure Python.
+
+Writes the Timeloop input transpiled from each example, then reads it back.
+
+Run from the repository root:
+    python -m benchmarks.bench_yaml [repeats]
+"""
+
+import sys
+import time
+
+from benchmarks.examples import EXAMPLES, load_example
+from timeloopfe.common import yaml_io
+from timeloopfe.common.version_transpilers import v4_to_v3
+
+
+def _time(f, repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        f()
+    return (time.perf_counter() - start) / repeats
+
+
+def main(repeats: int = 5):
+    if not yaml_io.HAS_LIBYAML:
+        print("PyYAML was built without libyaml. Both columns use pure Python.")
+    print(
+        f"{'example':<52} {'dump py':>9} {'dump C':>9} {'speedup':>8} "
+        f"{'load py':>9} {'load C':>9} {'speedup':>8}"
+    )
+    for example in EXAMPLES:
+        data = v4_to_v3.transpile(load_example(example)._process(), for_model=False)
+        text = yaml_io.dump_yaml_string(data)
+        dump_py = _time(lambda: yaml_io.dump_yaml_string(data, False), repeats)
+        dump_c = _time(lambda: yaml_io.dump_yaml_string(data), repeats)
+        load_py = _time(lambda: yaml_io.load_yaml_string(text, False), repeats)
+        load_c = _time(lambda: yaml_io.load_yaml_string(text), repeats)
+        print(
+            f"{example:<52} {dump_py * 1e3:>7.1f}ms {dump_c * 1e3:>7.1f}ms "
+            f"{dump_py / dump_c:>7.1f}x {load_py * 1e3:>7.1f}ms "
+            f"{load_c * 1e3:>7.1f}ms {load_py / load_c:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,58 @@
+"""Helpers for loading the specifications in arch_spec_examples."""
+
+import glob
+import os
+from typing import List
+
+from timeloopfe.v4.specification import Specification
+
+EXAMPLES_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "arch_spec_examples"
+)
+
+EXAMPLES = [
+    "eyeriss_like",
+    "simba_like",
+    "simple_output_stationary",
+    "simple_pim",
+    "simple_weight_stationary",
+    "sparse_tensor_core_like",
+    "sparseloop/01.2.1-DUDU-dot-product",
+    "sparseloop/02.2.1-spMspM",
+    "sparseloop/03.2.3-conv1d+oc-spatial",
+    "sparseloop/04.2.3-eyeriss-like-onchip-compression",
+]
+
+
+def gather_input_files(example: str, split: bool = False) -> List[str]:
+    """Return the input files for an example, architecture first."""
+    start_dir = os.path.join(EXAMPLES_DIR, example)
+    files = []
+    problem = None
+    for f in os.listdir(start_dir):
+        if "arch" in f:
+            continue
+        elif "problem" in f:
+            problem = os.path.join(start_dir, f)
+        else:
+            files.append(os.path.join(start_dir, f))
+    if problem is None:
+        problem = os.path.join(
+            EXAMPLES_DIR, f"problem_{os.path.basename(start_dir)}.yaml"
+        )
+        if not os.path.exists(problem):
+            problem = os.path.join(EXAMPLES_DIR, "problem.yaml")
+    if os.path.exists(os.path.join(start_dir, "..", "components")):
+        files += glob.glob(os.path.join(start_dir, "..", "components/*.yaml"))
+    files += [
+        os.path.join(EXAMPLES_DIR, "mapper_quick.yaml"),
+        problem,
+        os.path.join(EXAMPLES_DIR, "variables.yaml"),
+    ]
+    arch = "arch_split.yaml" if split else "arch.yaml"
+    return [os.path.join(start_dir, arch)] + files
+
+
+def load_example(example: str, split: bool = False) -> Specification:
+    """Load an example specification."""
+    return Specification.from_yaml_files(*gather_input_files(example, split))
@@ -24,6 +24,8 @@ if __name__ == "__main__":
         install_requires=[
             "accelergy >= 0.4",
             "ruamel.yaml",
+            "pyyaml",
+            "jinja2",
             "psutil",
             "joblib",
             "argparse",
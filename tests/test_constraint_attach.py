@@ -51,3 +51,29 @@ class TestConstraintAttach(unittest.TestCase):
                 )
             else:
                 self.assertSetEqual(set(node.constraints.temporal.factors), set())
+
+    def test_constraint_attaching_not_found(self):
+        spec = self.get_spec()
+        spec.constraints.targets.append(Temporal(target="Missing_A", factors="A=1"))
+        spec.constraints.targets.append(Temporal(target="Peer_Hier_A", factors="A=1"))
+        spec.constraints.targets.append(Temporal(target="Missing_B", factors="B=1"))
+        with self.assertRaises(ValueError) as e:
+            spec.process()
+        self.assertIn("Missing_A", str(e.exception))
+        self.assertIn("Missing_B", str(e.exception))
+        self.assertFalse(spec.constraints.targets)
+        self.assertSetEqual(
+            set(spec.architecture.find("Peer_Hier_A").constraints.temporal.factors),
+            {"A=1"},
+        )
+
+    def test_index_by_unhashable_name(self):
+        spec = self.get_spec()
+        leaf = spec.architecture.find("Peer_Hier_A")
+        # A bad YAML value can leave a list where a name should be
+        dict.__setitem__(spec.architecture.find("Peer_Hier_B"), "name", ["bad"])
+        targets = ConstraintAttacherProcessor.index_by_name(
+            spec.architecture, "constraints"
+        )
+        self.assertIs(targets["Peer_Hier_A"], leaf)
+        self.assertNotIn("Peer_Hier_B", targets)
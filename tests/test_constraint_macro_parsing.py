@@ -4,6 +4,7 @@ from timeloopfe.v4.processors import References2CopiesProcessor
 from timeloopfe.v4.specification import Specification
 from timeloopfe.v4.processors.constraint_macro import (
     ConstraintMacroProcessor,
+    greedy_allocate,
 )
 from timeloopfe.v4 import constraints
 
@@ -67,3 +68,13 @@ class TestConstraintMacroProcessorParsing(unittest.TestCase):
     def test_constraint_list_in_star(self):
         pds = constraints.ProblemDataspaceList(["*"])
         assert "dataspace_A" in pds
+
+    def test_greedy_allocate(self):
+        alloc, util = greedy_allocate({"C": 96, "M": 90, "P": 56}, 1000)
+        self.assertEqual(util, 960)
+        product = {}
+        for k, _, hi in alloc:
+            product[k] = product.get(k, 1) * hi
+        self.assertDictEqual(product, {"C": 96, "M": 10})
+        # Sizes larger than the capacity may take a bound that doesn't divide
+        self.assertEqual(greedy_allocate({"C": 10}, 4), ([("C", 2, 4)], 10 / 3))
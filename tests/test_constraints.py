@@ -42,6 +42,25 @@ class ConstraintTest(unittest.TestCase):
                 constraints.Dataspace(bypass=["A"])
             )
 
+    def test_factors_index_follows_list(self):
+        factors = constraints.Factors(["A=1", "B<=4", "A=1", "B>=2"])
+        self.assertListEqual(list(factors), ["B<=4", "A=1", "B>=2"])
+        self.assertEqual(factors.name2factor("B"), "B<=4")
+        factors.add_eq_factor("C", 3)
+        self.assertTrue(factors.has_factor("C"))
+        factors.remove_factor("B")
+        self.assertListEqual(factors.get_factor_names(), ["A", "C"])
+        factors.append("D=5")
+        factors.pop(0)
+        self.assertListEqual(
+            factors.get_split_factors(), [("C", "=", 3), ("D", "=", 5)]
+        )
+        with self.assertRaises(ValueError):
+            factors.add_eq_factor("C", 4)
+        self.assertListEqual(list(factors), ["C=3", "D=5"])
+        factors.add_eq_factor("C", 4, overwrite=True)
+        self.assertEqual(factors.name2factor("C"), "C=4")
+
 
 if __name__ == "__main__":
     unittest.main()
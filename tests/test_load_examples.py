@@ -4,6 +4,11 @@ import unittest
 import os
 
 
+from accelergy.utils.yaml import to_yaml_string
+from ruamel.yaml import YAML
+
+from timeloopfe.common.version_transpilers import v4_to_v3
+from timeloopfe.common.yaml_io import dump_yaml_string
 from timeloopfe.v4.specification import Specification
 
 PROBLEM_FILE = "problem.yaml"
@@ -17,6 +22,22 @@ ENV_VARS = {
 ENVSTR = " ".join(k + "=" + v for k, v in ENV_VARS.items())
 
 
+def _load_with_tags(text: str):
+    """Load YAML 1.2, as Timeloop does, keeping the tag of each collection."""
+
+    def convert(x):
+        tag = getattr(getattr(x, "tag", None), "value", None) or ""
+        if isinstance(x, dict):
+            return tag, {k: convert(v) for k, v in x.items()}
+        if isinstance(x, list):
+            return tag, [convert(v) for v in x]
+        if isinstance(x, (bool, str)) or x is None:
+            return x
+        return float(x) if isinstance(x, float) else int(x)
+
+    return convert(YAML(typ="rt").load(text))
+
+
 class TestLoadExamples(unittest.TestCase):
     def _gather_input_files(self, start_dir) -> Tuple[List[str], List[str]]:
         files = []
@@ -54,6 +75,23 @@ class TestLoadExamples(unittest.TestCase):
         spec = Specification.from_yaml_files(*f2)
         spec.process()
 
+    def test_yaml_writer_matches_accelergy(self):
+        # Timeloop input used to be written with accelergy's to_yaml_string
+        for start_dir in (
+            "eyeriss_like",
+            "simple_pim",
+            "sparse_tensor_core_like",
+            "sparseloop/02.2.1-spMspM",
+        ):
+            _, files = self._gather_input_files(start_dir)
+            spec = Specification.from_yaml_files(*files)._process()
+            data = v4_to_v3.transpile(spec, for_model=False)
+            expected = _load_with_tags(to_yaml_string(data))
+            for use_libyaml in (True, False):
+                with self.subTest(start_dir=start_dir, use_libyaml=use_libyaml):
+                    text = dump_yaml_string(data, use_libyaml)
+                    self.assertEqual(_load_with_tags(text), expected)
+
     def test_eyriss_like(self):
         self.run_test("eyeriss_like", "")
 
@@ -3,11 +3,14 @@ import unittest
 from timeloopfe.v4.specification import Specification
 from timeloopfe.v4.arch import (
     Component,
+    Container,
     Hierarchical,
     Parallel,
     Pipelined,
 )
 from timeloopfe.v4.processors import References2CopiesProcessor
+from timeloopfe.common.processor import Processor
+from timeloopfe.common.expression_cache import expression_cache
 
 
 class TestMathProcessorParsing(unittest.TestCase):
@@ -36,3 +39,140 @@ class TestMathProcessorParsing(unittest.TestCase):
         arch[0].attributes["test"] = "intentionally invalid math. should fail."
         with self.assertRaises(ArithmeticError):
             spec.parse_expressions()
+
+    def test_math_parsing_scopes(self):
+        spec = self.get_spec(processors=[References2CopiesProcessor])
+        arch = spec.architecture.nodes
+        arch[0].attributes["datawidth"] = "outer * 2"
+        arch[0].attributes["test"] = "datawidth + 1"
+        arch[1].attributes["test"] = "outer"
+        spec.variables["outer"] = 3
+        outer = {"unused": 1}
+        spec.parse_expressions(outer)
+        arch = spec.architecture.nodes
+        self.assertEqual(arch[0].attributes["datawidth"], 6)
+        self.assertEqual(arch[0].attributes["test"], 7)
+        self.assertEqual(arch[1].attributes["test"], 3)
+        self.assertEqual(outer, {"unused": 1})
+
+    def test_expression_cache(self):
+        expression_cache.clear()
+        expression_cache.reset_stats()
+        expression_cache.memoize_results = True
+        try:
+            for known_value in [2, 2, 3]:
+                spec = self.get_spec(processors=[References2CopiesProcessor])
+                for a in spec.architecture.nodes[:2]:
+                    a.attributes["test"] = "known_value * 4 // 2"
+                spec.variables["known_value"] = known_value
+                spec.parse_expressions()
+                for a in spec.architecture.nodes[:2]:
+                    self.assertEqual(a.attributes["test"], known_value * 2)
+            self.assertGreaterEqual(expression_cache.stats["result_hits"], 4)
+
+            # Names outside of the symbol table may be impure functions
+            stats = dict(expression_cache.stats)
+            for _ in range(2):
+                self.assertEqual(expression_cache.evaluate("len('ab')", {}, ""), 2)
+            for k in ("result_hits", "result_misses"):
+                self.assertEqual(expression_cache.stats[k], stats[k])
+        finally:
+            expression_cache.memoize_results = False
+
+    def test_parallel_parsing(self):
+        def setup():
+            spec = self.get_spec(processors=[References2CopiesProcessor])
+            spec.architecture.nodes[0].attributes["test"] = "known_value + 1"
+            spec.mapper["test_key"] = "(len(architecture.nodes))"
+            spec.variables["known_value"] = 2
+            return spec
+
+        spec = setup()
+        deps = spec.expression_dependencies()
+        self.assertIn("architecture", deps["mapper"])
+        self.assertNotIn("problem", deps["architecture"])
+
+        sequential, parallel = setup(), setup()
+        sequential.parse_expressions()
+        parallel.parse_expressions(parallel=True, max_workers=4)
+        self.assertEqual(sequential, parallel)
+        self.assertEqual(parallel.architecture.nodes[0].attributes["test"], 3)
+        self.assertEqual(parallel.mapper["test_key"], len(parallel.architecture.nodes))
+
+    def test_reparse(self):
+        def setup(base):
+            spec = self.get_spec(processors=[References2CopiesProcessor])
+            arch = spec.architecture.nodes
+            spec.variables["base"] = base
+            spec.variables["derived"] = "base * 3"
+            arch[0].attributes["datawidth"] = "derived + 1"
+            arch[0].attributes["test"] = "datawidth * 2"
+            arch[1].attributes["test"] = "base"
+            arch.insert(
+                0, Container({"name": "c", "attributes": {"cattr": "base + 100"}})
+            )
+            arch[2].attributes["from_container"] = "cattr"
+            return spec
+
+        spec = setup(2)
+        spec.parse_expressions(track_changes=True)
+        spec.variables["base"] = 5
+        self.assertGreater(spec.reparse(), 0)
+        expected = setup(5)
+        expected.parse_expressions()
+        self.assertEqual(spec, expected)
+        arch = spec.architecture.nodes
+        self.assertEqual(arch[1].attributes["test"], 32)
+        self.assertEqual(arch[2].attributes["test"], 5)
+        self.assertEqual(arch[2].attributes["from_container"], 105)
+
+        arch[1].attributes["datawidth"] = "base"
+        spec.variables["new_value"] = 1
+        arch[2].attributes["test2"] = "(new_value + derived)"
+        spec.reparse()
+        self.assertEqual(arch[1].attributes["test"], 10)
+        self.assertEqual(arch[2].attributes["test2"], 16)
+        self.assertEqual(spec.reparse(), 0)
+
+    def test_reparse_processed(self):
+        runs = []
+
+        class Double(Processor):
+            reads = writes = ("architecture",)
+
+            def process(self, spec: Specification):
+                runs.append(1)
+                attributes = spec.architecture.nodes[0].attributes
+                attributes["doubled"] = attributes["datawidth"] * 2
+
+        def setup(base):
+            spec = self.get_spec(processors=[References2CopiesProcessor, Double])
+            spec.variables["base"] = base
+            spec.variables["attributes"] = {"inherited": base}
+            arch = spec.architecture.nodes
+            arch[0].attributes["datawidth"] = "base * 3"
+            arch[1].attributes["test"] = "attributes['inherited'] + 1"
+            return spec
+
+        spec = setup(2)
+        spec.parse_expressions(track_changes=True)
+        spec.process()
+        self.assertEqual(len(runs), 1)
+        spec.variables["base"] = 5
+        spec.variables["attributes"] = {"inherited": 5}
+        spec.reparse()
+        self.assertEqual(len(runs), 2)
+        expected = setup(5)
+        expected.parse_expressions()
+        expected.process()
+        self.assertEqual(spec.architecture, expected.architecture)
+        self.assertEqual(spec._processors_run, expected._processors_run)
+        arch = spec.architecture.nodes
+        self.assertEqual(arch[0].attributes["doubled"], 30)
+        self.assertEqual(arch[1].attributes["test"], 6)
+
+        # Processors do not run again if their inputs did not change
+        n_runs = len(runs)
+        spec.variables["unused"] = 1
+        spec.reparse()
+        self.assertEqual(len(runs), n_runs)
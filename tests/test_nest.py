@@ -1,6 +1,7 @@
 import logging
 import os
 import unittest
+from unittest import mock
 from timeloopfe.v4.specification import Specification
 from timeloopfe.v4.arch import (
     Component,
@@ -11,6 +12,7 @@ from timeloopfe.v4.arch import (
 )
 
 from timeloopfe.common import ParseError
+from timeloopfe.common.nodes import Node
 
 
 class ArchNestTest(unittest.TestCase):
@@ -114,3 +116,44 @@ class ArchNestTest(unittest.TestCase):
     def test_missing_attribute(self):
         with self.assertRaises((KeyError)):
             elem = Component({"name": "test"})
+
+    def test_duplicate_leaf_name(self):
+        def leaf(name):
+            return Component({"name": name, "class": "compute"})
+
+        Hierarchical(nodes=[leaf("A"), Parallel(nodes=[leaf("B"), leaf("C")])])
+        with self.assertRaises((AssertionError, ParseError)):
+            Hierarchical(nodes=[leaf("A"), Parallel(nodes=[leaf("A")])])
+
+    def test_leaf_registry_merged(self):
+        def leaf(name):
+            return Component({"name": name, "class": "compute"})
+
+        searched = []
+        get_nodes_of_type = Node.get_nodes_of_type
+
+        def search(node, node_type):
+            searched.append(node)
+            return get_nodes_of_type(node, node_type)
+
+        with mock.patch.object(Node, "get_nodes_of_type", search):
+            inner = Parallel(nodes=[leaf("B"), leaf("C")])
+            arch = Hierarchical(nodes=[leaf("A"), inner])
+            # Child registries are merged, not searched again
+            self.assertEqual(searched, [])
+            self.assertEqual(set(arch._leaf_registry), {"A", "B", "C"})
+            # The registry of inner was taken over, so reusing it searches it
+            reused = Hierarchical(nodes=[leaf("D"), inner])
+            self.assertEqual(len(searched), 1)
+            self.assertEqual(set(reused._leaf_registry), {"B", "C", "D"})
+
+    def test_name2leaf(self):
+        arch = self.get_spec().architecture
+        for name in ["A", "Hier_B", "Hier_Peer_A", "Hier_Pipe_B"]:
+            self.assertEqual(arch.find(name).name, name)
+        hier = arch.nodes[2]
+        self.assertIs(hier.find("Hier_Hier_A"), arch.find("Hier_Hier_A"))
+        with self.assertRaises(ValueError):
+            hier.find("A")
+        arch.nodes.append(Component({"name": "new", "class": "compute"}))
+        self.assertEqual(arch.find("new").name, "new")
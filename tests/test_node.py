@@ -1,11 +1,16 @@
+import gc
 import os
+import sys
+import tempfile
+import threading
+from unittest import mock
 from pathlib import Path
 import unittest
 from timeloopfe.v4.processors.constraint_attacher import (
     ConstraintAttacherProcessor,
 )
-from timeloopfe.common.processor import Processor
-from timeloopfe.common.nodes import DictNode, ParseError
+from timeloopfe.common.processor import Processor, schedule_processors
+from timeloopfe.common.nodes import DictNode, ListNode, Node, ParseError, Visitor
 from timeloopfe.v4.specification import Specification
 from timeloopfe.v4.arch import (
     Component,
@@ -20,7 +25,10 @@ from timeloopfe.v4.processors import (
     References2CopiesProcessor,
 )
 
-from timeloopfe.common import ParseError, ProcessorError
+from timeloopfe.common import ParseError, ProcessorError, SnapshotError
+from timeloopfe.common import yaml_cache, yaml_io
+from timeloopfe.common.jinja_cache import JinjaCache, _original_compile
+from timeloopfe.common.processor_cache import processor_cache
 
 import timeloopfe.v4 as tl
 
@@ -53,6 +61,18 @@ class NodeTest(unittest.TestCase):
                 {"name": "test", "class": "storage", "extra": "abc"}
             ).check_unrecognized()
 
+    def test_unrecognized_collects_all(self):
+        x = Hierarchical(
+            nodes=[
+                Component({"name": "a", "class": "compute", "extra_a": 1}),
+                Component({"name": "b", "class": "compute", "extra_b": 1}),
+            ]
+        )
+        with self.assertRaises(ParseError) as ctx:
+            x.check_unrecognized()
+        self.assertIn("extra_a", str(ctx.exception))
+        self.assertIn("extra_b", str(ctx.exception))
+
     def test_unrecognized_tag(self):
         class Tagged:
             pass
@@ -175,6 +195,122 @@ class NodeTest(unittest.TestCase):
                 self.assertSetEqual(set(node.constraints.dataspace.bypass), set())
                 self.assertSetEqual(set(node.constraints.dataspace.keep), set())
 
+    def test_schedule_processors(self):
+        class Noop(Processor):
+            def process(self, spec):
+                super().process(spec)
+
+        class ReadsProblem(Noop):
+            reads = writes = ("problem",)
+
+        # Builds nodes, which needs the global spec in the worker thread
+        class ReadsVariables(Noop):
+            reads = writes = ("variables",)
+
+            def process(self, spec):
+                super().process(spec)
+                spec[self.writes[0]]["scheduled"] = Temporal(target="Hier_A")
+
+        class ReadsGlobals(ReadsVariables):
+            reads = writes = ("globals",)
+
+        class RequiresProblem(Noop):
+            requires = (ReadsProblem,)
+
+        order = [RequiresProblem, ReadsVariables, ReadsProblem]
+        self.assertEqual(schedule_processors(order), [[1, 2], [0]])
+        self.assertEqual(schedule_processors(order[1:]), [[0, 1]])
+        with self.assertRaises(ProcessorError):
+            schedule_processors([RequiresProblem])
+        self.assertEqual(
+            schedule_processors([RequiresProblem], [ReadsProblem()]), [[0]]
+        )
+
+        spec = self.get_spec(processors=[References2CopiesProcessor])
+        self.assertEqual(schedule_processors([ReadsGlobals, ReadsVariables]), [[0, 1]])
+        spec.process([ReadsGlobals, ReadsVariables], parallel=True)
+        self.assertEqual(spec._processors_run[-2:], [ReadsGlobals, ReadsVariables])
+        self.assertIsInstance(spec.variables["scheduled"], Temporal)
+        self.assertIsInstance(spec.globals["scheduled"], Temporal)
+
+    def test_skip_unchanged_processors(self):
+        spec = self.get_spec(
+            "multi_list_constraints.yaml",
+            processors=[References2CopiesProcessor, ConstraintAttacherProcessor],
+        )
+        spec.process()
+        with mock.patch.object(
+            ConstraintAttacherProcessor, "process", autospec=True
+        ) as process:
+            spec.process()
+            process.assert_called_once()
+            spec.process(skip_unchanged=True)
+            process.assert_called_once()
+            spec.constraints.targets.append(Temporal(target="Hier_A"))
+            spec.process(skip_unchanged=True)
+            self.assertEqual(process.call_count, 2)
+
+        class Configured(ConstraintAttacherProcessor):
+            def __init__(self, option=None, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.option = option
+
+        spec.process([Configured(1)], skip_unchanged=True)
+        with mock.patch.object(Configured, "process", autospec=True) as process:
+            spec.process([Configured(1)], skip_unchanged=True)
+            process.assert_not_called()
+            spec.process([Configured(2)], skip_unchanged=True)
+            process.assert_called_once()
+
+    def test_processor_cache(self):
+        def get_spec():
+            spec = self.get_spec(
+                "multi_list_constraints.yaml",
+                processors=[References2CopiesProcessor, ConstraintAttacherProcessor],
+            )
+            spec.constraints.targets.append(Temporal(target="Hier_A", factors=["A=1"]))
+            return spec
+
+        processor_cache.clear()
+        processor_cache.reset_stats()
+        processor_cache.enabled = True
+        try:
+            expected = get_spec()
+            expected.process()
+            spec = get_spec()
+            spec.mapper["timeout"] = 5
+            with mock.patch.object(
+                ConstraintAttacherProcessor, "process", autospec=True
+            ) as process:
+                spec.process()
+                process.assert_not_called()
+
+            class Configured(ConstraintAttacherProcessor):
+                def __init__(self, option=None, *args, **kwargs):
+                    super().__init__(*args, **kwargs)
+                    self.option = option
+
+            self.assertNotEqual(
+                processor_cache.key(spec, Configured(1)),
+                processor_cache.key(spec, Configured(2)),
+            )
+            self.assertIsNone(processor_cache.key(spec, Configured(object())))
+        finally:
+            processor_cache.enabled = False
+            processor_cache.clear()
+        self.assertEqual(
+            processor_cache.stats["ConstraintAttacherProcessor"],
+            {"hits": 1, "misses": 1},
+        )
+        self.assertEqual(spec.architecture, expected.architecture)
+        self.assertIs(spec.architecture, spec["architecture"])
+        self.assertIs(spec.architecture.spec, spec)
+        self.assertIs(spec.architecture.parent_node, spec)
+        leaf = spec.architecture.find("Hier_A")
+        self.assertIs(leaf.spec, spec)
+        self.assertSetEqual(set(leaf.constraints.temporal.factors), {"A=1"})
+        self.assertFalse(spec.constraints.targets)
+
     def test_repeated_node_init(self):
         t1 = Temporal(factors="A=1 B=2 C=3")
         t2 = Temporal(factors=t1.factors)
@@ -211,6 +347,387 @@ class NodeTest(unittest.TestCase):
             del x["metadata_block_size"]
             x.check_unrecognized()
 
+    def test_type_specifier_cache(self):
+        class CacheTest(DictNode):
+            pass
+
+        CacheTest.declare_attrs()
+        CacheTest.add_attr("a", int, 1)
+        Node.reset_specifier_cache_stats()
+        x, y = CacheTest(), CacheTest()
+        self.assertIs(
+            x._get_type_specifiers(x.spec), y._get_type_specifiers(y.spec)
+        )
+        stats = Node.get_specifier_cache_stats()
+        self.assertGreater(stats["hits"], 0)
+
+        CacheTest.add_attr("b", int, 2)
+        new_stats = Node.get_specifier_cache_stats()
+        self.assertGreater(new_stats["version"], stats["version"])
+        self.assertEqual(CacheTest().b, 2)
+
+        # Threads looking up the same entry build it once
+        CacheTest.add_attr("c", int, 3)
+        Node.reset_specifier_cache_stats()
+        found = []
+
+        def look_up():
+            for _ in range(1000):
+                found.append(CacheTest._get_specifier_cache_entry(None))
+
+        threads = [threading.Thread(target=look_up) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(Node.get_specifier_cache_stats()["misses"], 1)
+        self.assertTrue(all(entry is found[0] for entry in found))
+
+    def test_clone(self):
+        spec = self.get_spec()
+        spec2 = spec.clone()
+        self.assertEqual(spec, spec2)
+        self.assertIsNot(spec.architecture, spec2.architecture)
+        cloned = [spec2] + spec2.get_nodes_of_type(Node)
+        cloned_ids = {id(n) for n in cloned}
+        for n in cloned:
+            if n.parent_node is not None:
+                self.assertIn(id(n.parent_node), cloned_ids)
+        spec2.variables["clone_test"] = 1
+        self.assertNotIn("clone_test", spec.variables)
+        spec2.process()
+
+    def test_variant(self):
+        spec = self.get_spec()
+        variant = spec.variant(
+            {
+                "architecture.nodes[0].attributes.datawidth": 8,
+                ("variables", "technology"): 5,
+            }
+        )
+        self.assertEqual(variant.architecture.nodes[0].attributes.datawidth, 8)
+        self.assertEqual(spec.architecture.nodes[0].attributes.datawidth, 1)
+        self.assertEqual(variant.variables.technology, 5)
+        self.assertEqual(spec.variables.technology, -1)
+        self.assertIs(variant.architecture.nodes[1], spec.architecture.nodes[1])
+        self.assertIs(variant.problem, spec.problem)
+        self.assertIs(
+            variant.architecture.nodes[0].attributes.parent_node,
+            variant.architecture.nodes[0],
+        )
+
+        cloned = variant.clone()
+        nodes = cloned.get_nodes_of_type(Node)
+        node_ids = {id(n) for n in nodes} | {id(cloned)}
+        for n in nodes:
+            self.assertIs(n.spec, cloned)
+            self.assertIn(id(n.parent_node), node_ids)
+
+        # Only the keys the processors write are copied
+        variant.process(ConstraintAttacherProcessor)
+        self.assertIsNot(variant.architecture.nodes[1], spec.architecture.nodes[1])
+        self.assertIs(variant.problem, spec.problem)
+        self.assertEqual(spec.architecture.nodes[0].attributes.datawidth, 1)
+        for n in variant.architecture.get_nodes_of_type(Node):
+            self.assertIs(n.spec, variant)
+
+        variant.materialize()
+        for n in variant.get_nodes_of_type(Node):
+            self.assertIs(n.spec, variant)
+
+    def test_variant_parse(self):
+        spec = self.get_spec()
+        variant = spec.variant({("variables", "technology"): "5"})
+        self.assertIsInstance(variant.variables, Node)
+        with self.assertRaises(ParseError):
+            spec.variant({"variables": [1]})
+
+        expected = spec.clone()
+        expected.variables["technology"] = "5"
+        expected.parse_expressions()
+        variant.parse_expressions()
+        self.assertEqual(variant, expected)
+        self.assertEqual(variant.variables.technology, 5)
+        self.assertEqual(spec.variables.technology, -1)
+        self.assertFalse(spec._parsed_expressions)
+        # Nodes the parse left unchanged are shared again
+        self.assertIs(variant.mapper, spec.mapper)
+        variant.process()
+        self.assertEqual(variant, expected)
+
+    def test_fingerprint(self):
+        spec, spec2 = self.get_spec(), self.get_spec()
+        self.assertEqual(spec.fingerprint(), spec2.fingerprint())
+        self.assertEqual(spec.fingerprint(), spec.clone().fingerprint())
+        before = spec.fingerprint()
+        arch = spec.architecture.fingerprint()
+        problem = spec.problem.fingerprint()
+
+        attributes = spec.architecture.nodes[0].attributes
+        attributes.datawidth = 2
+        self.assertNotEqual(spec.fingerprint(), before)
+        self.assertNotEqual(spec.architecture.fingerprint(), arch)
+        self.assertEqual(spec.problem.fingerprint(), problem)
+        attributes.datawidth = 1
+        self.assertEqual(spec.fingerprint(), before)
+
+        spec.architecture.nodes.reverse()
+        self.assertNotEqual(spec.fingerprint(), before)
+
+        a = Hierarchical(nodes=[Component({"name": "a", "class": "compute"})])
+        b = Hierarchical(nodes=[Component({"name": "a", "class": "compute"})])
+        self.assertEqual(a.fingerprint(), b.fingerprint())
+        b.nodes[0].tag = "!Other"
+        b.nodes[0]._clear_fingerprint()
+        self.assertNotEqual(a.fingerprint(), b.fingerprint())
+
+    def test_fingerprint_assigned_subtree(self):
+        spec = self.get_spec()
+        leaf = spec.architecture.nodes[0]
+        leaf["attributes"] = type(leaf.attributes)(dict(leaf.attributes))
+        self.assertIs(leaf.attributes.parent_node, leaf)
+        before = spec.fingerprint()
+        leaf.attributes["datawidth"] = 128
+        self.assertNotEqual(spec.fingerprint(), before)
+
+        # Clones compute their own fingerprints
+        spec.fingerprint()
+        clone = spec.clone()
+        clone.architecture.nodes[0].attributes["datawidth"] = 1
+        self.assertNotEqual(clone.fingerprint(), spec.fingerprint())
+
+        # Parents above a node without a fingerprint are cleared too
+        before = spec.fingerprint()
+        spec.architecture.nodes.__dict__.pop("_fingerprint")
+        leaf.attributes["datawidth"] = 1
+        self.assertNotEqual(spec.fingerprint(), before)
+
+    def test_snapshot(self):
+        spec = self.get_spec()
+        spec.process()
+        spec.parse_expressions()
+        fingerprint = spec.fingerprint()
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "spec.snapshot")
+            spec.save_snapshot(path)
+            loaded = Specification.load_snapshot(path)
+            self.assertEqual(spec, loaded)
+            # Cached fingerprints are not saved
+            for n in [loaded] + loaded.get_nodes_of_type(Node):
+                self.assertNotIn("_fingerprint", n.__dict__)
+            self.assertEqual(fingerprint, loaded.fingerprint())
+            for n in loaded.get_nodes_of_type(Node):
+                self.assertIs(n.spec, loaded)
+            self.assertIs(loaded.architecture.parent_node, loaded)
+
+            # Classes are checked before anything is unpickled
+            with mock.patch(
+                "timeloopfe.common.snapshot._class_schema", return_value=""
+            ), mock.patch("timeloopfe.common.snapshot.pickle") as pickle:
+                with self.assertRaises(SnapshotError):
+                    Specification.load_snapshot(path)
+                pickle.Unpickler.assert_not_called()
+                pickle.load.assert_not_called()
+
+            with open(path, "rb") as f:
+                data = f.read()
+            with open(path, "wb") as f:
+                f.write(data[:-20])
+            with self.assertRaises(SnapshotError):
+                Specification.load_snapshot(path)
+            with open(path, "r+b") as f:
+                f.seek(8)
+                f.write(b"\xff\xff")
+            with self.assertRaises(SnapshotError):
+                Specification.load_snapshot(path)
+
+    def test_yaml_cache(self):
+        with tempfile.TemporaryDirectory() as d:
+            spec = self.get_spec(cache_dir=d)
+            self.assertTrue(os.listdir(d))
+            self.assertEqual(spec, self.get_spec(cache_dir=d))
+            self.assertEqual(spec, self.get_spec())
+
+            # Files that include others are not cached
+            cache = yaml_cache.YamlCache(d)
+            for text, cached in (
+                ("a: 1", True),
+                ("a: !include other.yaml", False),
+                ("{% include 'other.yaml' %}", False),
+            ):
+                with open(os.path.join(d, "x.yaml"), "w") as f:
+                    f.write(text)
+                key = cache._key(os.path.join(d, "x.yaml"), {})
+                self.assertEqual(key is not None, cached)
+
+    def test_yaml_io(self):
+        x = Hierarchical(nodes=[Component({"name": "a", "class": "compute"})])
+        x.nodes[0].tag = "!Component"
+        for use_libyaml in (True, False):
+            text = yaml_io.dump_yaml_string(x, use_libyaml)
+            loaded = yaml_io.load_yaml_string(text, use_libyaml)
+            self.assertEqual(loaded["nodes"][0].tag, "!Component")
+            self.assertEqual(loaded["nodes"][0]["name"], "a")
+            self.assertEqual(
+                yaml_io.load_yaml_string(yaml_io.dump_yaml_string(loaded)), loaded
+            )
+
+    def test_parallel_yaml_load(self):
+        files = ["multi_list_constraints.yaml"]
+        spec = self.get_spec(*files)
+        self.assertEqual(spec, self.get_spec(*files, parallel=True))
+        self.assertEqual(
+            spec, self.get_spec(*files, parallel=True, use_processes=True)
+        )
+
+    def test_resolve_yaml_files(self):
+        with tempfile.TemporaryDirectory() as d:
+            for name in ("a.yaml", "b.yaml"):
+                with open(os.path.join(d, name), "w") as f:
+                    f.write("{}")
+            os.symlink(os.path.join(d, "a.yaml"), os.path.join(d, "link.yaml"))
+            patterns = [os.path.join(d, "b.yaml"), os.path.join(d, "*.yaml")]
+            resolved = yaml_cache.resolve_yaml_files(patterns)
+            self.assertEqual(len(resolved), 2)
+            self.assertEqual(resolved[0], patterns[0])
+            self.assertTrue(os.path.samefile(resolved[1], os.path.join(d, "a.yaml")))
+
+            manifest = os.path.join(d, "manifest.json")
+            resolved = yaml_cache.resolve_yaml_files(patterns, manifest)
+            with mock.patch.object(yaml_cache.glob, "glob") as g:
+                self.assertEqual(
+                    yaml_cache.resolve_yaml_files(patterns, manifest), resolved
+                )
+                g.assert_not_called()
+            with open(os.path.join(d, "c.yaml"), "w") as f:
+                f.write("{}")
+            os.utime(d, ns=(0, 0))
+            self.assertIn(
+                os.path.join(d, "c.yaml"),
+                yaml_cache.resolve_yaml_files(patterns, manifest),
+            )
+            with self.assertRaises(FileNotFoundError):
+                yaml_cache.resolve_yaml_files([os.path.join(d, "*.jinja")])
+
+    def test_jinja_cache(self):
+        import jinja2
+
+        source = "{% for i in range(n) %}{{ i }}{% endfor %}"
+        with tempfile.TemporaryDirectory() as d:
+            cache = JinjaCache()
+            with cache.installed(d):
+                self.assertEqual(jinja2.Template(source).render(n=3), "012")
+                self.assertEqual(jinja2.Template(source).render(n=2), "01")
+                self.assertEqual(jinja2.Template("{{ n }}").render(n=2), "2")
+            self.assertEqual((cache.stats["misses"], cache.stats["hits"]), (2, 1))
+
+            # Compiles in other threads and after the context are not cached
+            with cache.installed():
+                thread = threading.Thread(
+                    target=lambda: jinja2.Template("{{ m }}").render(m=1)
+                )
+                thread.start()
+                thread.join()
+            jinja2.Template("{{ k }}").render(k=1)
+            self.assertEqual(cache.stats["misses"], 2)
+            with mock.patch(
+                "timeloopfe.common.jinja_cache._original_compile",
+                side_effect=_original_compile,
+            ) as original:
+                jinja2.Template("{{ j }}").render(j=1)
+            original.assert_called_once()
+
+            other = JinjaCache(bytecode_dir=d)
+            with other.installed():
+                self.assertEqual(jinja2.Template(source).render(n=4), "0123")
+            self.assertEqual((other.stats["misses"], other.stats["disk_hits"]), (0, 1))
+
+            spec = self.get_spec(jinja_bytecode_dir=d)
+            self.assertEqual(spec, self.get_spec())
+
+    def test_type_index(self):
+        spec = self.get_spec()
+        spec.enable_type_index()
+
+        def check():
+            for t in (Leaf, Component, DictNode, (Storage, Temporal)):
+                for root in (spec, spec.architecture):
+                    self.assertEqual(
+                        [id(n) for n in root.get_nodes_of_type(t)],
+                        [id(n) for n in root._search_nodes_of_type(t)],
+                    )
+
+        check()
+        spec.architecture.nodes.append(
+            Component({"name": "indexed", "class": "storage"})
+        )
+        check()
+        spec.architecture.nodes.pop(0)
+        check()
+        spec.architecture.nodes.reverse()
+        check()
+        # Insertions in the middle keep document order without a renumbering
+        for i in range(300):
+            spec.architecture.nodes.insert(
+                1, Component({"name": f"inserted_{i}", "class": "storage"})
+            )
+        self.assertFalse(spec._type_index._stale)
+        check()
+        spec.process()
+        check()
+        spec.enable_type_index(False)
+        self.assertIsNone(spec.architecture._type_index)
+
+    def test_keep_init_data(self):
+        t1 = Temporal(factors="A=1 B=2 C=3")
+        self.assertIsNone(t1._init_args)
+        self.assertIs(t1.logger, Temporal.logger)
+        Node.keep_init_data(True)
+        try:
+            t2 = Temporal(factors="A=1 B=2 C=3")
+        finally:
+            Node.keep_init_data(False)
+        self.assertIsNotNone(t2._init_args)
+        self.assertEqual(t2.factors.from_data, ["A=1", "B=2", "C=3"])
+        self.assertEqual(t1, t2)
+
+        # Parsing does not depend on init data keeping ids from being reused
+        def parse():
+            spec = self.get_spec(processors=[References2CopiesProcessor])
+            spec.architecture.nodes[0].attributes["test"] = "datawidth + 1"
+            gc.collect()
+            spec.parse_expressions()
+            return spec
+
+        Node.keep_init_data(True)
+        try:
+            expected = parse()
+        finally:
+            Node.keep_init_data(False)
+        self.assertEqual(parse(), expected)
+
+    def test_traverse(self):
+        depth = 5 * sys.getrecursionlimit()
+        deep = ListNode()
+        for _ in range(depth):
+            deep = ListNode([deep])
+        self.assertEqual(len(deep.get_nodes_of_type(ListNode)), depth)
+
+        spec = self.get_spec()
+        pre, post, pruned = [], [], []
+        spec.traverse(
+            Visitor(pre=pre.append, post=post.append),
+            Visitor(
+                pre=pruned.append, prune=lambda n: isinstance(n, Hierarchical)
+            ),
+        )
+        self.assertEqual(len(pre), len(spec.get_nodes_of_type(Node)) + 1)
+        self.assertIs(pre[0], spec)
+        self.assertIs(post[-1], spec)
+        self.assertIn(spec.architecture, pruned)
+        self.assertNotIn(spec.architecture.nodes, pruned)
+        self.assertLess(len(pruned), len(pre))
+
     def get_property_table(self):
         tl.doc.get_property_table(Specification)
         tl.doc.get_property_table(Component)
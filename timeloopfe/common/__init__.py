@@ -1,4 +1,5 @@
 from .doc import *
 from .nodes import *
 from .processor import ProcessorError, Processor
+from .snapshot import SnapshotError
 from .backend_calls import *
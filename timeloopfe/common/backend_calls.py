@@ -7,9 +7,9 @@ import subprocess
 import sys
 from typing import Any, List, Optional, Dict, Tuple, Union
 import logging
-from accelergy.utils.yaml import to_yaml_string
 import psutil
 from .base_specification import BaseSpecification
+from .yaml_io import dump_yaml_string
 
 DELAYED_IMPORT_DONE = False
 
@@ -48,10 +48,10 @@ def _specification_to_yaml_string(
         )
 
     if isinstance(specification, v3spec.Specification):
-        input_content = to_yaml_string(specification)
+        input_content = dump_yaml_string(specification)
     elif isinstance(specification, v4spec.Specification):
         input_content = v4_to_v3.transpile(specification, for_model=for_model)
-        input_content = to_yaml_string(input_content)
+        input_content = dump_yaml_string(input_content)
     else:
         raise TypeError(f"Can not call Timeloop with {type(specification)}")
 
@@ -1,14 +1,127 @@
-import copy
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import re
 import time
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+from typing import Union
 from .nodes import DictNode, ListNode, Node, TypeSpecifier, CombinableListNode
+from .nodes import ParseError, SymbolTable, TypeIndex, Visitor
+from .nodes import _invalidate_specifier_cache, _raise_errors
+from .nodes import _CLONE_RELINKED_ATTRS, _CLONE_SKIPPED_ATTRS, _NodeCloner
+from .nodes import _SUBTREE_CACHE_ATTRS, _fingerprint_token
 from .processor import Processor, ProcessorError, References2CopiesProcessor
+from .processor import processor_key, schedule_processors
+from .processor_cache import processor_cache
+from .expression_cache import expression_cache
+from .expression_log import ExpressionLog
+from . import snapshot
 
 
 def class2obj(x):
     return x() if isinstance(x, type) else x
 
 
+# Expressions referencing these names may read any part of the specification
+_SPEC_WIDE_NAMES = frozenset({"spec", "parent_node"})
+
+
+def _referenced_names(x: Any) -> Set[str]:
+    """Return the names referenced by any string in x or its subnodes."""
+    names, stack = set(), [x]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, Node):
+            stack.extend(v for _, v in x.items())
+        elif isinstance(x, str):
+            names.update(expression_cache.names_in(x))
+    return names
+
+
+_PATH_PART = re.compile(r"\[(-?\d+)\]|([^.\[\]]+)")
+
+
+def _split_path(path: Union[str, Sequence[Union[str, int]]]) -> tuple:
+    """Split "a.b[2].c" into ("a", "b", 2, "c"). Sequences are returned as
+    a tuple."""
+    if not isinstance(path, str):
+        return tuple(path)
+    return tuple(
+        int(index) if index else key for index, key in _PATH_PART.findall(path)
+    )
+
+
+def _shallow_copy(node: Node, parent: Optional[Node], spec: Node) -> Node:
+    """Copy a node without copying its subnodes."""
+    new = node.__class__.__new__(node.__class__)
+    state = new.__dict__
+    for k, v in node.__dict__.items():
+        if k not in _CLONE_SKIPPED_ATTRS and k not in _SUBTREE_CACHE_ATTRS:
+            state[k] = v
+    state["parent_node"] = parent
+    state["spec"] = spec
+    if isinstance(node, dict):
+        dict.update(new, dict.items(node))
+    else:
+        list.extend(new, list.__iter__(node))
+    return new
+
+
+def _set_checked(node: Node, key: Union[str, int], value: Any):
+    """Set node[key] to value, cast and type checked as a parsed value is."""
+    entry = node._get_specifier_cache_entry(node.spec)
+    if isinstance(node, DictNode):
+        check = entry.checker_for_key(key)
+    else:
+        check = entry.checker_for_elem(value)
+    tag = Node._get_tag(value)
+    if check is not None:
+        value = check.cast_check_type(value, node, key)
+    if isinstance(value, Node):
+        value.tag = tag
+    node[key] = value
+
+
+def _node_state(node: Node) -> Dict[str, Any]:
+    return {
+        k: v
+        for k, v in node.__dict__.items()
+        if k not in _CLONE_SKIPPED_ATTRS
+        and k not in _CLONE_RELINKED_ATTRS
+        and k not in _SUBTREE_CACHE_ATTRS
+    }
+
+
+def _unchanged(orig: Node, new: Node, restored: Dict[int, Node]) -> bool:
+    """Whether new, a copy of orig, still holds the same values. Copies that
+    were put back by their originals count as the originals."""
+    if type(orig) is not type(new) or len(orig) != len(new):
+        return False
+    if isinstance(orig, dict):
+        if any(
+            k0 != k1 or v0 is not v1
+            for (k0, v0), (k1, v1) in zip(dict.items(orig), dict.items(new))
+        ):
+            return False
+    elif any(v0 is not v1 for v0, v1 in zip(list.__iter__(orig), list.__iter__(new))):
+        return False
+    state0, state1 = _node_state(orig), _node_state(new)
+    if state0.keys() != state1.keys():
+        return False
+    for k, v1 in state1.items():
+        v0, v1 = state0[k], restored.get(id(v1), v1)
+        if v0 is not v1 and (isinstance(v0, Node) or v0 != v1):
+            return False
+    return True
+
+
+class ProcessorListHolder(ListNode):
+    """A list of processors. Processor classes are instantiated."""
+
+    @classmethod
+    def declare_attrs(cls, *args, **kwargs):
+        super().declare_attrs(*args, **kwargs)
+        super().add_attr("", callfunc=class2obj)
+
+
 class BaseSpecification(DictNode):
     """
     Base class for specifications in the Timeloop framework.
@@ -23,6 +136,16 @@ class BaseSpecification(DictNode):
     @classmethod
     def declare_attrs(cls, *args, **kwargs): ...
 class BaseSpecification(DictNode):
+    _expression_log: Optional[ExpressionLog] = None
+    # The specifications a variant shares nodes with, and the top-level keys
+    # that may still hold shared nodes. See variant().
+    _variant_of: Tuple["BaseSpecification", ...] = ()
+    _shared_keys: FrozenSet[str] = frozenset()
+    # Fingerprints of the keys each processor reads and writes, taken after
+    # it last ran, by processor_key(). Replaced rather than modified, as
+    # variants share it.
+    _processor_inputs: Dict[Tuple, Dict[str, str]] = {}
+
     @classmethod
     def declare_attrs(cls, *args, **kwargs):
         super().declare_attrs(*args, **kwargs)
@@ -33,36 +156,249 @@ class BaseSpecification(DictNode):
         super().add_attr("_processors_run", ListNode, [])
         super().add_attr("_processors_run_pre_parse", ListNode, [])
 
-    def _claim_nodes(self, *args, **kwargs):
+    def _claim_visitor(self) -> Visitor:
+        """Return a visitor that sets the spec of each node to this one."""
+
         def claim_node(n: Node):
-            if isinstance(n, Node):
-                n.spec = self
+            n.spec = self
 
-        self.recursive_apply(claim_node)
+        return Visitor(pre=claim_node)
+
+    def _claim_nodes(self, *visitors: Visitor):
+        """Set the spec of every node to this specification. Other visitors
+        given are run in the same walk."""
+        self.traverse(self._claim_visitor(), *visitors)
+
+    def variant(
+        self, overrides: Dict[Union[str, Tuple[Union[str, int], ...]], Any]
+    ) -> "BaseSpecification":
+        """
+        Create a copy of this specification with some values changed. Only
+        the nodes on the path to each changed value are copied. All other
+        nodes are shared with this specification, so memory grows with the
+        number of overrides rather than the size of the specification.
+
+        Shared nodes must not be modified. process() copies the top-level
+        keys that the processors it runs write, and every key if one of them
+        does not declare writes. parse_expressions() copies the nodes it
+        parses and, unless it tracks changes, puts back the originals of
+        those it left unchanged. enable_type_index() and clone() copy every
+        shared node. Shared nodes keep their parent_node and spec, which
+        point into this specification.
+
+        Overrides are cast and type checked as parsed values are. Expressions
+        in them are parsed by parse_expressions().
+
+        Args:
+            overrides (Dict[Union[str, Tuple[Union[str, int], ...]], Any]):
+                New values by path. A path is a string like
+                "architecture.nodes[0].attributes.depth" or a tuple of keys
+                and list indices.
+
+        Returns:
+            BaseSpecification: The variant.
+        """
+        root = _shallow_copy(self, None, None)
+        object.__setattr__(root, "spec", root)
+        object.__setattr__(root, "_variant_of", self._variant_of + (self,))
+        object.__setattr__(root, "_shared_keys", frozenset(root.keys()))
+        owned = {id(root)}
+        prev_global_spec = Node.get_global_spec()
+        try:
+            Node.set_global_spec(root)
+            for path, value in overrides.items():
+                keys = _split_path(path)
+                if not keys:
+                    raise KeyError(f"Empty path {path!r} in variant overrides.")
+                node = root
+                for i, k in enumerate(keys[:-1]):
+                    child = node[k]
+                    if not isinstance(child, Node):
+                        raise TypeError(
+                            f"Can not index into "
+                            f"{'.'.join(map(str, keys[:i + 1]))} of type "
+                            f"{type(child)} to set {path!r}."
+                        )
+                    if id(child) not in owned:
+                        child = _shallow_copy(child, node, root)
+                        owned.add(id(child))
+                        if isinstance(node, dict):
+                            dict.__setitem__(node, k, child)
+                        else:
+                            list.__setitem__(node, k, child)
+                    node = child
+                _set_checked(node, keys[-1], value)
+        finally:
+            Node.set_global_spec(prev_global_spec)
+        return root
+
+    def _copy_shared(
+        self, keys: Sequence[str], memo: Optional[Dict[int, Any]] = None
+    ) -> Dict[str, List[Tuple[Node, Node]]]:
+        """Copy the nodes under the given top-level keys of a variant.
+        Returns the (original, copy) pairs of the nodes copied for each key,
+        parents before their subnodes."""
+        memo = {} if memo is None else memo
+        memo[id(self)] = self
+        for base in self._variant_of:
+            memo[id(base)] = self
+        copied = {}
+        for k in keys:
+            cloner = _NodeCloner(memo)
+            dict.__setitem__(self, k, cloner.clone(dict.__getitem__(self, k)))
+            copied[k] = [(orig, new) for orig, new, _ in cloner.to_link]
+        self._shared_keys = self._shared_keys.difference(keys)
+        return copied
+
+    def _reshare(self, copied: Dict[str, List[Tuple[Node, Node]]], parsed_ids: set):
+        """Put back the original of each node copied by _copy_shared() that
+        holds the same values as its original."""
+        restored: Dict[int, Node] = {}
+        shared = set()
+        for k, pairs in copied.items():
+            for orig, new in reversed(pairs):
+                for i, v in list(new.items()):
+                    if id(v) in restored:
+                        if isinstance(new, dict):
+                            dict.__setitem__(new, i, restored[id(v)])
+                        else:
+                            list.__setitem__(new, i, restored[id(v)])
+                if _unchanged(orig, new, restored):
+                    restored[id(new)] = orig
+                    parsed_ids.discard(id(new))
+                    parsed_ids.add(id(orig))
+                    shared.add(k)
+            v = dict.get(self, k, None)
+            if id(v) in restored:
+                dict.__setitem__(self, k, restored[id(v)])
+        self._shared_keys = self._shared_keys | shared
+
+    def materialize(
+        self,
+        keys: Optional[Sequence[str]] = None,
+        memo: Optional[Dict[int, Any]] = None,
+    ):
+        """
+        Copy the nodes a variant shares with the specifications it was made
+        from. Once no nodes are shared, the variant is independent of them.
+        Does nothing if this specification is not a variant.
+
+        Args:
+            keys (Optional[Sequence[str]]): The top-level keys to copy.
+                Defaults to None, copying every key.
+            memo (Optional[Dict[int, Any]]): A copy.deepcopy-style memo.
+        """
+        if not self._variant_of:
+            return
+        shared = self._shared_keys
+        if keys is not None:
+            shared = shared.intersection(keys)
+        memo = {} if memo is None else memo
+        self._copy_shared([k for k in self if k in shared], memo)
+        if self._shared_keys:
+            return
+        state = {
+            k: v
+            for k, v in self.__dict__.items()
+            if k not in _CLONE_SKIPPED_ATTRS and k not in _CLONE_RELINKED_ATTRS
+        }
+        self.__dict__.update(_NodeCloner(memo).clone(state))
+        del self.__dict__["_variant_of"]
+        del self.__dict__["_shared_keys"]
+
+    def clone(self, memo: Optional[Dict[int, Any]] = None) -> "BaseSpecification":
+        """See Node.clone(). Clones of variants share no nodes."""
+        if not self._variant_of:
+            return super().clone(memo)
+        rval = self.variant({})
+        if memo is not None:
+            memo[id(self)] = rval
+        rval.materialize(memo)
+        return rval
+
+    def save_snapshot(self, path: str):
+        """
+        Save this specification to a binary snapshot file, which
+        load_snapshot() reads back without parsing or processing. The type
+        index and change tracking are not saved.
+
+        Args:
+            path (str): The file to write.
+        """
+        with open(path, "wb") as f:
+            snapshot.dump(self, f, same_as_root=self._variant_of)
+
+    @classmethod
+    def load_snapshot(cls, path: str) -> "BaseSpecification":
+        """
+        Load a specification saved by save_snapshot(). Nodes are restored as
+        they were saved; they are not parsed and processors are not run. The
+        snapshot is rejected if it was made by a different snapshot version
+        or if the attributes declared by any of its node classes changed.
+
+        Values in the snapshot are unpickled, which can run arbitrary code.
+        Only load snapshots from trusted sources.
+
+        Args:
+            path (str): The file to read.
+
+        Returns:
+            BaseSpecification: The specification.
+        """
+        with open(path, "rb") as f:
+            spec = snapshot.load(f)
+        if not isinstance(spec, cls):
+            raise snapshot.SnapshotError(
+                f"Snapshot {path} holds a {spec.__class__.__name__}, not a "
+                f"{cls.__name__}."
+            )
+        spec._processor_attributes = {}
+        _invalidate_specifier_cache()
+        Node.set_global_spec(spec)
+        spec._processors_declare_attrs()
+        return spec
+
+    def enable_type_index(self, enable: bool = True):
+        """
+        Enable or disable the type index for this specification.
+
+        While enabled, get_nodes_of_type() looks up nodes in an index that
+        is kept up to date as nodes are added and removed, rather than
+        traversing the specification.
+
+        The index is attached to every node, so a variant is copied in full
+        first. See materialize().
+
+        Args:
+            enable (bool, optional): Whether to enable the type index. Defaults to True.
+        """
+        if enable:
+            self.materialize()
+        if self._type_index is not None:
+            self._type_index.clear()
+        if enable:
+            TypeIndex(self)
 
     def _processors_declare_attrs(self, *args, **kwargs):
         Node.reset_processor_elems()
         for p in self.processors + self._required_processors:
+            p = class2obj(p)
             p.spec = self  # MAKE SURE THIS IS KEPT UP TO DATE
             p.declare_attrs()
 
     def _early_init_processors(self, _required_processors: List["Processor"], **kwargs):
-        class ProcessorListHolder(ListNode):
-            @classmethod
-            def declare_attrs(cls, *args, **kwargs):
-                super().declare_attrs(*args, **kwargs)
-                super().add_attr("", callfunc=class2obj)
-
         kwargs.setdefault("processors", [])
         kwargs["_required_processors"] = _required_processors
 
-        ProcessorListHolder.declare_attrs()
         self.processors = ProcessorListHolder(kwargs["processors"])
         self._required_processors = ProcessorListHolder(kwargs["_required_processors"])
         self._processors_declare_attrs()
 
     def __init__(self, *args, **kwargs):
         self._processor_attributes = {}
+        # A new spec may reuse the id() of a collected one. Drop cached
+        # specifiers so they are not shared between the two.
+        _invalidate_specifier_cache()
         Node.set_global_spec(self)
         self.spec = self
 
@@ -91,35 +427,92 @@ class BaseSpecification(DictNode):
             self._processors_run_pre_parse if pre_parse else self._processors_run
         )
 
+        # p has run if a run x is an instance of p, p is an instance of a run
+        # x, or p == x
+        run_classes = {x for x in to_check if isinstance(x, type)}
+        run_instances = [x for x in to_check if not isinstance(x, type)]
+        run_instance_classes = {type(x) for x in run_instances}
         for p in with_processors:
-            for x in to_check:
-                # If p is a class, check if x is an instance of that class
-                if isinstance(p, type) and isinstance(x, p):
-                    break
-                elif isinstance(x, type) and isinstance(p, x):
-                    break
-                elif p == x:
-                    break
-            else:
+            if isinstance(p, type):
+                if p in run_classes or any(
+                    issubclass(c, p) for c in run_instance_classes
+                ):
+                    continue
+            elif not run_classes.isdisjoint(type(p).__mro__):
+                continue
+            if p not in run_instances:
                 return True
         return False
 
+    def _processor_input_fingerprints(self, p: Any) -> Optional[Dict[str, str]]:
+        if p.reads is None or p.writes is None:
+            return None
+        keys = sorted(set(p.reads) | set(p.writes))
+        return {k: _fingerprint_token(self.get(k, None)) for k in keys}
+
+    def _inputs_unchanged(self, p: Any) -> bool:
+        """Whether the keys p reads and writes are unchanged since p, or a
+        processor of the same class and configuration, last ran. Running it
+        again is assumed to change nothing."""
+        key = processor_key(p)
+        recorded = self._processor_inputs.get(key) if key is not None else None
+        return (
+            recorded is not None and self._processor_input_fingerprints(p) == recorded
+        )
+
+    def _run_processor(self, p: Processor):
+        self.logger.info("Running processor %s", p.__class__.__name__)
+        start_time = time.time()
+        # The global spec is per thread, and this may run in a worker thread
+        prev_global_spec = Node.get_global_spec()
+        try:
+            Node.set_global_spec(self)
+            p.process(self)
+        finally:
+            Node.set_global_spec(prev_global_spec)
+        self.logger.info(
+            "Processor %s done after %.2f seconds",
+            p.__class__.__name__,
+            time.time() - start_time,
+        )
+
     def process(
         self,
         with_processors: Union["Processor", List["Processor"]] = None,
         check_types: bool = False,
         check_types_ignore_empty: bool = True,
         reprocess: bool = True,
+        parallel: bool = False,
+        max_workers: Optional[int] = None,
+        skip_unchanged: bool = False,
     ):
         """
         Process the specification with the given processors.
 
+        Processors are ordered by the processors they declare in requires
+        and runs_after, and otherwise run in the given order. If
+        skip_unchanged is set, a processor that has run before is skipped if
+        the keys it declares in reads and writes have not changed since it
+        last ran. If processor_cache is
+        enabled, processors that ran before on the same keys, in this or
+        another specification, are not run; their results are restored from
+        the cache.
+
         Args:
             with_processors (Union[Processor, List[Processor]], optional): Processors to be used for processing the specification. Defaults to None.
             check_types (bool, optional): Flag indicating whether to check for unrecognized types. Defaults to False.
             check_types_ignore_empty (bool, optional): Flag indicating whether to ignore empty types during type checking. Defaults to True.
             reprocess (bool, optional): Flag indicating whether to reprocess the specification even if it has been processed before. Defaults to True.
+            parallel (bool, optional): Run processors that do not depend on each other and modify disjoint keys in a thread pool. See schedule_processors(). This only speeds up processing if the processors release the GIL. Defaults to False.
+            max_workers (Optional[int], optional): Number of threads used if parallel is True. Defaults to None, letting ThreadPoolExecutor choose.
+            skip_unchanged (bool, optional): Skip processors that have run before if the keys they read and write have not changed since, as found by fingerprints. Processors with the same class and configuration, as given by Processor.config_key(), share a record. Defaults to False.
         """
+        self.materialize(["processors", "_processors_run"])
+        # Writes made by processors are not changes for reparse() to parse
+        log = self._expression_log
+        user_writes = {} if log is None else log.dirty
+        if log is not None:
+            log.dirty = {}
         prev_global_spec = Node.get_global_spec()
         try:
             Node.set_global_spec(self)
@@ -134,27 +527,88 @@ class BaseSpecification(DictNode):
                 self.process(References2CopiesProcessor, check_types=False)
 
             overall_start_time = time.time()
+            to_run = []
             for i, p in enumerate(processors):
-                if not self.needs_processing([p]) and (
+                pending = [processors[j] for j in to_run]
+                if not self.needs_processing([p], pending) and (
                     not reprocess
                     or p == References2CopiesProcessor
                     or isinstance(p, References2CopiesProcessor)
                 ):
                     continue
+                p_cls = p if isinstance(p, type) else type(p)
+                queued = any(isinstance(q, p_cls) or q is p_cls for q in pending)
+                if (
+                    skip_unchanged
+                    and not queued
+                    and not self.needs_processing([p])
+                    and self._inputs_unchanged(p)
+                ):
+                    self.logger.info(
+                        "Skipping processor %s. Its inputs are unchanged.",
+                        p_cls.__name__,
+                    )
+                    continue
+                to_run.append(i)
+
+            # Copy the keys of a variant that the processors may change
+            written: Optional[Set[str]] = set()
+            for i in to_run:
+                if processors[i].writes is None:
+                    written = None
+                    break
+                written.update(processors[i].writes)
+            self.materialize(written)
+
+            levels = schedule_processors(
+                [processors[i] for i in to_run], self._processors_run
+            )
+            ran = []
+            cache_stats = {k: dict(v) for k, v in processor_cache.stats.items()}
+            for level in levels:
+                level = [to_run[j] for j in level]
                 # If the processor isn't initialized, initialize it
-                p_cls = p
-                p = class2obj(p)
-                Node.reset_processor_elems(p.__class__)
-                processors[i] = p
-                self.logger.info("Running processor %s", p.__class__.__name__)
-                start_time = time.time()
-                p.process(self)
-                self.logger.info(
-                    "Processor %s done after %.2f seconds",
-                    p.__class__.__name__,
-                    time.time() - start_time,
-                )
-                self._processors_run.append(p_cls)
+                p_classes = [processors[i] for i in level]
+                for i in level:
+                    processors[i] = class2obj(processors[i])
+                    Node.reset_processor_elems(processors[i].__class__)
+                # Processors in a level do not use keys the others write, so
+                # results restored from the cache do not change their inputs
+                keys = {i: processor_cache.key(self, processors[i]) for i in level}
+                misses = []
+                for i in level:
+                    if processor_cache.restore(self, processors[i], keys[i]):
+                        self.logger.info(
+                            "Restored the result of processor %s from the cache",
+                            processors[i].__class__.__name__,
+                        )
+                    else:
+                        misses.append(i)
+                if parallel and len(misses) > 1:
+                    with ThreadPoolExecutor(max_workers) as pool:
+                        for f in [
+                            pool.submit(self._run_processor, processors[i])
+                            for i in misses
+                        ]:
+                            f.result()
+                else:
+                    for i in misses:
+                        self._run_processor(processors[i])
+                for i in misses:
+                    processor_cache.store(self, processors[i], keys[i])
+                self._processors_run.extend(p_classes)
+                ran.extend(zip(p_classes, (processors[i] for i in level)))
+            processor_cache.log_stats(self.logger, since=cache_stats)
+
+            if ran:
+                inputs = dict(self._processor_inputs)
+                # Recorded under the processor as given, class or instance
+                for given, p in ran:
+                    key = processor_key(given)
+                    fingerprints = self._processor_input_fingerprints(p)
+                    if key is not None and fingerprints is not None:
+                        inputs[key] = fingerprints
+                self._processor_inputs = inputs
             if check_types:
                 self.check_unrecognized(ignore_empty=check_types_ignore_empty)
             self.logger.info(
@@ -163,6 +617,9 @@ class BaseSpecification(DictNode):
             )
         finally:
             Node.set_global_spec(prev_global_spec)
+            if log is not None:
+                log.forget(log.dirty)
+                log.dirty = user_writes
 
     @classmethod
     def from_yaml_files(cls, *args, **kwargs) -> "Specification":
@@ -172,6 +629,7 @@ class BaseSpecification(DictNode):
         Args:
             *args: YAML file paths.
             jinja_parse_data: Dictionary of data to be used for Jinja parsing.
+            cache_dir: Directory to cache loaded YAML files in.
 
         Returns:
             Specification: The created Specification object.
@@ -182,6 +640,9 @@ class BaseSpecification(DictNode):
         self,
         symbol_table: Optional[Dict[str, Any]] = None,
         parsed_ids: Optional[set] = None,
+        parallel: bool = False,
+        max_workers: Optional[int] = None,
+        track_changes: bool = False,
     ):
         """
         Parse expressions in the specification.
@@ -189,6 +650,9 @@ class BaseSpecification(DictNode):
         Args:
             symbol_table (Optional[Dict[str, Any]], optional): Symbol table to be used for parsing. Defaults to None.
             parsed_ids (Optional[set], optional): Set of IDs of specifications that have already been parsed. Defaults to None.
+            parallel (bool, optional): Parse top-level keys that do not depend on each other in a thread pool. See expression_dependencies(). This only speeds up parsing if the functions called by expressions release the GIL. Defaults to False.
+            max_workers (Optional[int], optional): Number of threads used if parallel is True. Defaults to None, letting ThreadPoolExecutor choose.
+            track_changes (bool, optional): Record the parse so that reparse() can re-evaluate only the expressions affected by later changes. Defaults to False.
         """
         if self.needs_processing([References2CopiesProcessor]):
             raise ProcessorError(
@@ -196,31 +660,214 @@ class BaseSpecification(DictNode):
                 f"parsing expressions. Call process() with "
                 f"any arguments."
             )
+        copied = {}
+        if self._shared_keys:
+            copied = self._copy_shared([k for k in self if k in self._shared_keys])
         for p in self.processors:
             if self.needs_processing([p], pre_parse=True):
                 class2obj(p).pre_parse_process(self)
                 self._processors_run_pre_parse.append(p)
 
-        symbol_table = {} if symbol_table is None else symbol_table.copy()
+        symbol_table = SymbolTable.child_of(
+            symbol_table, ExpressionLog() if track_changes else None
+        )
         parsed_ids = set() if parsed_ids is None else parsed_ids
         parsed_ids.add(id(self))
         symbol_table["spec"] = self
-        super().parse_expressions(symbol_table, parsed_ids)
+        symbol_table = self._parse_variables(symbol_table, parsed_ids)
+        cache_stats = dict(expression_cache.stats)
+        if parallel:
+            self._parse_expressions_parallel(symbol_table, parsed_ids, max_workers)
+        else:
+            super().parse_expressions(symbol_table, parsed_ids)
+        expression_cache.log_stats(self.logger, since=cache_stats)
         self.check_unrecognized(ignore_should_have_been_removed_by=1)
         self._parsed_expressions = True
+        self._expression_log = symbol_table.log
+        if symbol_table.log is not None:
+            symbol_table.log.dirty.clear()
+        elif copied:
+            self._reshare(copied, parsed_ids)
+        if not self._shared_keys:
+            self.materialize()
+
+    def _parse_variables(
+        self, symbol_table: SymbolTable, parsed_ids: set
+    ) -> SymbolTable:
+        """Parse the values in scope for every top-level key. Returns the
+        symbol table to parse the specification with."""
+        return symbol_table
+
+    def reparse(self) -> int:
+        """
+        Re-evaluate the expressions affected by changes made since
+        parse_expressions(track_changes=True) or the last reparse().
+
+        Values written to the specification are parsed in the scope of the
+        node they were written to, and every expression or merged scope
+        entry, such as the attributes given to each Leaf, that read a changed
+        value is evaluated again. Processors that have run since parsing are
+        then run again if the keys they read and write changed; values they
+        overwrote are no longer re-evaluated. If expressions have not been
+        parsed yet, they are parsed with change tracking.
+
+        Returns:
+            int: The number of expressions re-evaluated.
+        """
+        if not self._parsed_expressions:
+            self.parse_expressions(track_changes=True)
+            return self._expression_log.count()
+        log = self._expression_log
+        if log is None:
+            raise ParseError(
+                "Expressions were parsed without tracking changes. Call "
+                "parse_expressions(track_changes=True) to use reparse()."
+            )
+        prev_global_spec = Node.get_global_spec()
+        try:
+            Node.set_global_spec(self)
+            start_time = time.time()
+            written = bool(log.dirty)
+            evaluated = log.update()
+            ran = []
+            for p in self._processors_run:
+                if p not in ran:
+                    ran.append(p)
+            if ran and (written or evaluated):
+                n_run = len(self._processors_run)
+                self.process(ran, skip_unchanged=True)
+                # They were recorded when they first ran
+                del self._processors_run[n_run:]
+            self.logger.info(
+                "Re-evaluated %d expressions in %.4f seconds",
+                evaluated,
+                time.time() - start_time,
+            )
+        finally:
+            Node.set_global_spec(prev_global_spec)
+        return evaluated
+
+    def expression_dependencies(self) -> Dict[str, Set[str]]:
+        """
+        Return the top-level keys that each top-level key may depend on while
+        parsing expressions.
+
+        Each top-level key is parsed with the keys before it in scope, so a
+        key depends on an earlier key if any string under it references that
+        key's name. A key with strings referencing "spec" or "parent_node" may
+        read anything, so it depends on every earlier key and every later key
+        depends on it.
+
+        Returns:
+            Dict[str, Set[str]]: The keys each key depends on, in parse order.
+        """
+        deps, before, spec_wide = {}, [], None
+        for k, v in self.items():
+            names = _referenced_names(v)
+            if names & _SPEC_WIDE_NAMES:
+                deps[k] = set(before)
+                spec_wide = k
+            else:
+                deps[k] = {j for j in before if j in names}
+                if spec_wide is not None:
+                    deps[k].add(spec_wide)
+            before.append(k)
+        return deps
+
+    @staticmethod
+    def _critical_path(
+        deps: Dict[str, Set[str]], durations: Dict[str, float]
+    ) -> Tuple[List[str], float]:
+        """Return the longest chain of dependent keys and its duration."""
+        finish, prev = {}, {}
+        for k, d in deps.items():  # Dependencies always come before a key
+            prev[k] = max(d, key=finish.__getitem__, default=None)
+            finish[k] = durations.get(k, 0) + finish.get(prev[k], 0)
+        if not finish:
+            return [], 0
+        path = [max(finish, key=finish.__getitem__)]
+        while prev[path[-1]] is not None:
+            path.append(prev[path[-1]])
+        return path[::-1], finish[path[0]]
+
+    def _parse_expressions_parallel(
+        self,
+        symbol_table: SymbolTable,
+        parsed_ids: set,
+        max_workers: Optional[int] = None,
+    ):
+        deps = self.expression_dependencies()
+        keys = list(deps)
+        index2checker = self._get_index2checker()
+        global_spec = Node.get_global_spec()
+        n_symbol_table = SymbolTable.child_of(symbol_table)
+        n_symbol_table["parent_node"] = self
+        if n_symbol_table.log is not None:
+            n_symbol_table.log.add_scope(self, n_symbol_table)
+        durations: Dict[str, float] = {}
+
+        def parse(k: str):
+            Node.set_global_spec(global_spec)
+            start = time.time()
+            # Same scope as a sequential parse. Every key this one references
+            # has already been parsed.
+            scope = n_symbol_table.new_child()
+            for j in keys[: keys.index(k)]:
+                scope.mirror(self, j)
+            self._parse_item(k, index2checker[k], scope, parsed_ids)
+            durations[k] = time.time() - start
+
+        start_time = time.time()
+        done, running, errors = set(), {}, {}
+        with ThreadPoolExecutor(max_workers) as pool:
+            while True:
+                if not errors:
+                    for k in keys:
+                        started = k in done or k in running.values()
+                        if not started and deps[k] <= done:
+                            running[pool.submit(parse, k)] = k
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f in finished:
+                    k = running.pop(f)
+                    if f.exception() is not None:
+                        errors[k] = f.exception()
+                    else:
+                        done.add(k)
+        if errors:
+            # Raise the error a sequential parse would have raised
+            raise errors[min(errors, key=keys.index)]
+
+        for k in keys:
+            n_symbol_table.mirror(self, k)
+        path, length = self._critical_path(deps, durations)
+        self.logger.info(
+            "Parsed expressions in %.2f seconds. Critical path %s took %.2f "
+            "of %.2f seconds of parsing.",
+            time.time() - start_time,
+            " -> ".join(path),
+            length,
+            sum(durations.values()),
+        )
+        return n_symbol_table
 
     def _process(self):
-        spec = copy.deepcopy(self)
+        spec = self.clone()
+        if self._type_index is not None:
+            spec.enable_type_index()
         if not spec._parsed_expressions:
             spec.parse_expressions()
         if spec.needs_processing():
             spec.process(check_types=False, reprocess=False)
         spec.process(spec._required_processors)
-        spec.check_unrecognized()
+        # Claim nodes made by processors and check the result in one walk
+        _raise_errors(spec._collect_errors(visitors=[spec._claim_visitor()]))
         return spec
 
     def _parse_timeloop_output(self, timeloop_output_dir: str, prefix: str):
         pass
 
 
+ProcessorListHolder.declare_attrs()
 BaseSpecification.declare_attrs()
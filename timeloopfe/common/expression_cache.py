@@ -0,0 +1,217 @@
+"""Caches for evaluating expressions in specifications."""
+
+from collections import OrderedDict
+import re
+import threading
+from types import CodeType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from accelergy.parsing_utils import parse_expression_for_arithmetic
+
+# Results are only memoized if every referenced symbol and the result itself
+# are one of these types. Anything else may be mutated after it is cached.
+# Results of other types are left to parse_expression_for_arithmetic.
+_MEMO_TYPES = (str, int, float, complex, bool, type(None))
+_MISSING = object()
+# Compiled code and the names it references, or None if not valid Python
+_Compiled = Optional[Tuple[CodeType, Tuple[str, ...]]]
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+
+
+def _code_names(code: CodeType) -> Tuple[str, ...]:
+    names, stack = [], [code]
+    while stack:
+        c = stack.pop()
+        names.extend(c.co_names)
+        stack.extend(x for x in c.co_consts if isinstance(x, CodeType))
+    return tuple(sorted(set(names)))
+
+
+class ExpressionCache:
+    """
+    Caches expressions evaluated by parse_expression_for_arithmetic.
+
+    Expressions are compiled once and kept in a bounded LRU with the names
+    they reference. An expression whose names are all in the symbol table
+    is evaluated from its compiled code with the symbol table as its only
+    scope. Other expressions, e.g. ones calling functions that
+    parse_expression_for_arithmetic provides, and ones that fail, are
+    evaluated by parse_expression_for_arithmetic. If memoization is
+    enabled, results of the former are also kept in a bounded LRU keyed by
+    the expression and the values of the symbols it references, so
+    repeated evaluations of the same formula with the same inputs are
+    skipped.
+
+    Attributes:
+        max_compiled (int): The maximum number of compiled expressions kept.
+        max_results (int): The maximum number of memoized results kept.
+        memoize_results (bool): Whether to memoize results.
+    """
+
+    def __init__(
+        self,
+        max_compiled: int = 4096,
+        max_results: int = 65536,
+        memoize_results: bool = False,
+    ):
+        self.max_compiled = max_compiled
+        self.max_results = max_results
+        self.memoize_results = memoize_results
+        self._compiled: "OrderedDict[str, _Compiled]" = OrderedDict()
+        self._results: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the hit and miss counters."""
+        with self._lock:
+            self.stats = {
+                "compiled_hits": 0,
+                "compiled_misses": 0,
+                "result_hits": 0,
+                "result_misses": 0,
+            }
+
+    def clear(self):
+        """Drop all compiled expressions and memoized results."""
+        with self._lock:
+            self._compiled.clear()
+            self._results.clear()
+
+    def _compile(self, expression: str) -> _Compiled:
+        with self._lock:
+            if expression in self._compiled:
+                self.stats["compiled_hits"] += 1
+                self._compiled.move_to_end(expression)
+                return self._compiled[expression]
+            self.stats["compiled_misses"] += 1
+        try:
+            code = compile(expression.strip(), "<expression>", "eval")
+            compiled = (code, _code_names(code))
+        except (SyntaxError, ValueError):
+            compiled = None
+        with self._lock:
+            self._compiled[expression] = compiled
+            if len(self._compiled) > self.max_compiled:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def referenced_names(self, expression: str) -> Optional[Tuple[str, ...]]:
+        """
+        Return the names referenced by an expression.
+
+        Args:
+            expression (str): The expression.
+
+        Returns:
+            Optional[Tuple[str, ...]]: The names, or None if the expression is
+            not valid Python.
+        """
+        compiled = self._compile(expression)
+        return None if compiled is None else compiled[1]
+
+    def names_in(self, expression: str) -> Tuple[str, ...]:
+        """
+        Return the names an expression may reference. If the expression is
+        not valid Python, every identifier-like token is assumed to be one.
+
+        Args:
+            expression (str): The expression.
+
+        Returns:
+            Tuple[str, ...]: The names.
+        """
+        names = self.referenced_names(expression)
+        if names is None:
+            names = tuple(sorted(set(_IDENTIFIER.findall(expression))))
+        return names
+
+    def _memo_key(
+        self, expression: str, names: Tuple[str, ...], symbol_table: Mapping[str, Any]
+    ) -> Optional[Tuple]:
+        values = []
+        for n in names:
+            v = symbol_table[n]
+            if not isinstance(v, _MEMO_TYPES):
+                return None
+            # 1, 1.0 and True are equal but may give different results
+            values.append((type(v), v))
+        return (expression, tuple(values))
+
+    def evaluate(
+        self, expression: str, symbol_table: Mapping[str, Any], location: str
+    ) -> Any:
+        """
+        Evaluate an expression, as parse_expression_for_arithmetic would.
+
+        Args:
+            expression (str): The expression to evaluate.
+            symbol_table (Mapping[str, Any]): The symbols in scope.
+            location (str): Where the expression is. For error messages.
+
+        Returns:
+            Any: The result of the expression.
+        """
+        compiled = self._compile(expression)
+        # Only expressions that use nothing but the symbol table are
+        # evaluated here, as names outside of it may be functions that are
+        # impure or change between specifications.
+        if compiled is None or not all(n in symbol_table for n in compiled[1]):
+            return parse_expression_for_arithmetic(expression, symbol_table, location)
+        code, names = compiled
+
+        key = None
+        if self.memoize_results:
+            key = self._memo_key(expression, names, symbol_table)
+        if key is not None:
+            with self._lock:
+                result = self._results.get(key, _MISSING)
+                if result is not _MISSING:
+                    self.stats["result_hits"] += 1
+                    self._results.move_to_end(key)
+                    return result
+                self.stats["result_misses"] += 1
+
+        try:
+            result = eval(code, {"__builtins__": {}}, symbol_table)
+        except Exception:
+            result = _MISSING
+        if not isinstance(result, _MEMO_TYPES):
+            # Leave errors and unusual results to parse_expression_for_arithmetic
+            return parse_expression_for_arithmetic(expression, symbol_table, location)
+
+        if key is not None:
+            with self._lock:
+                self._results[key] = result
+                if len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+        return result
+
+    def log_stats(self, logger, since: Optional[Dict[str, int]] = None):
+        """
+        Log hit rates.
+
+        Args:
+            logger: The logger to log to.
+            since (Optional[Dict[str, int]]): Earlier stats to subtract.
+        """
+        since = since or {}
+        s = {k: v - since.get(k, 0) for k, v in self.stats.items()}
+
+        def rate(hits: int, misses: int) -> float:
+            return 100 * hits / max(hits + misses, 1)
+
+        logger.info(
+            "Expression cache: %d/%d compiled hits (%.1f%%), "
+            "%d/%d result hits (%.1f%%)",
+            s["compiled_hits"],
+            s["compiled_hits"] + s["compiled_misses"],
+            rate(s["compiled_hits"], s["compiled_misses"]),
+            s["result_hits"],
+            s["result_hits"] + s["result_misses"],
+            rate(s["result_hits"], s["result_misses"]),
+        )
+
+
+expression_cache = ExpressionCache()
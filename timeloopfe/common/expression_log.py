@@ -0,0 +1,302 @@
+"""Tracking of parsed expressions so they can be re-evaluated after changes."""
+
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+from .expression_cache import expression_cache
+from .nodes import DictNode, ListNode, Node, SymbolTable, TypeSpecifier
+
+# The key recorded for writes to a ListNode
+_LIST_CHANGED = None
+
+
+def _sources(names: Tuple[str, ...], symbol_table: SymbolTable) -> tuple:
+    """Return (name, frame) for each name, where frame is the first frame of
+    symbol_table holding name or None."""
+    found = []
+    for n in names:
+        for m in symbol_table.maps:
+            if n in m:
+                found.append((n, m))
+                break
+        else:
+            found.append((n, None))
+    return tuple(found)
+
+
+class _ExpressionRecord:
+    __slots__ = ("node", "index", "expression", "checker", "symbol_table", "sources")
+
+    def __init__(
+        self,
+        node: Node,
+        index: Any,
+        expression: str,
+        checker: Optional[TypeSpecifier],
+        symbol_table: SymbolTable,
+    ):
+        self.node = node
+        self.index = index
+        self.expression = expression
+        self.checker = checker
+        self.symbol_table = symbol_table
+        self.sources = ()
+        self.find_sources()
+
+    def find_sources(self):
+        names = expression_cache.names_in(self.expression)
+        self.sources = _sources(names, self.symbol_table)
+
+    def entries(self):
+        """Yield the scope entries this expression read. (None, name) stands
+        for name being added to or removed from any frame."""
+        for n, m in self.sources:
+            yield (None, n)
+            if m is not None:
+                yield (id(m), n)
+
+
+class _MergeRecord:
+    __slots__ = ("frame", "key", "names", "symbol_table", "sources")
+
+    def __init__(
+        self,
+        frame: Dict[str, Any],
+        key: str,
+        names: Sequence[str],
+        symbol_table: SymbolTable,
+    ):
+        self.frame = frame
+        self.key = key
+        self.names = tuple(names)
+        self.symbol_table = symbol_table
+        self.sources = ()
+        self.find_sources()
+
+    def find_sources(self):
+        self.sources = _sources(self.names, self.symbol_table)
+
+    def entries(self):
+        """Yield the scope entries merged, and (id(node), None) for each
+        node merged, standing for any write to the node."""
+        for n, m in self.sources:
+            yield (None, n)
+            if m is not None:
+                yield (id(m), n)
+                if isinstance(m[n], Node):
+                    yield (id(m[n]), None)
+
+    def merge(self) -> Dict[str, Any]:
+        merged = {}
+        for n, m in self.sources:
+            if m is not None:
+                merged.update(m[n])
+        return merged
+
+
+class ExpressionLog:
+    """
+    Record of a parse, used to re-evaluate only what changed afterwards.
+
+    While parsing, the log records the scope each node's items were parsed
+    in, the frames holding copies of node values, the frames holding merges
+    of other entries, and the frame each evaluated expression read each name
+    from. Nodes parsed while recording report later writes to the log, and
+    update() re-evaluates the expressions and merges that read anything
+    those writes changed.
+
+    Attributes:
+        records (Dict[Tuple[int, Any], Union[_ExpressionRecord, _MergeRecord]]):
+            Evaluated expressions by (id(node), index) and merges by
+            (id(frame), key), in the order they were parsed.
+        scopes (Dict[int, Tuple[Node, SymbolTable]]): The table each node's
+            items were parsed with.
+        mirrors (Dict[int, Tuple[Node, Dict[int, Mapping]]]): The frames
+            holding copies of each node's items.
+        dirty (Dict[Tuple[int, Any], Node]): Writes since the last update().
+    """
+
+    def __init__(self):
+        self.records: Dict[
+            Tuple[int, Any], Union[_ExpressionRecord, _MergeRecord]
+        ] = {}
+        self.scopes: Dict[int, Tuple[Node, SymbolTable]] = {}
+        self.mirrors: Dict[int, Tuple[Node, Dict[int, Mapping]]] = {}
+        self.dirty: Dict[Tuple[int, Any], Node] = {}
+
+    def add_scope(self, node: Node, symbol_table: SymbolTable):
+        """Record the table node's items are parsed with, and start tracking
+        writes to node."""
+        self.scopes[id(node)] = (node, symbol_table)
+        object.__setattr__(node, "_change_log", self)
+
+    def add_mirror(self, node: Node, frame: Mapping):
+        """Record that frame holds copies of node's items."""
+        entry = self.mirrors.get(id(node), None)
+        if entry is None or entry[0] is not node:
+            entry = self.mirrors[id(node)] = (node, {})
+        entry[1][id(frame)] = frame
+
+    def add_merge(
+        self,
+        frame: Dict[str, Any],
+        key: str,
+        names: Sequence[str],
+        symbol_table: SymbolTable,
+    ):
+        """Record that frame[key] merges the mappings bound to names in
+        symbol_table."""
+        record = _MergeRecord(frame, key, names, symbol_table)
+        self.records[(id(frame), key)] = record
+
+    def add_expression(
+        self,
+        node: Node,
+        index: Any,
+        expression: str,
+        checker: Optional[TypeSpecifier],
+        symbol_table: SymbolTable,
+    ):
+        """Record that node[index] was evaluated from expression."""
+        record = _ExpressionRecord(node, index, expression, checker, symbol_table)
+        self.records[(id(node), index)] = record
+
+    def changed(self, node: Node, key: Any = _LIST_CHANGED):
+        """Record a write to node[key]. For lists, key is an index, or
+        _LIST_CHANGED if items may have moved."""
+        if isinstance(node, ListNode) and key is not _LIST_CHANGED and key < 0:
+            key += len(node)
+        self.dirty[(id(node), key)] = node
+
+    def count(self) -> int:
+        """Return the number of expressions recorded."""
+        return sum(isinstance(r, _ExpressionRecord) for r in self.records.values())
+
+    def forget(self, writes: Dict[Tuple[int, Any], Node]):
+        """Stop re-evaluating the expressions whose values were overwritten
+        by writes, which are not parsed."""
+        for (_, key), node in writes.items():
+            if key is _LIST_CHANGED:
+                for k in [k for k in self.records if k[0] == id(node)]:
+                    del self.records[k]
+            else:
+                self.records.pop((id(node), key), None)
+
+    def is_parsed(self, node: Node) -> bool:
+        """Return whether node was parsed while recording."""
+        entry = self.scopes.get(id(node), None)
+        return entry is not None and entry[0] is node
+
+    def _parse_new(self, node: Node, key: Any):
+        # Parse values written to node in the scope of node's items
+        if not self.is_parsed(node):
+            return
+        if key is _LIST_CHANGED:
+            items = list(node.items())
+        elif isinstance(node, ListNode):
+            items = [(key, node[key])] if key < len(node) else []
+        else:
+            items = [(key, node[key])] if key in node else []
+        symbol_table = self.scopes[id(node)][1]
+        index2checker = node._get_index2checker()
+        for i, x in items:
+            if isinstance(x, Node) and self.is_parsed(x):
+                continue
+            if key is _LIST_CHANGED and not isinstance(x, (str, Node)):
+                continue
+            node._parse_item(i, index2checker.get(i), symbol_table, set())
+
+    def _propagate(self, node: Node, key: Any, changed: Dict, position: int):
+        # Update the copies of node[key] in scope frames
+        changed[(id(node), None)] = position
+        entry = self.mirrors.get(id(node), None)
+        if entry is None or entry[0] is not node:
+            return
+        for frame in entry[1].values():
+            if (key in node) != (key in frame):
+                changed[(None, key)] = position
+            if key in node:
+                frame[key] = node[key]
+            else:
+                frame.pop(key, None)
+            changed[(id(frame), key)] = position
+
+    def _reevaluate(self, record: _ExpressionRecord) -> bool:
+        node, index = record.node, record.index
+        if isinstance(node, DictNode) and index not in node:
+            return False
+        scope = {n: m[n] for n, m in record.sources if m is not None and n in m}
+        v = expression_cache.evaluate(
+            record.expression, scope, f"{node.get_name()}[{index}]"
+        )
+        if record.checker is not None:
+            v = record.checker.cast_check_type(v, node, index)
+        old = node[index]
+        if type(old) is type(v) and (old is v or old == v):
+            return False
+        node[index] = v
+        return True
+
+    def _remerge(self, record: _MergeRecord, changed: Dict, position: int):
+        merged = record.merge()
+        if merged != record.frame.get(record.key, None):
+            record.frame[record.key] = merged
+            changed[(id(record.frame), record.key)] = position
+
+    def update(self) -> int:
+        """
+        Apply the writes made since the last update. Values written are
+        parsed in the scope of their parent, and expressions and merges
+        reading any changed value are re-evaluated until nothing else
+        changes.
+
+        Returns:
+            int: The number of expressions re-evaluated.
+        """
+        dirty, self.dirty = self.dirty, {}
+        # Changed scope entries mapped to the position of the record that
+        # changed them. Records after that position see the change in the
+        # same pass; records before it are visited again in the next pass.
+        changed: Dict[Tuple[Optional[int], str], int] = {}
+        for (_, key), node in dirty.items():
+            if key is _LIST_CHANGED:
+                # Items may have moved, so the list's records no longer apply
+                stale = [k for k in self.records if k[0] == id(node)]
+                for k in stale:
+                    del self.records[k]
+                if stale:
+                    node.logger.warning(
+                        "Items of %s were moved after parsing. Expressions "
+                        "previously evaluated in it will not be re-evaluated.",
+                        node.get_name(),
+                    )
+            else:
+                self.records.pop((id(node), key), None)
+            self._parse_new(node, key)
+            if key is not _LIST_CHANGED:
+                self._propagate(node, key, changed, -1)
+
+        evaluated = 0
+        records = list(self.records.values())
+        previous: Dict[Tuple[Optional[int], str], int] = {
+            k: len(records) for k in changed
+        }
+        while previous:
+            changed = {}
+            for q, record in enumerate(records):
+                entries = set(record.entries())
+                if not any(
+                    previous.get(e, -1) > q or changed.get(e, q) < q for e in entries
+                ):
+                    continue
+                if any(e in previous or e in changed for e in entries if not e[0]):
+                    # A name was added or removed. Look it up again.
+                    record.find_sources()
+                if isinstance(record, _MergeRecord):
+                    self._remerge(record, changed, q)
+                    continue
+                evaluated += 1
+                if self._reevaluate(record):
+                    self._propagate(record.node, record.index, changed, q)
+            previous = changed
+        self.dirty.clear()
+        return evaluated
@@ -0,0 +1,259 @@
+"""A cache of compiled Jinja templates, used while loading specifications."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+import jinja2
+
+_original_compile = jinja2.Environment.compile
+# Per thread, the installed caches and their bytecode directories. The last
+# is used.
+_local = threading.local()
+_install_lock = threading.Lock()
+
+# Settings of an environment that change the code a template compiles to
+_LEXER_ATTRS = (
+    "block_start_string",
+    "block_end_string",
+    "variable_start_string",
+    "variable_end_string",
+    "comment_start_string",
+    "comment_end_string",
+    "line_statement_prefix",
+    "line_comment_prefix",
+    "trim_blocks",
+    "lstrip_blocks",
+    "newline_sequence",
+    "keep_trailing_newline",
+)
+
+
+def _pass_arg(f) -> str:
+    return repr(getattr(f, "jinja_pass_arg", None))
+
+
+def _environment_token(env: jinja2.Environment, name: Optional[str]) -> str:
+    autoescape = env.autoescape(name) if callable(env.autoescape) else env.autoescape
+    parts = [repr(getattr(env, a)) for a in _LEXER_ATTRS]
+    parts += [
+        repr(sorted(env.extensions)),
+        repr(env.optimized),
+        repr(env.is_async),
+        repr(env.sandboxed),
+        repr(bool(autoescape)),
+        "None" if env.finalize is None else _pass_arg(env.finalize),
+        repr(env.code_generator_class),
+        repr(sorted(getattr(env, "intercepted_binops", ()))),
+        repr(sorted(getattr(env, "intercepted_unops", ()))),
+    ]
+    for table in (env.filters, env.tests):
+        parts.append(",".join(f"{k}:{_pass_arg(v)}" for k, v in sorted(table.items())))
+    return "\0".join(parts)
+
+
+class JinjaCache:
+    """
+    Caches the code Jinja templates compile to.
+
+    While installed, every compile by a jinja2 Environment in the installing
+    thread, including the ones made by accelergy while loading YAML files,
+    is looked up by a hash of the template source, its name and file name,
+    and the settings of the environment that change the generated code.
+    Compiled templates are kept in a bounded LRU and, if bytecode_dir is
+    set, written there so other processes may reuse them. Rendering is not
+    cached.
+
+    Attributes:
+        max_templates (int): The maximum number of templates kept in memory.
+        bytecode_dir (Optional[str]): A directory to keep compiled templates
+            in, or None to keep them in memory only.
+        stats (Dict[str, float]): Numbers of memory hits, disk hits, and
+            misses, and the seconds spent compiling templates.
+    """
+
+    def __init__(self, max_templates: int = 256, bytecode_dir: Optional[str] = None):
+        self.max_templates = max_templates
+        self.bytecode_dir = bytecode_dir
+        self._templates: "OrderedDict[str, CodeType]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, float] = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the hit and miss counters and the compile time."""
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "compile_seconds": 0.0}
+
+    def add_stats(self, stats: Dict[str, float]):
+        """Add counts from another cache, e.g. one used in another process."""
+        with self._lock:
+            for k, v in stats.items():
+                self.stats[k] += v
+
+    def clear(self):
+        """Drop all compiled templates kept in memory."""
+        with self._lock:
+            self._templates.clear()
+
+    def _key(
+        self, env: jinja2.Environment, source: str, name, filename, defer_init
+    ) -> str:
+        h = hashlib.sha256()
+        for part in (
+            jinja2.__version__,
+            sys.version,
+            _environment_token(env, name),
+            repr((name, filename, defer_init)),
+            source,
+        ):
+            h.update(part.encode("utf-8", "surrogatepass"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _read_bytecode(self, bytecode_dir: str, key: str) -> Optional[CodeType]:
+        path = os.path.join(bytecode_dir, key + ".jinjac")
+        try:
+            with open(path, "rb") as f:
+                return marshal.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning("Ignoring unreadable Jinja bytecode %s: %s", path, e)
+            return None
+
+    def _write_bytecode(self, bytecode_dir: str, key: str, code: CodeType):
+        path = os.path.join(bytecode_dir, key + ".jinjac")
+        fd, tmp = tempfile.mkstemp(dir=bytecode_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp, path)
+        except Exception as e:
+            logging.warning("Could not write Jinja bytecode %s: %s", path, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def compile(
+        self,
+        env: jinja2.Environment,
+        source,
+        name: Optional[str] = None,
+        filename: Optional[str] = None,
+        raw: bool = False,
+        defer_init: bool = False,
+        bytecode_dir: Optional[str] = None,
+    ):
+        """
+        Compile a template with env, reusing an earlier compile of the same
+        template if there is one. Takes the arguments of
+        jinja2.Environment.compile, and a bytecode directory to use instead
+        of bytecode_dir.
+        """
+        if raw or not isinstance(source, str):
+            return _original_compile(env, source, name, filename, raw, defer_init)
+        bytecode_dir = bytecode_dir or self.bytecode_dir
+
+        key = self._key(env, source, name, filename, defer_init)
+        with self._lock:
+            code = self._templates.get(key, None)
+            if code is not None:
+                self.stats["hits"] += 1
+                self._templates.move_to_end(key)
+                return code
+
+        code = None
+        if bytecode_dir is not None:
+            code = self._read_bytecode(bytecode_dir, key)
+        if code is not None:
+            with self._lock:
+                self.stats["disk_hits"] += 1
+        else:
+            start = time.perf_counter()
+            code = _original_compile(env, source, name, filename, False, defer_init)
+            with self._lock:
+                self.stats["misses"] += 1
+                self.stats["compile_seconds"] += time.perf_counter() - start
+            if bytecode_dir is not None:
+                self._write_bytecode(bytecode_dir, key, code)
+
+        with self._lock:
+            self._templates[key] = code
+            if len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        return code
+
+    @contextmanager
+    def installed(self, bytecode_dir: Optional[str] = None):
+        """
+        Route compiles by jinja2 Environments in this thread through this
+        cache for the duration of the context. Other threads are not
+        affected. Contexts may be nested; the innermost is used.
+
+        The environments are made by accelergy, so compiles are intercepted
+        with a hook on jinja2.Environment. It is added on first use and left
+        in place, and compiles outside of any context go straight to Jinja.
+
+        Args:
+            bytecode_dir (Optional[str]): A directory to use instead of
+                bytecode_dir.
+        """
+        bytecode_dir = bytecode_dir or self.bytecode_dir
+        if bytecode_dir is not None:
+            os.makedirs(bytecode_dir, exist_ok=True)
+        _install_hook()
+        active = _active()
+        active.append((self, bytecode_dir))
+        try:
+            yield self
+        finally:
+            active.pop()
+
+    def log_stats(self, since: Optional[Dict[str, float]] = None):
+        """
+        Log hit rates and the time spent compiling.
+
+        Args:
+            since (Optional[Dict[str, float]]): Earlier stats to subtract.
+        """
+        since = since or {}
+        s = {k: v - since.get(k, 0) for k, v in self.stats.items()}
+        logging.info(
+            "Jinja cache: %d templates compiled in %.3f seconds, %d reused "
+            "from memory, %d from disk",
+            s["misses"],
+            s["compile_seconds"],
+            s["hits"],
+            s["disk_hits"],
+        )
+
+
+def _active() -> List[Tuple[JinjaCache, Optional[str]]]:
+    if not hasattr(_local, "active"):
+        _local.active = []
+    return _local.active
+
+
+def _compile(env, source, name=None, filename=None, raw=False, defer_init=False):
+    active = _active()
+    if not active:
+        return _original_compile(env, source, name, filename, raw, defer_init)
+    cache, bytecode_dir = active[-1]
+    return cache.compile(env, source, name, filename, raw, defer_init, bytecode_dir)
+
+
+def _install_hook():
+    with _install_lock:
+        if jinja2.Environment.compile is _original_compile:
+            jinja2.Environment.compile = _compile
+
+
+jinja_cache = JinjaCache()
@@ -1,13 +1,19 @@
 """Node classes for parsing and processing specification trees."""
 
 from abc import ABC
+import bisect
+from collections import ChainMap
 import copy
-import glob
+import functools
+import hashlib
+import heapq
 import inspect
 import logging
 import os
 from pathlib import Path
 import threading
+import time
+import weakref
 from typing import (
     Callable,
     Any,
@@ -19,12 +25,15 @@ from typing import (
     List,
     Tuple,
     Iterable,
+    Mapping,
+    Sequence,
     Type,
 )
-import accelergy.utils.yaml as yaml
-
 
 from accelergy.parsing_utils import parse_expression_for_arithmetic, is_quoted_string
+from .expression_cache import expression_cache
+from .jinja_cache import jinja_cache
+from .yaml_cache import YamlCache, load_yaml_files, resolve_yaml_files
 
 
 class ParseError(Exception):
@@ -209,6 +218,58 @@ class TypeSpecifier:
         )
 
 
+class SymbolTable(ChainMap):
+    """
+    Layered symbol table used while parsing expressions.
+
+    Each node parsing expressions pushes a new frame on top of the table it
+    was given instead of copying it. Writes go to the top frame, so a child
+    table behaves like a copy of its parent for as long as it is in use.
+    """
+
+    # ExpressionLog recording this parse, if changes are being tracked
+    log = None
+
+    @classmethod
+    def child_of(
+        cls, symbol_table: Optional[Mapping[str, Any]], log: Any = None
+    ) -> "SymbolTable":
+        """Return a new table with an empty frame on top of symbol_table.
+        If given, log is used if symbol_table does not have a log already."""
+        if symbol_table is None:
+            child = cls()
+        elif isinstance(symbol_table, SymbolTable):
+            child = symbol_table.new_child()
+        else:
+            child = cls({}, symbol_table)
+        if child.log is None:
+            child.log = log
+        return child
+
+    def new_child(self, m: Optional[dict] = None) -> "SymbolTable":
+        child = super().new_child(m)
+        child.log = self.log
+        return child
+
+    def mirror(self, node: "Node", key: Any):
+        """Copy node[key] into the top frame, recording the copy."""
+        self[key] = node[key]
+        if self.log is not None:
+            self.log.add_mirror(node, self.maps[0])
+
+    def merge(self, key: str, names: Sequence[str]):
+        """Set key in the top frame to the items of the mappings bound to
+        names below the top frame, later names taking precedence. The merge
+        is recorded, so it is done again if those mappings change."""
+        parents = self.parents
+        if self.log is not None:
+            self.log.add_merge(self.maps[0], key, names, parents)
+        merged = {}
+        for n in names:
+            merged.update(parents.get(n, {}))
+        self[key] = merged
+
+
 def isempty(x: Iterable) -> bool:
     if x is None:
         return True
@@ -220,6 +281,27 @@ def isempty(x: Iterable) -> bool:
         return False
 
 
+# At most this many further errors are listed in the message of a raised error
+_MAX_LISTED_ERRORS = 20
+
+
+def _raise_errors(errors: List[Exception]):
+    """Raise the first error, listing the others in its message."""
+    if not errors:
+        return
+    first = errors[0]
+    if len(errors) > 1:
+        others = [f"{e.__class__.__name__}: {e}" for e in errors[1:]]
+        if len(others) > _MAX_LISTED_ERRORS:
+            n_more = len(others) - _MAX_LISTED_ERRORS
+            others = others[:_MAX_LISTED_ERRORS] + [f"... and {n_more} more"]
+        msg = first.args[0] if first.args else ""
+        first.args = (
+            f"{msg}\n{len(errors) - 1} more error(s) found:\n" + "\n".join(others),
+        ) + first.args[1:]
+    raise first
+
+
 _local = threading.local()
 
 
@@ -243,6 +325,537 @@ _thread_local = threading.local()
 lock = threading.Lock()
 _thread_local.top_spec = None
 
+# Resolved type specifiers are cached per (class, spec). The version is bumped
+# whenever a declaration changes (add_attr, declare_attrs, recognize_all,
+# reset_specifiers_from_processors), which drops every cached entry at once.
+_specifier_cache: Dict[Tuple[Type, int], "_SpecifierCacheEntry"] = {}
+_specifier_cache_version: int = 0
+_specifier_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
+# Taken to build entries, which may happen while parsing in a thread pool.
+# Hits are not locked, so concurrent hits may be missing from the counters.
+_specifier_cache_lock = threading.RLock()
+
+
+class _SpecifierCacheEntry:
+    """Resolved type specifiers for one (class, spec) pair, plus memoized
+    key -> checker lookups so _get_index2checker does not rescan them."""
+
+    __slots__ = (
+        "version",
+        "specifiers",
+        "all_recognized",
+        "key2checker",
+        "tag2checker",
+        "skip_check_unrecognized",
+    )
+
+    def __init__(
+        self,
+        version: int,
+        specifiers: Dict[str, TypeSpecifier],
+        all_recognized: bool,
+        is_list: bool,
+    ):
+        self.version = version
+        self.specifiers = specifiers
+        self.all_recognized = all_recognized
+        # Whether check_unrecognized has nothing to check for this class
+        self.skip_check_unrecognized = (
+            all_recognized
+            or (is_list and not specifiers)
+            or list(specifiers) == ["ignore"]
+        )
+        self.key2checker: Dict[Any, Optional[TypeSpecifier]] = {}
+        self.tag2checker: Dict[Tuple[str, str], Optional[TypeSpecifier]] = {}
+
+    def checker_for_key(self, key: Any) -> Optional[TypeSpecifier]:
+        try:
+            return self.key2checker[key]
+        except KeyError:
+            pass
+        except TypeError:  # Unhashable key. Resolve without memoizing.
+            return self._resolve_key(key)
+        checker = self._resolve_key(key)
+        self.key2checker[key] = checker
+        return checker
+
+    def _resolve_key(self, key: Any) -> Optional[TypeSpecifier]:
+        checker = self.specifiers.get(key, None)
+        if checker is None:
+            for s in self.specifiers.values():
+                if s.part_name_match and s.name in key:
+                    return s
+        return checker
+
+    def checker_for_elem(self, value: Any) -> Optional[TypeSpecifier]:
+        key = (Node._get_tag(value), value.__class__.__name__)
+        try:
+            return self.tag2checker[key]
+        except KeyError:
+            pass
+        checker = self.specifiers.get(key[0], None)
+        if checker is None:
+            checker = self.specifiers.get("!" + key[1], None)
+        self.tag2checker[key] = checker
+        return checker
+
+
+@functools.lru_cache(maxsize=4096)
+def _key_aliases(key: str) -> Tuple[str, ...]:
+    """Spellings of key with "_" and "-" swapped, which may not be used in
+    the same node as key. The first one found in a node is reported."""
+    aliases = []
+    if "-" in key:
+        aliases.append(key.replace("-", "_"))
+    if "_" in key:
+        aliases.append(key.replace("_", "-"))
+    return tuple(aliases)
+
+
+def _fingerprint_token(value: Any) -> str:
+    """Return a string that identifies a value that is not a node, for use in
+    Node.fingerprint(). Does not depend on object ids or hash seeds."""
+    t = type(value)
+    if value is None or t in (str, int, float, complex, bool, bytes):
+        return f"{t.__name__}:{value!r}"
+    if isinstance(value, Node):
+        return value.fingerprint()
+    if isinstance(value, type):
+        return f"type:{value.__module__}.{value.__qualname__}"
+    if isinstance(value, (list, tuple)):
+        items = ",".join(_fingerprint_token(v) for v in value)
+        return f"{t.__name__}:[{items}]"
+    if isinstance(value, dict):
+        items = ",".join(
+            f"{_fingerprint_token(k)}={_fingerprint_token(v)}"
+            for k, v in value.items()
+        )
+        return f"{t.__name__}:{{{items}}}"
+    if isinstance(value, (set, frozenset)):
+        items = ",".join(sorted(_fingerprint_token(v) for v in value))
+        return f"{t.__name__}:{{{items}}}"
+    name = f"{t.__module__}.{t.__qualname__}"
+    if t.__repr__ is object.__repr__:  # The default repr holds the id
+        return name
+    return f"{name}:{value!r}"
+
+
+def _invalidate_specifier_cache():
+    global _specifier_cache_version
+    with _specifier_cache_lock:
+        _specifier_cache_version += 1
+        _specifier_cache.clear()
+
+
+# Leaves that are never copied by Node.clone(). Anything else that is not a
+# node or a plain container falls back to copy.deepcopy.
+_CLONE_SHARED_TYPES: Tuple[Type, ...] = (
+    str,
+    int,
+    float,
+    complex,
+    bool,
+    bytes,
+    type(None),
+    type,
+    Unspecified,
+    logging.Logger,
+)
+# Attributes that only record how a node was constructed. They are shared
+# between a node and its clones rather than copied.
+_CLONE_SHARED_ATTRS = frozenset({"_init_args", "from_data", "logger"})
+# Links that point outside of the node. They are re-pointed into the clone
+# once every node has been copied.
+_CLONE_RELINKED_ATTRS = frozenset({"parent_node", "spec"})
+# Per-tree bookkeeping and caches that must not follow a node into its clone.
+_CLONE_SKIPPED_ATTRS = frozenset(
+    {
+        "_type_index",
+        "_change_log",
+        "_expression_log",
+        "_variant_of",
+        "_shared_keys",
+        "_fingerprint",
+    }
+)
+# Caches built from a node's subtree. Shallow copies of a node, made by
+# BaseSpecification.variant(), drop them instead of sharing them.
+_SUBTREE_CACHE_ATTRS = frozenset({"_leaf_registry", "_factor_index"})
+_clone_missing = object()
+
+
+class _NodeCloner:
+    """Copies a tree of nodes without recursion and without re-parsing.
+
+    Nodes are created with __new__ and filled through the dict/list base
+    methods, so neither __init__ nor _parse_elems run. Links to parents and
+    to the specification are fixed up in a single pass at the end.
+    """
+
+    def __init__(self, memo: Optional[Dict[int, Any]] = None):
+        self.memo: Dict[int, Any] = {} if memo is None else memo
+        self.to_fill: List[Tuple[Any, Any]] = []
+        self.to_link: List[Tuple["Node", "Node", Optional["Node"]]] = []
+
+    def clone(self, value: Any) -> Any:
+        # Nodes reached through copy.deepcopy while this runs (e.g. inside a
+        # non-node container) are handed back to this cloner.
+        self.memo[_ACTIVE_CLONER_KEY] = self
+        try:
+            rval = self._copy(value, None)
+            while self.to_fill:
+                self._fill(*self.to_fill.pop())
+            self._link()
+        finally:
+            del self.memo[_ACTIVE_CLONER_KEY]
+        return rval
+
+    def _copy(self, value: Any, container: Optional["Node"]) -> Any:
+        if isinstance(value, _CLONE_SHARED_TYPES):
+            return value
+        found = self.memo.get(id(value), _clone_missing)
+        if found is not _clone_missing:
+            return found
+
+        cls = value.__class__
+        if isinstance(value, Node):
+            new = cls.__new__(cls)
+            self.to_link.append((value, new, container))
+        elif cls is list or cls is dict:
+            new = cls()
+        elif cls is tuple or cls is set or cls is frozenset:
+            # Elements of these are (almost) always immutable leaves.
+            new = cls(self._copy(v, container) for v in value)
+            self.memo[id(value)] = new
+            return new
+        else:
+            return copy.deepcopy(value, self.memo)
+
+        self.memo[id(value)] = new
+        self.to_fill.append((value, new))
+        return new
+
+    def _fill(self, orig: Any, new: Any):
+        if isinstance(orig, Node):
+            container = new
+            state = new.__dict__
+            for k, v in orig.__dict__.items():
+                if k in _CLONE_SKIPPED_ATTRS:
+                    continue
+                if k in _CLONE_SHARED_ATTRS or k in _CLONE_RELINKED_ATTRS:
+                    state[k] = v
+                else:
+                    state[k] = self._copy(v, None)
+        else:
+            container = None
+        if isinstance(orig, dict):
+            dict.update(
+                new,
+                ((k, self._copy(v, container)) for k, v in dict.items(orig)),
+            )
+        else:
+            list.extend(
+                new, [self._copy(v, container) for v in list.__iter__(orig)]
+            )
+
+    def _link(self):
+        memo = self.memo
+        for orig, new, container in self.to_link:
+            state = orig.__dict__
+            parent = state.get("parent_node", None)
+            if parent is not None:
+                if container is not None:
+                    parent = memo.get(id(parent), container)
+                else:
+                    parent = memo.get(id(parent), parent)
+            spec = state.get("spec", None)
+            object.__setattr__(new, "parent_node", parent)
+            object.__setattr__(new, "spec", memo.get(id(spec), spec))
+
+
+_ACTIVE_CLONER_KEY = id(_NodeCloner)
+
+
+class TypeIndex:
+    """Index of the nodes under a root node, grouped by exact type.
+
+    The index is kept up to date by the mutating methods of DictNode and
+    ListNode. Each indexed node counts the references held to it by indexed
+    parents; a subtree leaves the index when its last reference is removed.
+    Node.get_nodes_of_type() answers from the index when the node it is
+    called on is indexed, and returns nodes in the same order as a traversal.
+
+    Each node is given a range of integers in pre-order, starting with its
+    own number and holding the ranges of its subnodes, with room left for
+    nodes added later. A traversal finds a node while visiting its parent,
+    so the nodes of each type are kept sorted by the number of their parent
+    and then their own number, and the nodes under any indexed node are a
+    slice of that list.
+    """
+
+    # Bits in the range given to the root. Doubled if ranges run out.
+    _ROOT_BITS = 256
+
+    def __init__(self, root: "Node"):
+        self.root = root
+        self.nodes: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        # type -> sorted [(number of parent, number, id(node))]
+        self.by_type: Dict[Type, List[Tuple[int, int, int]]] = {}
+        # id(node) -> {id(parent): number of references from that parent}
+        self.parents: Dict[int, Dict[int, int]] = {}
+        # id(node) -> (number, end of the range of its subtree)
+        self.ranges: Dict[int, Tuple[int, int]] = {}
+        # id(node) -> (id of the parent it was numbered under, its entry in
+        # by_type, its type)
+        self.entries: Dict[int, Tuple[Optional[int], Tuple[int, int, int], Type]] = {}
+        # Nodes referenced more than once. A traversal finds them through the
+        # first parent it visits, so the index does not answer queries while
+        # there are any.
+        self.shared: Set[int] = set()
+        self._stale = False
+        self._bits = self._ROOT_BITS
+        self._matching_types: Dict[Any, List[Type]] = {}
+        # Expressions may be parsed from several threads
+        self._lock = threading.RLock()
+        self.add(None, [root])
+        self._renumber()
+
+    def __contains__(self, node: "Node") -> bool:
+        return isinstance(node, Node) and self.nodes.get(id(node), None) is node
+
+    def add(self, parent: Optional["Node"], children: Iterable[Any]):
+        """Index children added to parent, along with their subtrees."""
+        stack = [(c, parent) for c in children if isinstance(c, Node)]
+        while stack:
+            node, parent = stack.pop()
+            nid = id(node)
+            if self.nodes.get(nid, None) is not node:
+                self.nodes[nid] = node
+                self.parents[nid] = {}
+                if type(node) not in self.by_type:
+                    self.by_type[type(node)] = []
+                    self._matching_types.clear()
+                object.__setattr__(node, "_type_index", self)
+                stack.extend((c, node) for _, c in node.items() if isinstance(c, Node))
+            if parent is not None:
+                counts = self.parents[nid]
+                counts[id(parent)] = counts.get(id(parent), 0) + 1
+                if sum(counts.values()) > 1:
+                    self.shared.add(nid)
+
+    def remove(self, parent: "Node", children: Iterable[Any]):
+        """Drop references from parent to children. Subtrees that are no
+        longer referenced by any indexed node leave the index."""
+        stack = [(c, parent) for c in children if isinstance(c, Node)]
+        while stack:
+            node, parent = stack.pop()
+            nid = id(node)
+            if self.nodes.get(nid, None) is not node:
+                continue
+            counts = self.parents[nid]
+            pid = id(parent)
+            if counts.get(pid, 0) > 1:
+                counts[pid] -= 1
+            else:
+                counts.pop(pid, None)
+                if self.entries.get(nid, (None,))[0] == pid:
+                    self._stale = True  # Numbered under a parent it left
+            if sum(counts.values()) <= 1 and nid in self.shared:
+                self.shared.discard(nid)
+                self._stale = True  # May have been numbered under either parent
+            if counts or node is self.root:
+                continue
+            del self.nodes[nid]
+            del self.parents[nid]
+            self.ranges.pop(nid, None)
+            self._drop_entry(nid)
+            if node._type_index is self:
+                object.__setattr__(node, "_type_index", None)
+            stack.extend((c, node) for _, c in node.items() if isinstance(c, Node))
+
+    def update(self, parent: "Node", removed: Iterable[Any], added: Iterable[Any]):
+        """Record that parent was changed. Additions are indexed before
+        removals so that moving a node within parent keeps its subtree."""
+        with self._lock:
+            self.add(parent, added)
+            self.remove(parent, removed)
+            if parent in self and not self._number_children(parent):
+                self._stale = True  # Numbered again with larger ranges
+
+    def clear(self):
+        """Detach every node from this index."""
+        for node in list(self.nodes.values()):
+            if node._type_index is self:
+                object.__setattr__(node, "_type_index", None)
+        self.nodes.clear()
+        self.by_type.clear()
+        self.parents.clear()
+        self.ranges.clear()
+        self.entries.clear()
+        self.shared.clear()
+        self._matching_types.clear()
+
+    def _types_matching(self, node_type: Any) -> Optional[List[Type]]:
+        found = self._matching_types.get(node_type, None)
+        if found is None:
+            types = node_type if isinstance(node_type, tuple) else (node_type,)
+            if not all(is_subclass(t, Node) for t in types):
+                return None
+            found = [t for t in self.by_type if issubclass(t, node_type)]
+            self._matching_types[node_type] = found
+        return found
+
+    def _drop_entry(self, nid: int):
+        found = self.entries.pop(nid, None)
+        if found is not None:
+            _, entry, t = found
+            entries = self.by_type[t]
+            del entries[bisect.bisect_left(entries, entry)]
+
+    def _number(
+        self, node: "Node", parent: Optional["Node"], start: int, end: int
+    ) -> bool:
+        """Number node and the nodes under it within [start, end). Returns
+        False if the range is too small."""
+        seen, numbered = set(), {}
+        stack = [(node, parent, start, end)]
+        try:
+            while stack:
+                node, parent, start, end = stack.pop()
+                if id(node) in seen:  # Reference cycle
+                    continue
+                if end <= start:
+                    return False
+                seen.add(id(node))
+                pid = None if parent is None else id(parent)
+                entry = (-1 if pid is None else self.ranges[pid][0], start, id(node))
+                self._drop_entry(id(node))
+                numbered.setdefault(type(node), []).append(entry)
+                self.entries[id(node)] = (pid, entry, type(node))
+                self.ranges[id(node)] = (start, end)
+                # Each subnode takes half of its share, leaving the rest free
+                # for nodes inserted after it
+                children = [c for _, c in node.items() if c in self]
+                if children:
+                    width = (end - start - 1) // len(children)
+                    for i, c in enumerate(children):
+                        first = start + 1 + i * width
+                        stack.append((c, node, first, first + width // 2))
+            return True
+        finally:
+            for t, entries in numbered.items():
+                self.by_type[t].extend(entries)
+                self.by_type[t].sort()
+
+    def _number_new(
+        self, parent: "Node", children: List["Node"], start: int, end: int
+    ) -> bool:
+        """Number children, new subnodes of parent, within [start, end).
+        Half a range is left free on each side for later insertions."""
+        width = (end - start) // (len(children) + 1)
+        start += width // 2
+        return all(
+            self._number(c, parent, start + i * width, start + (i + 1) * width)
+            for i, c in enumerate(children)
+        )
+
+    def _number_children(self, parent: "Node") -> bool:
+        """Number the subnodes of parent that are new or out of order.
+        Returns False if the range of parent is too small."""
+        pid = id(parent)
+        if pid not in self.ranges:
+            return False
+        start, end = self.ranges[pid]
+        first, new = start + 1, []
+        for _, c in parent.items():
+            if c not in self:
+                continue
+            found = self.entries.get(id(c), None)
+            if found is None or found[0] != pid:
+                new.append(c)
+                continue
+            # Children not numbered yet go between the previous and this one
+            c_start, c_end = self.ranges[id(c)]
+            if c_start < first or c_end > end:
+                break
+            if new and not self._number_new(parent, new, first, c_start):
+                break
+            first, new = c_end, []
+        else:
+            if not new or self._number_new(parent, new, first, end):
+                return True
+        # Out of order or out of room. Number every subnode of parent again.
+        parent_id = self.entries[pid][0]
+        grandparent = None if parent_id is None else self.nodes.get(parent_id, None)
+        return self._number(parent, grandparent, start, end)
+
+    def _renumber(self):
+        for entries in self.by_type.values():
+            entries.clear()
+        self.entries.clear()
+        self.ranges.clear()
+        while not self._number(self.root, None, 0, 1 << self._bits):
+            self._bits *= 2
+        self._stale = False
+
+    def nodes_of_type(self, root: "Node", node_type: Any) -> Optional[List["Node"]]:
+        """Return the nodes of the given type under root in traversal order,
+        or None if the index can not answer the query."""
+        with self._lock:
+            types = self._types_matching(node_type)
+            if types is None or root not in self or self.shared:
+                return None
+            if self._stale:
+                self._renumber()
+            start, end = self.ranges[id(root)]
+            found = []
+            for t in types:
+                entries = self.by_type[t]
+                lo = bisect.bisect_left(entries, (start,))
+                hi = bisect.bisect_left(entries, (end,))
+                if lo < hi:
+                    found.append(entries[lo:hi])
+            merged = found[0] if len(found) == 1 else list(heapq.merge(*found))
+            nodes = [self.nodes.get(entry[2], None) for entry in merged]
+        return [n for n in nodes if n is not None]
+
+
+class Visitor:
+    """
+    Functions applied to nodes by Node.traverse().
+
+    Attributes:
+        pre (Callable): Called on each node before its subnodes.
+        post (Callable): Called on each node after its subnodes.
+        prune (Callable): If it returns True for a node, the subnodes of that
+            node are not visited by this visitor. The node itself is.
+    """
+
+    __slots__ = ("pre", "post", "prune")
+
+    def __init__(
+        self,
+        pre: Optional[Callable[["Node"], Any]] = None,
+        post: Optional[Callable[["Node"], Any]] = None,
+        prune: Optional[Callable[["Node"], bool]] = None,
+    ):
+        self.pre = pre
+        self.post = post
+        self.prune = prune
+
+
+class _ClassLogger:
+    """Gives each Node class one logger, named after the class."""
+
+    def __init__(self):
+        self._loggers: Dict[Type, logging.Logger] = {}
+
+    def __get__(self, obj: Any, cls: Type) -> logging.Logger:
+        logger = self._loggers.get(cls, None)
+        if logger is None:
+            logger = self._loggers[cls] = logging.getLogger(cls.__name__)
+        return logger
+
 
 class Node(ABC):
     """
@@ -251,7 +864,8 @@ class Node(ABC):
     Attributes:
         parent_node (Node): The parent node of the current node.
         spec (Specification): The global specification object.
-        _init_args (Tuple): The arguments and keyword arguments used to initialize the node.
+        _init_args (Tuple): The arguments and keyword arguments used to initialize the node. Only kept if keep_init_data() is enabled.
+        from_data (List): For ListNodes, the items the node was initialized with. Only kept if keep_init_data() is enabled.
         __currently_parsing_index (Union[int, str]): The index or key currently being parsed.
         logger (Logger): The logger object for the node's class.
         _default_parse (bool): Flag indicating whether the node should be parsed using default rules.
@@ -262,7 +876,9 @@ class Node(ABC):
         declare_attrs(cls, *args, **kwargs): Initialize the attributes of this node.
         reset_processor_elems(cls, processor): Reset the processor elements.
         recognize_all(cls, recognize_all): Set whether all attributes under this node should be recognized.
+        keep_init_data(keep): Set whether nodes keep the data they were initialized with.
         _get_type_specifiers(cls, spec): Get the type specifiers for this node.
+        get_specifier_cache_stats(): Get the hit/miss counters of the type specifier cache.
         _get_all_recognized(self): Check if all attributes under this node are recognized.
         _get_tag(x): Get the tag of a node.
         get_global_spec(): Get the global specification object.
@@ -274,15 +890,43 @@ class Node(ABC):
         _parse_elem(self, key, check, value_override): Parse an element of the node.
     """
 
+    _type_index: Optional[TypeIndex] = None
+    # Set on nodes parsed while tracking changes. See ExpressionLog.
+    _change_log = None
+    # Defaults shared by all instances. Instances only store what differs.
+    logger = _ClassLogger()
+    _default_parse: bool = False
+    _init_args: Optional[Tuple] = None
+    from_data: Optional[List] = None
+    __currently_parsing_index: Union[int, str, None] = None
+    # Initialization data used to be kept so its ids were not reused. The
+    # only id()-keyed set that outlives the objects it sees is parsed_ids in
+    # parse_expressions(), which holds ids of values in the tree when they
+    # were recorded. Values checked against it were in the tree, and alive,
+    # before the parse started, so they can not share an id with a value
+    # recorded in the same parse, whether or not init data is kept.
+    _keep_init_data: bool = False
+    # Memoized by fingerprint() and cleared when the node's items change
+    _fingerprint: Optional[str] = None
+    # Set once any fingerprint is taken. Until then, changes skip clearing.
+    _fingerprints_taken: bool = False
+
     def __init__(self, *args, **kwargs):
         self.parent_node: Node = None
         self.spec: "Specification" = Node.get_global_spec()
-        # Keep in memory such that the ID is not reused.
-        self._init_args: Tuple = (args, kwargs)
-        self.__currently_parsing_index: Union[int, str] = None
-        self.logger = logging.getLogger(self.__class__.__name__)
-        self._default_parse = False
-        self.from_data = None
+        if Node._keep_init_data:
+            self._init_args = (args, kwargs)
+
+    @staticmethod
+    def keep_init_data(keep: bool = True):
+        """
+        Set whether nodes keep the data they were initialized with in
+        _init_args and from_data. Off by default to save memory.
+
+        Args:
+            keep (bool): Whether new nodes keep their initialization data.
+        """
+        Node._keep_init_data = keep
 
     @classmethod
     def get_specifiers_from_processors(cls, spec: "BaseSpecification"):
@@ -308,6 +952,7 @@ class Node(ABC):
                 or v.set_from is processor
             ):
                 del d[k]
+                _invalidate_specifier_cache()
 
     @classmethod
     def declare_attrs(cls, *args, **kwargs):
@@ -315,6 +960,7 @@ class Node(ABC):
         setattr(cls, "_param_type_specifiers", {})
         # cls.reset_specifiers_from_processors()
         setattr(cls, "Node_all_recognized", False)
+        _invalidate_specifier_cache()
         cls.add_attr(
             "ignore",
             required_type=None,
@@ -343,6 +989,55 @@ class Node(ABC):
                 f"Call this method on a subclass of Node or DictNode."
             )
         setattr(cls, "Node_all_recognized", recognize_all)
+        _invalidate_specifier_cache()
+
+    @staticmethod
+    def get_specifier_cache_stats() -> Dict[str, int]:
+        """Get the hit/miss counters of the type specifier cache. Hits
+        counted from several threads at once may be missing.
+
+        Returns:
+            Dict[str, int]: Number of hits, misses, cached entries, and the
+            current cache version.
+        """
+        with _specifier_cache_lock:
+            return {
+                **_specifier_cache_stats,
+                "entries": len(_specifier_cache),
+                "version": _specifier_cache_version,
+            }
+
+    @staticmethod
+    def reset_specifier_cache_stats():
+        """Reset the hit/miss counters of the type specifier cache."""
+        with _specifier_cache_lock:
+            _specifier_cache_stats["hits"] = 0
+            _specifier_cache_stats["misses"] = 0
+
+    @classmethod
+    def _get_specifier_cache_entry(
+        cls, spec: "BaseSpecification"
+    ) -> _SpecifierCacheEntry:
+        key = (cls, id(spec))
+        entry = _specifier_cache.get(key, None)
+        if entry is not None and entry.version == _specifier_cache_version:
+            _specifier_cache_stats["hits"] += 1
+            return entry
+        with _specifier_cache_lock:
+            # Another thread may have built it while this one waited
+            entry = _specifier_cache.get(key, None)
+            if entry is not None and entry.version == _specifier_cache_version:
+                _specifier_cache_stats["hits"] += 1
+                return entry
+            _specifier_cache_stats["misses"] += 1
+            entry = _SpecifierCacheEntry(
+                _specifier_cache_version,
+                cls._resolve_type_specifiers(spec),
+                any(getattr(c, "Node_all_recognized", 0) for c in cls.mro()),
+                issubclass(cls, ListNode),
+            )
+            _specifier_cache[key] = entry
+        return entry
 
     @classmethod
     def _get_type_specifiers(
@@ -355,8 +1050,16 @@ class Node(ABC):
             spec (Specification): The global specification object.
 
         Returns:
-            Dict[str, TypeSpecifier]: The type specifiers for this node.
+            Dict[str, TypeSpecifier]: The type specifiers for this node. The
+            returned dictionary is shared with the specifier cache and must
+            not be modified.
         """
+        return cls._get_specifier_cache_entry(spec).specifiers
+
+    @classmethod
+    def _resolve_type_specifiers(
+        cls, spec: "BaseSpecification"
+    ) -> Dict[str, TypeSpecifier]:
         classname = cls.__name__
         if not hasattr(cls, "_param_type_specifiers"):
             raise AttributeError(
@@ -372,10 +1075,7 @@ class Node(ABC):
         return rval
 
     def _get_all_recognized(self):
-        def recognized(x):
-            return getattr(x, "Node_all_recognized", 0)
-
-        return any([recognized(c) for c in self.__class__.mro()])
+        return self._get_specifier_cache_entry(self.spec).all_recognized
 
     @staticmethod
     def _get_tag(x) -> str:
@@ -396,7 +1096,8 @@ class Node(ABC):
     @staticmethod
     def get_global_spec() -> "BaseSpecification":
         """Get the global specification object."""
-        return _thread_local.top_spec
+        # Not set yet in threads other than the one that imported this module
+        return getattr(_thread_local, "top_spec", None)
 
     @staticmethod
     def set_global_spec(spec: "BaseSpecification"):
@@ -410,34 +1111,15 @@ class Node(ABC):
     def _get_index2checker(
         self, key2elem: Optional[List[Tuple[str, Any]]] = None
     ) -> Dict[Union[str, int], TypeSpecifier]:
-        specifiers = self._get_type_specifiers(self.spec)
+        entry = self._get_specifier_cache_entry(self.spec)
         if key2elem is not None:
-            index2checker = {}
-            for i, (k, v) in enumerate(key2elem):
-                index2checker[i] = specifiers.get(k, None)
-                if index2checker[i] is None:
-                    for s in specifiers.values():
-                        if s.part_name_match and s.name in k:
-                            index2checker[i] = s
-                            break
-            return index2checker
+            return {
+                i: entry.checker_for_key(k) for i, (k, _) in enumerate(key2elem)
+            }
         if isinstance(self, DictNode):
-            index2checker = {k: specifiers.get(k, None) for k in self.keys()}
-            for k, v in index2checker.items():
-                if v is None:
-                    for s in specifiers.values():
-                        if s.part_name_match and s.name in k:
-                            index2checker[k] = s
-                            break
-            return index2checker
+            return {k: entry.checker_for_key(k) for k in self.keys()}
         if isinstance(self, ListNode):
-            checks = {}
-            for k, v in enumerate(self):
-                check = specifiers.get(Node._get_tag(v), None)
-                if check is None:
-                    check = specifiers.get("!" + v.__class__.__name__, None)
-                checks[k] = check
-            return checks
+            return {k: entry.checker_for_elem(v) for k, v in enumerate(self)}
         raise TypeError(
             f"Called _get_index2checker on {self.__class__}"
             f"which is not a DictNode or ListNode."
@@ -539,7 +1221,10 @@ class Node(ABC):
                 ) from exc
         else:
             self[key] = v
-        self.__currently_parsing_index = None
+            if isinstance(v, Node):
+                v.parent_node = self
+        # Fall back to the class default rather than storing None
+        self.__dict__.pop("_Node__currently_parsing_index", None)
 
     def _parse_elems(self):
         with GrabParentAddMe(self) as parent:
@@ -603,15 +1288,70 @@ class Node(ABC):
             ignore_should_have_been_removed_by (bool): Flag indicating whether to ignore nodes that should have been removed by a processor.
 
         Raises:
-            ParseError: If an unrecognized key is found.
+            ParseError: If an unrecognized key is found. All nodes are checked
+                in one pass. The error from the first failing node is raised,
+                and any other errors are listed in its message.
         """
-        self.recursive_apply(
-            lambda x: x._check_unrecognized(
-                ignore_empty, ignore_should_have_been_removed_by
-            ),
-            self_first=True,
+        _raise_errors(
+            self._collect_errors(ignore_empty, ignore_should_have_been_removed_by)
         )
 
+    def _collect_errors(
+        self,
+        ignore_empty: bool = False,
+        ignore_should_have_been_removed_by=False,
+        visitors: Iterable[Visitor] = (),
+    ) -> List[Exception]:
+        # Other visitors given are run in the same walk
+        errors = []
+
+        def check(node: Node):
+            errors.extend(
+                node._check_unrecognized(
+                    ignore_empty, ignore_should_have_been_removed_by
+                )
+            )
+
+        self.traverse(Visitor(pre=check), *visitors)
+        return errors
+
+    def traverse(self, *visitors: Visitor):
+        """Visit this node and all subnodes, depth first, with an explicit
+        stack. Several visitors share one walk. Each visitor visits each node
+        at most once.
+
+        Args:
+            visitors (Visitor): The visitors.
+        """
+        self._traverse(visitors, [set() for _ in visitors])
+
+    def _traverse(self, visitors: Sequence[Visitor], visited: List[Set[int]]):
+        # Entries are (node, indices of the visitors visiting it, post-order)
+        stack = [(self, tuple(range(len(visitors))), False)]
+        while stack:
+            node, active, post = stack.pop()
+            if post:
+                for i in active:
+                    if visitors[i].post is not None:
+                        visitors[i].post(node)
+                continue
+            active = tuple(i for i in active if id(node) not in visited[i])
+            if not active:
+                continue
+            for i in active:
+                visited[i].add(id(node))
+                if visitors[i].pre is not None:
+                    visitors[i].pre(node)
+            stack.append((node, active, True))
+            descend = tuple(
+                i
+                for i in active
+                if visitors[i].prune is None or not visitors[i].prune(node)
+            )
+            if descend:
+                children = [v for _, v in node.items() if isinstance(v, Node)]
+                stack.extend((c, descend, False) for c in reversed(children))
+
     def recursive_apply(
         self, func: callable, self_first: bool = False, applied_to: set = None
     ) -> Any:
@@ -629,15 +1369,16 @@ class Node(ABC):
             applied_to = set()
         if id(self) in applied_to:
             return self
-        applied_to.add(id(self))
-        if self_first:
-            rval = func(self)
-        for _, v in self.items():
-            if isinstance(v, Node):
-                v.recursive_apply(func, self_first, applied_to)
-        if self_first:
-            return rval
-        return func(self)
+        rval = []
+
+        def apply(x: Node):
+            r = func(x)
+            if x is self:
+                rval.append(r)
+
+        visitor = Visitor(pre=apply) if self_first else Visitor(post=apply)
+        self._traverse([visitor], [applied_to])
+        return rval[0]
 
     def clean_empties(self):
         """Remove empty nodes from this node and all subnodes."""
@@ -733,6 +1474,7 @@ class Node(ABC):
             else cls._param_type_specifiers
         )
         add_checker_to[key_or_tag] = checker
+        _invalidate_specifier_cache()
 
         def assert_key(self):
             if key_or_tag not in self:
@@ -741,8 +1483,13 @@ class Node(ABC):
         if is_subclass(cls, DictNode):
 
             def getter(self):
-                assert_key(self)
-                return self[key_or_tag]
+                try:
+                    value = dict.__getitem__(self, key_or_tag)
+                except KeyError:
+                    assert_key(self)
+                    raise
+                self._check_alias(key_or_tag)
+                return value
 
             def setter(self, value):
                 self[key_or_tag] = value
@@ -758,32 +1505,27 @@ class Node(ABC):
 
     def _check_unrecognized(
         self, ignore_empty=False, ignore_should_have_been_removed_by=False
-    ):
-        if self._get_all_recognized():
-            return
-        if isinstance(self, ListNode) and not self._get_type_specifiers(self.spec):
-            return
+    ) -> List[Exception]:
+        """Check the keys and types of this node. Returns the errors found."""
+        entry = self._get_specifier_cache_entry(self.spec)
+        if entry.skip_check_unrecognized:
+            return []
 
         classname = self.__class__.__name__
-        if isinstance(self, DictNode):
-            name = f"dict {classname} {self.get_name()}"
-            keytag = "key"
-        else:
-            name = f"list {classname} {self.get_name()}"
-            keytag = "tag"
-
-        recognized = self._get_type_specifiers(self.spec)
-        checks = self._get_index2checker()
-        rkeys = list(recognized.keys())
+        is_dict = isinstance(self, DictNode)
+        keytag = "key" if is_dict else "tag"
 
-        if len(rkeys) == 1 and rkeys[0] == "ignore":
-            return
+        def name():
+            kind = "dict" if is_dict else "list"
+            return f"{kind} {classname} {self.get_name()}"
 
-        for k, v in checks.items():
+        recognized = entry.specifiers
+        errors = []
+        for k, v in self._get_index2checker().items():
             if ignore_empty and (self[k] is None or isempty(self[k])):
                 continue
 
-            if v is None and isinstance(self, ListNode):
+            if v is None and not is_dict:
                 v = recognized.get("!" + self[k].__class__.__name__, None)
 
             if v is None:
@@ -795,15 +1537,22 @@ class Node(ABC):
                     tag_str = f"'{t}'"
                 else:
                     tag_str = f"'{t}' {tag_clarif}"
-                raise ParseError(
-                    f"Unrecognized {keytag} {tag_str} in {name}{idxstr}.  "
-                    f"Recognized {keytag}s: {list(recognized.keys())}. If "
-                    f"this {keytag} SHOULD have been recognized but was not, "
-                    f"ensure that it is specified in {classname}.declare_attrs() "
-                    f"and that declare_attrs is called before instantiation of "
-                    f"{classname}."
+                errors.append(
+                    ParseError(
+                        f"Unrecognized {keytag} {tag_str} in {name()}{idxstr}.  "
+                        f"Recognized {keytag}s: {list(recognized.keys())}. If "
+                        f"this {keytag} SHOULD have been recognized but was not, "
+                        f"ensure that it is specified in {classname}.declare_attrs() "
+                        f"and that declare_attrs is called before instantiation of "
+                        f"{classname}."
+                    )
                 )
-            v.check_type(self[k], self, k)
+                continue
+            try:
+                v.check_type(self[k], self, k)
+            except Exception as exc:
+                errors.append(exc)
+                continue
             if (
                 v.should_have_been_removed_by is not None
                 and not ignore_should_have_been_removed_by
@@ -811,8 +1560,9 @@ class Node(ABC):
                 from .processor import ProcessorError
 
                 key = Node._get_tag(self[k]) if keytag == "tag" else k
-                s = f'Found {keytag} "{key}" in {name}[{k}].'
-                raise ProcessorError(f"{s} {v.removed_by_str()}")
+                msg = f'Found {keytag} "{key}" in {name()}[{k}].'
+                errors.append(ProcessorError(f"{msg} {v.removed_by_str()}"))
+        return errors
 
     def get_nodes_of_type(self, node_type: Type[T]) -> List[T]:
         """Return a list of all subnodes of a given type.
@@ -823,6 +1573,17 @@ class Node(ABC):
         Returns:
             A list of all subnodes of the given type.
         """
+        index = self._type_index
+        if index is not None:
+            found = index.nodes_of_type(self, node_type)
+            if found is not None:
+                self.logger.debug(
+                    "Found %d nodes of type %s in index.", len(found), node_type
+                )
+                return found
+        return self._search_nodes_of_type(node_type)
+
+    def _search_nodes_of_type(self, node_type: Type[T]) -> List[T]:
         found = []
         found_ids = set()
 
@@ -1066,38 +1827,50 @@ class Node(ABC):
             parsed_ids: A set of IDs of nodes that have already been parsed.
             callfunc: A function to call on each node after parsing.
         """
-        if symbol_table is None:
-            symbol_table = {}
         parsed_ids = parsed_ids or set()
 
-        n_symbol_table = symbol_table.copy()
+        n_symbol_table = SymbolTable.child_of(symbol_table)
         n_symbol_table["parent_node"] = self
+        if n_symbol_table.log is not None:
+            n_symbol_table.log.add_scope(self, n_symbol_table)
         index2checker = self._get_index2checker()
-        for i, x in self.items():
-            checker = index2checker[i]
-            was_str = isinstance(x, str)
-            if isinstance(x, Node) and id(x) not in parsed_ids:
-                x.parse_expressions(n_symbol_table, parsed_ids)
-            elif isinstance(x, str) and id(x) not in parsed_ids:
-                self._parse_expression(i, n_symbol_table, index2checker.get(i, None))
-            if checker:
-                if was_str:
-                    try:
-                        self[i] = checker.cast_check_type(self[i], self, i)
-                    except Exception as exc:
-                        raise TypeError(
-                            f'Could not parse expression "{self[i]}" in '
-                            f'"{self.get_name()}[{i}]". {exc}'
-                        ) from exc
-                else:
-                    checker.check_type(self[i], self, i)
-            parsed_ids.add(id(self[i]))
-            if callfunc is not None:
-                self[i] = callfunc(self[i], n_symbol_table)
+        for i, _ in self.items():
+            self._parse_item(i, index2checker[i], n_symbol_table, parsed_ids, callfunc)
             if isinstance(self, DictNode):
-                n_symbol_table[i] = self[i]
+                n_symbol_table.mirror(self, i)
         return n_symbol_table
 
+    def _parse_item(
+        self,
+        i: Union[str, int],
+        checker: Optional[TypeSpecifier],
+        symbol_table: Dict[str, Any],
+        parsed_ids: set,
+        callfunc: Optional[Callable] = None,
+    ):
+        """Parse expressions in one item of this node and check its type."""
+        x = self[i]
+        was_str = isinstance(x, str)
+        if isinstance(x, Node) and id(x) not in parsed_ids:
+            x.parse_expressions(symbol_table, parsed_ids)
+        elif isinstance(x, str) and id(x) not in parsed_ids:
+            self._parse_expression(i, symbol_table, checker)
+        if checker:
+            if was_str:
+                try:
+                    self[i] = checker.cast_check_type(self[i], self, i)
+                except Exception as exc:
+                    raise TypeError(
+                        f'Could not parse expression "{self[i]}" in '
+                        f'"{self.get_name()}[{i}]". {exc}'
+                    ) from exc
+            else:
+                checker.check_type(self[i], self, i)
+        if callfunc is not None:
+            self[i] = callfunc(self[i], symbol_table)
+        # Recorded after the last change, so the value stays in the tree
+        parsed_ids.add(id(self[i]))
+
     def _parse_expression(
         self,
         index: Union[str, int],
@@ -1125,18 +1898,101 @@ class Node(ABC):
             parse = True
 
         if parse:
-            v = parse_expression_for_arithmetic(
+            expression = v
+            v = expression_cache.evaluate(
                 v, symbol_table, f"{self.get_name()}[{index}]"
             )
             if checker is not None:
                 v = checker.cast_check_type(v, self, index)
             self[index] = v
+            log = getattr(symbol_table, "log", None)
+            if log is not None:
+                log.add_expression(self, index, expression, checker, symbol_table)
 
     @classmethod
     def unique_class_name(cls):
         """Return a unique name for this class."""
         return ".".join(c.__name__ for c in cls.mro()[::-1])
 
+    def clone(self: T, memo: Optional[Dict[int, Any]] = None) -> T:
+        """
+        Return a copy of this node and all nodes under it.
+
+        Nodes, lists, and dicts are copied. Strings, numbers, loggers, and
+        the arguments used to construct each node are shared with the
+        original. Copied nodes are not re-parsed. The parent_node and spec
+        of each copied node point into the copy if the original pointed to
+        a node that was copied.
+
+        Args:
+            memo (Optional[Dict[int, Any]]): A copy.deepcopy-style memo.
+                Objects already in the memo are not copied again.
+
+        Returns:
+            Node: The copy.
+        """
+        active = None if memo is None else memo.get(_ACTIVE_CLONER_KEY, None)
+        if active is not None:
+            return active._copy(self, None)
+        return _NodeCloner(memo).clone(self)
+
+    def fingerprint(self) -> str:
+        """
+        Return a hash of the contents of this node and all nodes under it.
+        Nodes of the same class, with the same tag and the same items in the
+        same order, have the same fingerprint. parent_node and spec are not
+        included.
+
+        Fingerprints are computed bottom-up and memoized per node. Changing
+        the items of a node through DictNode or ListNode methods clears the
+        fingerprint of that node and of its parents, found through
+        parent_node. Inserting a node makes the node it is inserted into its
+        parent. A node placed in several parents clears only the last one.
+        Changes inside values that are not nodes are not seen.
+
+        Returns:
+            str: The fingerprint as a hex digest.
+        """
+        if self._fingerprint is not None:
+            return self._fingerprint
+        Node._fingerprints_taken = True
+
+        def compute(node: Node):
+            if node._fingerprint is not None:
+                return
+            h = hashlib.sha256()
+            cls = node.__class__
+            h.update(f"{cls.__module__}.{cls.__qualname__}{node.get_tag()}".encode())
+            for k, v in node.items():
+                if isinstance(v, Node):
+                    # None only if v is a parent of itself
+                    v = v._fingerprint or "cycle"
+                else:
+                    v = _fingerprint_token(v)
+                h.update(f"\0{_fingerprint_token(k)}\0{v}".encode())
+            object.__setattr__(node, "_fingerprint", h.hexdigest())
+
+        self.traverse(
+            Visitor(post=compute, prune=lambda n: n._fingerprint is not None)
+        )
+        return self._fingerprint
+
+    def _clear_fingerprint(self):
+        node, seen = self, set()
+        # A node without a fingerprint may still have parents with one
+        while isinstance(node, Node) and id(node) not in seen:
+            seen.add(id(node))
+            node.__dict__.pop("_fingerprint", None)
+            node = node.__dict__.get("parent_node", None)
+
+    def _adopt(self, value: Any):
+        """Point the parent_node of a node being inserted into this node here."""
+        if isinstance(value, Node) and value is not self:
+            object.__setattr__(value, "parent_node", self)
+
+    def __deepcopy__(self, memo: Dict[int, Any]):
+        return self.clone(memo)
+
 
 class ListNode(Node, list):
     """A node that is a list of other nodes."""
@@ -1154,10 +2010,123 @@ class ListNode(Node, list):
                 raise TypeError(f"ListNode {myname} got a non-list: {a}")
         if kwargs:
             raise TypeError(f"ListNode {myname} got keyword args: {kwargs}")
-        self.from_data = list(self)
+        if Node._keep_init_data:
+            self.from_data = list(self)
         if not __node_skip_parse:
             self._parse_elems()
 
+    # The methods below keep the type index, change log, and fingerprint, if
+    # any, up to date.
+    def __setitem__(self, key: Union[int, slice], value: Any):
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self, key if isinstance(key, int) else None)
+        if isinstance(key, slice):
+            value = list(value)
+            for v in value:
+                self._adopt(v)
+        else:
+            self._adopt(value)
+        index = self._type_index
+        if index is None:
+            return super().__setitem__(key, value)
+        if isinstance(key, slice):
+            removed, added = list.__getitem__(self, key), value
+        else:
+            removed, added = (list.__getitem__(self, key),), (value,)
+        super().__setitem__(key, value)
+        index.update(self, removed, added)
+
+    def __delitem__(self, key: Union[int, slice]):
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        index = self._type_index
+        removed = list.__getitem__(self, key) if index is not None else None
+        super().__delitem__(key)
+        if index is not None:
+            index.update(self, removed if isinstance(key, slice) else (removed,), ())
+
+    def __iadd__(self, other: Iterable[Any]) -> "ListNode":
+        self.extend(other)
+        return self
+
+    def append(self, value: Any):
+        self._adopt(value)
+        super().append(value)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, (), (value,))
+
+    def extend(self, values: Iterable[Any]):
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        values = list(values)
+        for v in values:
+            self._adopt(v)
+        if self._type_index is None:
+            return super().extend(values)
+        super().extend(values)
+        self._type_index.update(self, (), values)
+
+    def insert(self, index: int, value: Any):
+        self._adopt(value)
+        super().insert(index, value)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, (), (value,))
+
+    def pop(self, index: int = -1) -> Any:
+        value = super().pop(index)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, (value,), ())
+        return value
+
+    def remove(self, value: Any):
+        self.pop(self.index(value))
+
+    def clear(self):
+        removed = list(self)
+        super().clear()
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, removed, ())
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, (), ())
+
+    def reverse(self):
+        super().reverse()
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self)
+        if self._type_index is not None:
+            self._type_index.update(self, (), ())
+
 
 class CombinableListNode(ListNode):
     """A list node that can be combined with others by extending."""
@@ -1279,6 +2248,12 @@ class DictNode(Node, dict):
         cls,
         *files: Union[str, List[str]],
         jinja_parse_data: Dict[str, Any] = None,
+        cache_dir: Optional[str] = None,
+        parallel: bool = False,
+        max_workers: Optional[int] = None,
+        use_processes: bool = False,
+        manifest: Optional[str] = None,
+        jinja_bytecode_dir: Optional[str] = None,
         **kwargs,
     ) -> "DictNode":
         """
@@ -1291,6 +2266,12 @@ class DictNode(Node, dict):
         Args:
             files: A list of yaml files to load.
             jinja_parse_data: A dictionary of data to use when parsing
+            cache_dir: A directory to cache loaded files in. See YamlCache.
+            parallel: Read and parse files concurrently. They are combined in the given order, as when loading serially.
+            max_workers: The number of workers used if parallel is True.
+            use_processes: Load files in worker processes rather than threads. Faster if Jinja rendering and YAML parsing dominate rather than reading.
+            manifest: A file recording the files the glob patterns resolved to. Later loads with the same patterns reuse it while the files and searched directories are unmodified. See resolve_yaml_files.
+            jinja_bytecode_dir: A directory to keep compiled Jinja templates in, so other processes may reuse them. Templates are always cached in memory. See JinjaCache.
             kwargs: Extra keyword arguments to add to the dictionary.
 
         Returns:
@@ -1316,20 +2297,11 @@ class DictNode(Node, dict):
                     f = str(f)
                 allfiles.append(f)
         files = allfiles
+        cache = YamlCache(cache_dir) if cache_dir is not None else None
         rval = {}
         key2file = {}
         extra_elems = []
-        to_parse = []
-        for f in files:
-            logging.info("Loading yaml file %s", f)
-            globbed = [x for x in glob.glob(f) if os.path.isfile(x)]
-            if not globbed:
-                raise FileNotFoundError(f"Could not find file {f}")
-            for g in globbed:
-                if any(os.path.samefile(g, x) for x in to_parse):
-                    logging.info('Ignoring duplicate file "%s" in yaml load', g)
-                else:
-                    to_parse.append(g)
+        to_parse = resolve_yaml_files(files, manifest)
 
         for f in to_parse:
             if not (
@@ -1339,7 +2311,26 @@ class DictNode(Node, dict):
                     f"File {f} does not end with .yaml, .jinja, or .jinja2. Skipping."
                 )
             logging.info("Loading yaml file %s", f)
-            loaded = yaml.load_yaml(f, data=jinja_parse_data)
+        start_time = time.time()
+        jinja_stats = dict(jinja_cache.stats)
+        all_loaded = load_yaml_files(
+            to_parse,
+            jinja_parse_data,
+            cache,
+            parallel,
+            max_workers,
+            use_processes,
+            jinja_bytecode_dir,
+        )
+        logging.info(
+            "Loaded %d yaml files in %.2f seconds",
+            len(to_parse),
+            time.time() - start_time,
+        )
+        jinja_cache.log_stats(since=jinja_stats)
+
+        # Combine in the given order
+        for f, loaded in zip(to_parse, all_loaded):
             if not isinstance(loaded, dict):
                 raise TypeError(
                     f"Expected a dictionary from file {f}, got {type(loaded)}"
@@ -1353,6 +2344,9 @@ class DictNode(Node, dict):
                     key2file[k] = f
                     rval[k] = v
 
+        if cache is not None:
+            cache.log_stats()
+
         c = cls(**rval, **kwargs)
         logging.info(
             "Parsing extra attributes %s", ", ".join([x[0] for x in extra_elems])
@@ -1363,30 +2357,40 @@ class DictNode(Node, dict):
     def _check_alias(self, key) -> None:
         if not isinstance(key, str):
             return
-        aliases_with = None
-        if "_" in key and key.replace("_", "-") in self:
-            aliases_with = key.replace("_", "-")
-        if "-" in key and key.replace("-", "_") in self:
-            aliases_with = key.replace("-", "_")
-        if "-" in key:
-            for k in self._get_index2checker().keys():
-                if k == key.replace("-", "_"):
-                    aliases_with = k
-                    break
-
-        if aliases_with is not None:
-            raise KeyError(
-                f'Key "{key}" is an alias for "{aliases_with}" in {self}. '
-                f"Use the alias instead."
-            )
+        for aliases_with in _key_aliases(key):
+            if aliases_with in self:
+                raise KeyError(
+                    f'Key "{key}" is an alias for "{aliases_with}" in {self}. '
+                    f"Use the alias instead."
+                )
 
     def __getitem__(self, __key: Any) -> Any:
         self._check_alias(__key)
-        return super().__getitem__(__key)
+        return dict.__getitem__(self, __key)
 
     def __setitem__(self, __key: Any, __value: Any) -> None:
         self._check_alias(__key)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self, __key)
+        self._adopt(__value)
+        index = self._type_index
+        if index is None:
+            return super().__setitem__(__key, __value)
+        removed = dict.get(self, __key, None)
         super().__setitem__(__key, __value)
+        index.update(self, (removed,), (__value,))
+
+    def __delitem__(self, __key: Any) -> None:
+        removed = dict.get(self, __key, None)
+        super().__delitem__(__key)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self, __key)
+        if self._type_index is not None:
+            self._type_index.update(self, (removed,), ())
 
     def get(self, __key: Any, __default: Any = None) -> Any:
         """
@@ -1400,20 +2404,83 @@ class DictNode(Node, dict):
         Sets the default value for a key.
         """
         self._check_alias(__key)
-        return super().setdefault(__key, __default)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None and __key not in self:
+            self._change_log.changed(self, __key)
+        if __key not in self:
+            self._adopt(__default)
+        if self._type_index is None or __key in self:
+            return super().setdefault(__key, __default)
+        super().setdefault(__key, __default)
+        self._type_index.update(self, (), (__default,))
+        return __default
 
     def pop(self, __key: Any, __default: Any = None) -> Any:
         """
         Pops a key from the dictionary.
         """
         self._check_alias(__key)
-        return super().pop(__key, __default)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None and __key in self:
+            self._change_log.changed(self, __key)
+        if self._type_index is None or __key not in self:
+            return super().pop(__key, __default)
+        value = super().pop(__key, __default)
+        self._type_index.update(self, (value,), ())
+        return value
 
-    def check_unrecognized(self, *args, **kwargs) -> None:
+    def popitem(self) -> Tuple[Any, Any]:
         """
-        Check for unrecognized keys in this node and all subnodes.
+        Pops the last inserted key and value from the dictionary.
         """
-        super().check_unrecognized(*args, **kwargs)
+        key, value = super().popitem()
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            self._change_log.changed(self, key)
+        if self._type_index is not None:
+            self._type_index.update(self, (value,), ())
+        return key, value
+
+    def update(self, *args, **kwargs) -> None:
+        """
+        Updates the dictionary with the given keys and values.
+        """
+        new = dict(*args, **kwargs)
+        for v in new.values():
+            self._adopt(v)
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._type_index is None and self._change_log is None:
+            return super().update(new)
+        removed = [dict.get(self, k, None) for k in new]
+        super().update(new)
+        if self._change_log is not None:
+            for k in new:
+                self._change_log.changed(self, k)
+        if self._type_index is not None:
+            self._type_index.update(self, removed, new.values())
+
+    def clear(self) -> None:
+        """
+        Removes all keys from the dictionary.
+        """
+        removed = list(self.values())
+        if self._fingerprints_taken:
+            self._clear_fingerprint()
+        if self._change_log is not None:
+            for k in self:
+                self._change_log.changed(self, k)
+        super().clear()
+        if self._type_index is not None:
+            self._type_index.update(self, removed, ())
+
+    def _collect_errors(self, *args, **kwargs) -> List[Exception]:
+        # The require_one_of and require_all_or_none_of rules are checked for
+        # the node check_unrecognized() was called on.
+        errors = super()._collect_errors(*args, **kwargs)
         checkers = self._get_index2checker()
 
         def check(keys: list, expected: Union[tuple, str], countstr: str):
@@ -1426,21 +2493,25 @@ class DictNode(Node, dict):
             if isinstance(expected, tuple):
                 countmatch = len(found) in expected
             if not countmatch:
-                raise KeyError(
-                    f"Expected {countstr} of {keys} in {self}, "
-                    f"found {len(found)}. Values: "
-                    f'{", ".join([f"{k}: {self[k]}" for k in found])}'
+                errors.append(
+                    KeyError(
+                        f"Expected {countstr} of {keys} in {self}, "
+                        f"found {len(found)}. Values: "
+                        f'{", ".join([f"{k}: {self[k]}" for k in found])}'
+                    )
                 )
 
         for required_one in getattr(self, "_require_one_of", []):
             check(required_one, (1,), "exactly one")
         for required_all in getattr(self, "_require_all_or_none_of", []):
             check(required_all, (0, len(required_all)), "all or none")
+        return errors
 
     def __getattr__(self, name):
         """Index into the attributes or the contents of this node."""
         if name in self:
-            return self[name]
+            self._check_alias(name)
+            return dict.__getitem__(self, name)
         try:
             return super().__getattr__(name)
         except AttributeError:
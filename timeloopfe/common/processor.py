@@ -3,8 +3,9 @@
 from abc import abstractmethod, ABC
 import copy
 import logging
-from .nodes import Node
-from typing import Any, Optional
+from collections.abc import Hashable
+from .nodes import DictNode, Node, _fingerprint_token
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
 
 
 class Processor(ABC):
@@ -13,12 +14,37 @@ class Processor(ABC):
     Attributes:
         spec: The specification to process.
         logger: The logger for this processor.
+        requires: Processors that must run before this one.
+        runs_after: Processors that must run before this one if they run.
+        reads: Top-level keys of the specification this processor reads, or
+            None if it may read any key.
+        writes: Top-level keys of the specification this processor
+            modifies, or None if it may modify any key.
     """
 
+    requires: Tuple[type, ...] = ()
+    runs_after: Tuple[type, ...] = ()
+    reads: Optional[Tuple[str, ...]] = None
+    writes: Optional[Tuple[str, ...]] = None
+
     def __init__(self, spec: Optional["Specification"] = None):
         self._initialized: bool = True
         self.logger = logging.getLogger(self.__class__.__name__)
 
+    def config_key(self) -> Optional[str]:
+        """
+        Identify the configuration of this processor: the attributes it was
+        given beyond the ones every processor has. Returns None if any of
+        them is not a plain value, in which case instances can not be told
+        apart.
+        """
+        state = {
+            k: v for k, v in vars(self).items() if k not in _PROCESSOR_RUNTIME_ATTRS
+        }
+        if not _is_plain(state):
+            return None
+        return _fingerprint_token(state)
+
     def pre_parse_process(self, spec: "Specification"):
         """Process the specification before parsing."""
         self.logger.debug(f"Pre-parse processing with {self}")
@@ -68,6 +94,30 @@ class Processor(ABC):
                 f"before {self.__class__.__name__} in the spec."
             )
 
+    @staticmethod
+    def index_by_name(root: Node, key: str) -> Dict[Any, DictNode]:
+        """
+        Index the dictionaries under root that have a given key by their
+        names. If several share a name, the first one found is indexed.
+        Names that can not be dictionary keys, such as lists, match nothing
+        and are skipped.
+
+        Args:
+            root (Node): The node to search.
+            key (str): The key the dictionaries must have.
+
+        Returns:
+            Dict[Any, DictNode]: The dictionaries by name.
+        """
+        index = {}
+        for n in root.get_nodes_of_type(DictNode):
+            name = n.get("name", None)
+            if name is None or not isinstance(name, Hashable):
+                continue
+            if name not in index and key in n:
+                index[name] = n
+        return index
+
     def add_attr(self, target: Node, *args, **kwargs):
         # ensure target is a class
         if not isinstance(target, type):
@@ -137,7 +187,7 @@ class References2CopiesProcessor(Processor):
             n.parent_node = None
 
         if id(n) in seen_ids:
-            n = copy.deepcopy(n)
+            n = n.clone() if isinstance(n, Node) else copy.deepcopy(n)
         seen_ids.add(id(n))
 
         if not isinstance(n, Node):
@@ -158,3 +208,126 @@ class References2CopiesProcessor(Processor):
 
 class ProcessorError(Exception):
     """Exception raised by processors."""
+
+
+def _processor_class(p: Any) -> type:
+    return p if isinstance(p, type) else type(p)
+
+
+# Attributes every processor sets while initializing or running
+_PROCESSOR_RUNTIME_ATTRS = frozenset({"_initialized", "logger", "spec"})
+
+
+def _is_plain(value: Any) -> bool:
+    if value is None or isinstance(value, (str, int, float, bool, type)):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(_is_plain(v) for v in value)
+    if isinstance(value, dict):
+        return all(_is_plain(k) and _is_plain(v) for k, v in value.items())
+    return False
+
+
+def processor_key(p: Any) -> Optional[Tuple[type, Optional[str]]]:
+    """
+    Identify a processor by its class and configuration. A class is
+    identified by itself. Returns None for instances whose configuration
+    can not be identified. See Processor.config_key().
+    """
+    if isinstance(p, type):
+        return (p, None)
+    config_key = getattr(p, "config_key", None)
+    config = config_key() if config_key is not None else None
+    return None if config is None else (type(p), config)
+
+
+def _share_keys(a: Optional[Sequence[str]], b: Optional[Sequence[str]]) -> bool:
+    if a is None:
+        return b is None or len(b) > 0
+    if b is None:
+        return len(a) > 0
+    return not set(a).isdisjoint(b)
+
+
+def _conflict(a: Any, b: Any) -> bool:
+    """Whether one of two processors may modify keys the other uses."""
+    return (
+        _share_keys(a.writes, b.writes)
+        or _share_keys(a.writes, b.reads)
+        or _share_keys(a.reads, b.writes)
+    )
+
+
+def _has_run(required: type, already_run: Sequence[Any]) -> bool:
+    return any(issubclass(_processor_class(x), required) for x in already_run)
+
+
+def schedule_processors(
+    processors: Sequence[Any], already_run: Sequence[Any] = ()
+) -> List[List[int]]:
+    """
+    Order processors by their requires and runs_after declarations.
+    Processors are otherwise kept in the given order.
+
+    Processors are grouped into levels. A processor only depends on
+    processors in earlier levels, and processors in the same level do not
+    modify keys of the specification that others in the level read or
+    modify, so they may run concurrently.
+
+    Args:
+        processors (Sequence[Any]): Processor classes or instances.
+        already_run (Sequence[Any]): Processors that have already run. These
+            satisfy requirements of processors that are not in processors.
+
+    Returns:
+        List[List[int]]: The levels, as indices into processors.
+
+    Raises:
+        ProcessorError: If a required processor is missing or requirements
+            are circular.
+    """
+    classes = [_processor_class(p) for p in processors]
+    deps: List[Set[int]] = []
+    missing = []
+    for i, p in enumerate(processors):
+        deps.append(set())
+        for r in tuple(p.requires) + tuple(p.runs_after):
+            found = {j for j, c in enumerate(classes) if j != i and issubclass(c, r)}
+            deps[i] |= found
+            if not found and r in p.requires and not _has_run(r, already_run):
+                missing.append((classes[i], r))
+    if missing:
+        raise ProcessorError(
+            "Required processors are missing. "
+            + " ".join(
+                f"{r.__name__} must run before {c.__name__}. Please add "
+                f"{r.__name__} to the list of processors before "
+                f"{c.__name__} in the spec."
+                for c, r in missing
+            )
+        )
+
+    # Stable topological sort. Of the processors whose dependencies have
+    # been placed, the one given first is placed next.
+    order: List[int] = []
+    placed: Set[int] = set()
+    while len(order) < len(processors):
+        ready = [
+            i for i in range(len(processors)) if i not in placed and deps[i] <= placed
+        ]
+        if not ready:
+            names = [c.__name__ for i, c in enumerate(classes) if i not in placed]
+            raise ProcessorError(f"Processors {names} require each other.")
+        order.append(ready[0])
+        placed.add(ready[0])
+
+    level: Dict[int, int] = {}
+    for k, i in enumerate(order):
+        before = deps[i] | {
+            j for j in order[:k] if _conflict(processors[j], processors[i])
+        }
+        level[i] = 1 + max((level[j] for j in before), default=-1)
+    levels: List[List[int]] = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for i in order:
+        levels[level[i]].append(i)
+    return levels
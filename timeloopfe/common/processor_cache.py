@@ -0,0 +1,159 @@
+"""A cache of processor results, used by BaseSpecification.process()."""
+
+from collections import OrderedDict
+import copy
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .nodes import Node
+from .processor import processor_key
+
+# Stands in for the specification in cached nodes, so the cache does not keep
+# specifications alive. Replaced by the specification the nodes are restored
+# into.
+_SPEC = object()
+
+
+def _copy(value: Any, memo: Dict[int, Any]) -> Any:
+    if isinstance(value, Node):
+        return value.clone(memo)
+    return copy.deepcopy(value, memo)
+
+
+class ProcessorCache:
+    """
+    Caches the results of processors.
+
+    Results are keyed by the processor class and configuration, from
+    processor_key(), and fingerprints of the keys of the specification it
+    reads and writes, taken before it runs. On a hit, the keys it writes are
+    replaced by copies of the keys it produced when it last ran on the same
+    inputs, and the processor is not run. Only processors that declare reads
+    and writes, and whose configuration can be identified, are cached. They
+    are assumed to depend on nothing but those keys and their
+    configuration.
+
+    Attributes:
+        enabled (bool): Whether processor results are cached.
+        max_entries (int): The maximum number of results kept.
+        stats (Dict[str, Dict[str, int]]): Hits and misses per processor.
+    """
+
+    def __init__(self, enabled: bool = False, max_entries: int = 64):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def reset_stats(self):
+        """Reset the hit and miss counters."""
+        with self._lock:
+            self.stats = {}
+
+    def clear(self):
+        """Drop all cached results."""
+        with self._lock:
+            self._results.clear()
+
+    def _count(self, p: Any, stat: str):
+        with self._lock:
+            counts = self.stats.setdefault(
+                p.__class__.__name__, {"hits": 0, "misses": 0}
+            )
+            counts[stat] += 1
+
+    def key(self, spec: "BaseSpecification", p: Any) -> Optional[Tuple]:
+        """
+        Return the key of the result of running p on spec, or None if p is not
+        cached.
+
+        Args:
+            spec (BaseSpecification): The specification p runs on.
+            p (Any): The processor.
+
+        Returns:
+            Optional[Tuple]: The key.
+        """
+        if not self.enabled:
+            return None
+        p_key = processor_key(p)
+        fingerprints = spec._processor_input_fingerprints(p)
+        if p_key is None or fingerprints is None:
+            return None
+        return (type(spec), p_key, tuple(sorted(fingerprints.items())))
+
+    def restore(
+        self, spec: "BaseSpecification", p: Any, key: Optional[Tuple]
+    ) -> bool:
+        """
+        Replace the keys p writes with the cached result of running p.
+
+        Args:
+            spec (BaseSpecification): The specification p runs on.
+            p (Any): The processor.
+            key (Optional[Tuple]): The key from key().
+
+        Returns:
+            bool: Whether a result was restored.
+        """
+        if key is None:
+            return False
+        with self._lock:
+            result = self._results.get(key, None)
+            if result is not None:
+                self._results.move_to_end(key)
+        if result is None:
+            self._count(p, "misses")
+            return False
+        for k, v in result.items():
+            spec[k] = _copy(v, {id(_SPEC): spec})
+        self._count(p, "hits")
+        return True
+
+    def store(self, spec: "BaseSpecification", p: Any, key: Optional[Tuple]):
+        """
+        Cache the keys p wrote after running on the inputs key was made from.
+
+        Args:
+            spec (BaseSpecification): The specification p ran on.
+            p (Any): The processor.
+            key (Optional[Tuple]): The key from key(), taken before p ran.
+        """
+        if key is None:
+            return
+        result = {}
+        for k in p.writes:
+            if k in spec:
+                result[k] = _copy(spec[k], {id(spec): _SPEC})
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def log_stats(self, logger, since: Optional[Dict[str, Dict[str, int]]] = None):
+        """
+        Log the hit rate of each processor.
+
+        Args:
+            logger: The logger to log to.
+            since (Optional[Dict[str, Dict[str, int]]]): Earlier stats to
+                subtract.
+        """
+        since = since or {}
+        for name, counts in sorted(self.stats.items()):
+            earlier = since.get(name, {})
+            hits = counts["hits"] - earlier.get("hits", 0)
+            misses = counts["misses"] - earlier.get("misses", 0)
+            if hits + misses:
+                logger.info(
+                    "Processor cache: %s %d/%d hits (%.1f%%)",
+                    name,
+                    hits,
+                    hits + misses,
+                    100 * hits / (hits + misses),
+                )
+
+
+processor_cache = ProcessorCache()
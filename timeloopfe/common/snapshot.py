@@ -0,0 +1,286 @@
+"""Binary snapshots of node trees, used by BaseSpecification.save_snapshot().
+
+Values that are not nodes or strings are stored with pickle, so loading a
+snapshot can run arbitrary code. Only load snapshots from trusted sources.
+"""
+
+from array import array
+import hashlib
+import importlib
+import io
+import json
+import pickle
+import struct
+import sys
+from typing import Any, BinaryIO, Dict, Iterable, List, Tuple, Type
+
+from .nodes import Node, _CLONE_RELINKED_ATTRS, _CLONE_SKIPPED_ATTRS
+from .nodes import _fingerprint_token
+
+SNAPSHOT_MAGIC = b"TLFESNAP"
+# Increment when the layout below changes. Snapshots of other versions are
+# rejected on load.
+SNAPSHOT_VERSION = 2
+_HEADER = struct.Struct(">8sH")
+# Length of the JSON index that follows the header
+_INDEX_LENGTH = struct.Struct(">Q")
+# The tables of node references, in the order they are stored
+_TABLES = (
+    "node_classes",
+    "parents",
+    "child_offsets",
+    "children",
+    "state_offsets",
+    "state",
+)
+
+# Rebuilt by the loader instead of being stored
+_SNAPSHOT_SKIPPED_ATTRS = (
+    _CLONE_SKIPPED_ATTRS | _CLONE_RELINKED_ATTRS | {"_processor_attributes"}
+)
+
+# A value is stored as (index << 2) | kind
+_NODE, _STRING, _OBJECT = 0, 1, 2
+
+
+class SnapshotError(Exception):
+    """Exception for snapshots that can not be saved or loaded."""
+
+
+def _class_schema(cls: Type[Node]) -> str:
+    """Hash the attributes declared by cls, so snapshots made with other
+    declarations are rejected."""
+    specifiers = {}
+    for c in cls.mro()[::-1]:
+        specifiers.update(getattr(c, "_param_type_specifiers", {}))
+    h = hashlib.sha256()
+    for k in sorted(specifiers, key=str):
+        required_type = _fingerprint_token(specifiers[k].required_type)
+        h.update(f"{k!r}:{required_type}\0".encode())
+    return h.hexdigest()
+
+
+def _find_class(module: str, qualname: str) -> Any:
+    x = importlib.import_module(module)
+    for name in qualname.split("."):
+        x = getattr(x, name)
+    return x
+
+
+class _Writer:
+    def __init__(self, root: Node, same_as_root: Iterable[Node]):
+        self.node2index: Dict[int, int] = {id(root): 0}
+        for n in same_as_root:
+            self.node2index[id(n)] = 0
+        self.nodes: List[Node] = [root]
+        # Index of the container each node was first found in
+        self.containers: List[int] = [-1]
+        self.classes: Dict[Type, int] = {}
+        self.strings: Dict[str, int] = {}
+        self.objects: List[Any] = []
+        self.object_ids: Dict[Tuple[type, Any], int] = {}
+
+    def ref(self, value: Any, container: int = -1) -> int:
+        if isinstance(value, Node):
+            index = self.node2index.get(id(value), None)
+            if index is None:
+                index = self.node2index[id(value)] = len(self.nodes)
+                self.nodes.append(value)
+                self.containers.append(container)
+            return index << 2 | _NODE
+        if type(value) is str:
+            index = self.strings.setdefault(value, len(self.strings))
+            return index << 2 | _STRING
+        key = (type(value), value) if isinstance(value, (int, float)) else None
+        index = self.object_ids.get(key, None) if key is not None else None
+        if index is None:
+            index = len(self.objects)
+            self.objects.append(value)
+            if key is not None:
+                self.object_ids[key] = index
+        return index << 2 | _OBJECT
+
+    def class_id(self, cls: Type[Node]) -> int:
+        index = self.classes.get(cls, None)
+        if index is None:
+            try:
+                found = _find_class(cls.__module__, cls.__qualname__)
+            except (AttributeError, ImportError):
+                found = None
+            if found is not cls:
+                raise SnapshotError(
+                    f"Class {cls.__module__}.{cls.__qualname__} can not be "
+                    f"imported by name, so nodes of this class can not be "
+                    f"saved in a snapshot."
+                )
+            index = self.classes[cls] = len(self.classes)
+        return index
+
+    def write(self, f: BinaryIO):
+        node_classes, parents = array("q"), array("q")
+        child_offsets, children = array("q", [0]), array("q")
+        state_offsets, state = array("q", [0]), array("q")
+        # New nodes are appended to self.nodes as they are reached
+        i = 0
+        while i < len(self.nodes):
+            node = self.nodes[i]
+            node_classes.append(self.class_id(node.__class__))
+            if isinstance(node, dict):
+                for k, v in dict.items(node):
+                    children.append(self.ref(k))
+                    children.append(self.ref(v, i))
+            else:
+                children.extend(self.ref(v, i) for v in list.__iter__(node))
+            child_offsets.append(len(children))
+            for k, v in node.__dict__.items():
+                if k not in _SNAPSHOT_SKIPPED_ATTRS:
+                    state.append(self.ref(k))
+                    state.append(self.ref(v))
+            state_offsets.append(len(state))
+            i += 1
+        for node, container in zip(self.nodes, self.containers):
+            parent = node.__dict__.get("parent_node", None)
+            if parent is not None:
+                parent = self.node2index.get(id(parent), container)
+            parents.append(-1 if parent is None else parent)
+
+        # Objects may hold nodes, which are stored as references to the table
+        objects = io.BytesIO()
+        pickler = pickle.Pickler(objects, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda x: (
+            self.node2index.get(id(x), None) if isinstance(x, Node) else None
+        )
+        pickler.dump(self.objects)
+
+        tables = (node_classes, parents, child_offsets, children, state_offsets, state)
+        index = {
+            "classes": [
+                (c.__module__, c.__qualname__, _class_schema(c)) for c in self.classes
+            ],
+            "strings": list(self.strings),
+            "byteorder": sys.byteorder,
+            "itemsize": node_classes.itemsize,
+            "lengths": [len(t) for t in tables],
+        }
+        index = json.dumps(index).encode()
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        f.write(_INDEX_LENGTH.pack(len(index)))
+        f.write(index)
+        for t in tables:
+            f.write(t.tobytes())
+        f.write(objects.getvalue())
+
+
+def dump(root: Node, f: BinaryIO, same_as_root: Iterable[Node] = ()):
+    """
+    Write root and all nodes under it to a binary file.
+
+    Args:
+        root (Node): The root of the tree.
+        f (BinaryIO): The file to write to.
+        same_as_root (Iterable[Node]): Nodes to store as references to root.
+    """
+    _Writer(root, same_as_root).write(f)
+
+
+def _read(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise SnapshotError("The snapshot is truncated.")
+    return data
+
+
+def _read_index(f: BinaryIO) -> Dict[str, Any]:
+    """Read the header and index of a snapshot. Nothing is unpickled."""
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size or header[:8] != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a specification snapshot.")
+    _, version = _HEADER.unpack(header)
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"Snapshot version {version} can not be loaded. Expected version "
+            f"{SNAPSHOT_VERSION}. Please re-create the snapshot."
+        )
+    (length,) = _INDEX_LENGTH.unpack(_read(f, _INDEX_LENGTH.size))
+    try:
+        index = json.loads(_read(f, length))
+        if array("q").itemsize != index["itemsize"]:
+            raise ValueError(f"Snapshot uses {index['itemsize']}-byte integers.")
+        index["tables"] = []
+        for length in index["lengths"]:
+            table = array("q")
+            table.frombytes(_read(f, length * table.itemsize))
+            if index["byteorder"] != sys.byteorder:
+                table.byteswap()
+            index["tables"].append(table)
+    except SnapshotError:
+        raise
+    except Exception as e:
+        raise SnapshotError(f"The snapshot index is corrupt: {e}") from e
+    return index
+
+
+def load(f: BinaryIO) -> Node:
+    """
+    Read a tree written by dump(). Nodes are created without calling
+    __init__ or parsing. The spec of every node is set to the root.
+
+    The snapshot version and the attributes declared by every node class are
+    checked before anything is unpickled. Values that are not nodes or
+    strings are then unpickled, which can run arbitrary code, so the
+    snapshot must come from a trusted source.
+
+    Args:
+        f (BinaryIO): The file to read from.
+
+    Returns:
+        Node: The root of the tree.
+    """
+    index = _read_index(f)
+    strings = index["strings"]
+    arrays = dict(zip(_TABLES, index["tables"]))
+    node_classes, parents = arrays["node_classes"], arrays["parents"]
+    child_offsets, children = arrays["child_offsets"], arrays["children"]
+    state_offsets, state = arrays["state_offsets"], arrays["state"]
+
+    resolved = []
+    for module, qualname, schema in index["classes"]:
+        try:
+            cls = _find_class(module, qualname)
+        except (AttributeError, ImportError) as e:
+            raise SnapshotError(
+                f"Class {module}.{qualname} in the snapshot was not found."
+            ) from e
+        if not isinstance(cls, type) or not issubclass(cls, Node):
+            raise SnapshotError(f"{module}.{qualname} in the snapshot is not a node.")
+        if _class_schema(cls) != schema:
+            raise SnapshotError(
+                f"The attributes of {module}.{qualname} have changed since "
+                f"the snapshot was made. Please re-create the snapshot."
+            )
+        resolved.append(cls)
+
+    try:
+        nodes = [resolved[c].__new__(resolved[c]) for c in node_classes]
+        unpickler = pickle.Unpickler(f)
+        unpickler.persistent_load = nodes.__getitem__
+        objects = unpickler.load()
+    except Exception as e:
+        raise SnapshotError(f"Could not read the values in the snapshot: {e}") from e
+    tables = (nodes, strings, objects)
+
+    def values(refs: array, start: int, end: int) -> list:
+        return [tables[r & 3][r >> 2] for r in refs[start:end]]
+
+    root = nodes[0]
+    for i, node in enumerate(nodes):
+        items = values(children, child_offsets[i], child_offsets[i + 1])
+        if isinstance(node, dict):
+            dict.update(node, zip(items[::2], items[1::2]))
+        else:
+            list.extend(node, items)
+        attrs = values(state, state_offsets[i], state_offsets[i + 1])
+        node.__dict__.update(zip(attrs[::2], attrs[1::2]))
+        node.__dict__["parent_node"] = nodes[parents[i]] if parents[i] >= 0 else None
+        node.__dict__["spec"] = root
+    return root
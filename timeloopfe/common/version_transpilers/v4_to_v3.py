@@ -1,4 +1,3 @@
-import copy
 import ruamel.yaml
 from ...v4.specification import Specification
 from ...v4 import arch, constraints
@@ -14,7 +13,7 @@ def transpile(spec: Specification, for_model: bool = False):
                       Else, for timeloop-mapper.
     !@return A string containing the dumped specification in V3 YAML format.
     """
-    spec = copy.deepcopy(spec)
+    spec = spec.clone()
     prob = spec.problem
     top_node = spec.architecture
     constraint_list = []
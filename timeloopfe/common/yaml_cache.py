@@ -0,0 +1,360 @@
+"""Loading YAML files for DictNode.from_yaml_files(), with an on-disk cache."""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import stat
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import accelergy.utils.yaml as yaml
+
+from .jinja_cache import jinja_cache
+
+# Increment when the format of cached files changes
+_CACHE_FORMAT = 1
+# Increment when the format of manifests changes
+_MANIFEST_FORMAT = 1
+# YAML tags and Jinja statements that pull in other files
+_INCLUDES = re.compile(rb"!include|\{%-?\s*(include|import|from|extends)\b")
+
+
+def _data_token(x: Any) -> Optional[str]:
+    """Return a string identifying Jinja data, or None if the data holds
+    values that can not be identified reliably."""
+    if x is None or type(x) in (str, int, float, bool):
+        return f"{type(x).__name__}:{x!r}"
+    if isinstance(x, (list, tuple)):
+        items = [_data_token(v) for v in x]
+        if None in items:
+            return None
+        return f"{type(x).__name__}:[{','.join(items)}]"
+    if isinstance(x, dict):
+        items = [(_data_token(k), _data_token(v)) for k, v in x.items()]
+        if any(k is None or v is None for k, v in items):
+            return None
+        items.sort()
+        return f"dict:{{{','.join(f'{k}={v}' for k, v in items)}}}"
+    return None
+
+
+class YamlCache:
+    """
+    Caches the objects loaded from YAML files in a directory.
+
+    Entries are keyed by the resolved path of the file, a hash of its
+    contents, and the Jinja data it is rendered with. Files that include
+    other files, through !include tags or Jinja include, import, from, or
+    extends statements, are not cached, as the key can not cover the files
+    they include. Entries are written to a temporary file and renamed into
+    place, so processes may share a cache directory.
+
+    Attributes:
+        cache_dir (str): The directory holding cached entries.
+        stats (Dict[str, int]): Numbers of hits, misses, and loads that
+            could not be cached.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "uncached": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def add_stats(self, stats: Dict[str, int]):
+        """Add counts from another cache, e.g. one used in another process."""
+        with self._lock:
+            for k, v in stats.items():
+                self.stats[k] += v
+
+    def _key(self, path: str, jinja_parse_data: Dict[str, Any]) -> Optional[str]:
+        data = _data_token(jinja_parse_data)
+        if data is None:
+            return None
+        with open(path, "rb") as f:
+            contents = f.read()
+        if _INCLUDES.search(contents):
+            return None
+        h = hashlib.sha256(f"{_CACHE_FORMAT}\0{os.path.realpath(path)}\0".encode())
+        h.update(hashlib.sha256(contents).digest())
+        h.update(data.encode())
+        return h.hexdigest()
+
+    def load(self, path: str, jinja_parse_data: Dict[str, Any]) -> Any:
+        """
+        Load a YAML file, using the cached result if there is one.
+
+        Args:
+            path (str): The YAML file.
+            jinja_parse_data (Dict[str, Any]): Data to render the file with.
+
+        Returns:
+            Any: The loaded object.
+        """
+        key = self._key(path, jinja_parse_data)
+        if key is None:
+            self._count("uncached")
+            return yaml.load_yaml(path, data=jinja_parse_data)
+
+        entry = os.path.join(self.cache_dir, key + ".pickle")
+        try:
+            with open(entry, "rb") as f:
+                loaded = pickle.load(f)
+            self._count("hits")
+            return loaded
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning("Ignoring unreadable YAML cache entry %s: %s", entry, e)
+
+        self._count("misses")
+        loaded = yaml.load_yaml(path, data=jinja_parse_data)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(loaded, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry)
+        except Exception as e:
+            logging.warning("Could not write YAML cache entry %s: %s", entry, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return loaded
+
+    def log_stats(self):
+        """Log the numbers of hits and misses."""
+        logging.info(
+            "YAML cache %s: %d hits, %d misses, %d not cacheable",
+            self.cache_dir,
+            self.stats["hits"],
+            self.stats["misses"],
+            self.stats["uncached"],
+        )
+
+
+def _load_in_process(
+    path: str,
+    jinja_parse_data: Dict[str, Any],
+    cache_dir: Optional[str],
+    jinja_bytecode_dir: Optional[str],
+) -> Tuple[Any, Dict[str, int], Dict[str, float]]:
+    # Workers may be reused, so only the stats of this load are returned
+    jinja_stats = dict(jinja_cache.stats)
+    with jinja_cache.installed(jinja_bytecode_dir):
+        if cache_dir is None:
+            loaded, stats = yaml.load_yaml(path, data=jinja_parse_data), {}
+        else:
+            cache = YamlCache(cache_dir)
+            loaded, stats = cache.load(path, jinja_parse_data), cache.stats
+    jinja_stats = {k: v - jinja_stats[k] for k, v in jinja_cache.stats.items()}
+    return loaded, stats, jinja_stats
+
+
+def _load_in_threads(
+    paths: List[str],
+    jinja_parse_data: Dict[str, Any],
+    cache: Optional[YamlCache],
+    parallel: bool,
+    max_workers: Optional[int],
+    jinja_bytecode_dir: Optional[str],
+) -> List[Any]:
+    def load(path: str) -> Any:
+        # The Jinja cache is installed per thread
+        with jinja_cache.installed(jinja_bytecode_dir):
+            if cache is not None:
+                return cache.load(path, jinja_parse_data)
+            return yaml.load_yaml(path, data=jinja_parse_data)
+
+    if not parallel or len(paths) < 2:
+        return [load(p) for p in paths]
+    with ThreadPoolExecutor(max_workers) as pool:
+        return list(pool.map(load, paths))
+
+
+def load_yaml_files(
+    paths: List[str],
+    jinja_parse_data: Dict[str, Any],
+    cache: Optional[YamlCache] = None,
+    parallel: bool = False,
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+    jinja_bytecode_dir: Optional[str] = None,
+) -> List[Any]:
+    """
+    Load YAML files. Files are loaded independently, so they may be loaded
+    concurrently. Results are returned in the order of paths, and if any
+    load fails, the error of the first failing path is raised.
+
+    Args:
+        paths (List[str]): The YAML files.
+        jinja_parse_data (Dict[str, Any]): Data to render the files with.
+        cache (Optional[YamlCache]): A cache to load files through.
+        parallel (bool): Whether to load files concurrently.
+        max_workers (Optional[int]): The number of workers if parallel.
+        use_processes (bool): Load in worker processes rather than threads.
+            Faster if rendering and parsing dominate rather than reading.
+            jinja_parse_data must be picklable.
+        jinja_bytecode_dir (Optional[str]): A directory to keep compiled
+            Jinja templates in. Templates are always cached in memory. See
+            JinjaCache.
+
+    Returns:
+        List[Any]: The loaded objects.
+    """
+    if not use_processes or not parallel or len(paths) < 2:
+        return _load_in_threads(
+            paths, jinja_parse_data, cache, parallel, max_workers, jinja_bytecode_dir
+        )
+
+    cache_dir = cache.cache_dir if cache is not None else None
+    with ProcessPoolExecutor(max_workers) as pool:
+        futures = [
+            pool.submit(
+                _load_in_process, p, jinja_parse_data, cache_dir, jinja_bytecode_dir
+            )
+            for p in paths
+        ]
+        results = [f.result() for f in futures]
+    for _, stats, jinja_stats in results:
+        if cache is not None:
+            cache.add_stats(stats)
+        jinja_cache.add_stats(jinja_stats)
+    return [loaded for loaded, _, _ in results]
+
+
+def _glob_files(pattern: str) -> List[Tuple[str, os.stat_result]]:
+    """Return the regular files matching pattern, each with its stat."""
+    found = []
+    for path in glob.glob(pattern):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            found.append((path, st))
+    return found
+
+
+def _manifest_dirs(patterns: List[str]) -> Optional[List[str]]:
+    """Return the directories whose listings the glob results of patterns
+    depend on, or None if a directory itself holds a wildcard."""
+    dirs = []
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            continue
+        d = os.path.dirname(pattern) or os.curdir
+        if glob.has_magic(d):
+            return None
+        if d not in dirs:
+            dirs.append(d)
+    return dirs
+
+
+def _read_manifest(manifest: str, patterns: List[str]) -> Optional[List[str]]:
+    try:
+        with open(manifest) as f:
+            contents = json.load(f)
+        if (
+            contents["format"] != _MANIFEST_FORMAT
+            or contents["patterns"] != patterns
+        ):
+            return None
+        for d, mtime in contents["dirs"]:
+            if os.stat(d).st_mtime_ns != mtime:
+                return None
+        for path, mtime, size in contents["files"]:
+            st = os.stat(path)
+            if st.st_mtime_ns != mtime or st.st_size != size:
+                return None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning("Ignoring unreadable file manifest %s: %s", manifest, e)
+        return None
+    return [path for path, _, _ in contents["files"]]
+
+
+def _write_manifest(
+    manifest: str,
+    patterns: List[str],
+    files: List[Tuple[str, os.stat_result]],
+):
+    dirs = _manifest_dirs(patterns)
+    if dirs is None:
+        logging.info(
+            "Not writing file manifest %s: a pattern has a wildcard in its "
+            "directory.",
+            manifest,
+        )
+        return
+    try:
+        # Create the manifest before the directories are checked, as adding
+        # it to a searched directory modifies the directory. Rewriting it in
+        # place does not.
+        open(manifest, "a").close()
+        contents = {
+            "format": _MANIFEST_FORMAT,
+            "patterns": patterns,
+            "dirs": [[d, os.stat(d).st_mtime_ns] for d in dirs],
+            "files": [[p, st.st_mtime_ns, st.st_size] for p, st in files],
+        }
+        with open(manifest, "w") as f:
+            json.dump(contents, f)
+    except OSError as e:
+        logging.warning("Could not write file manifest %s: %s", manifest, e)
+
+
+def resolve_yaml_files(
+    patterns: List[str], manifest: Optional[str] = None
+) -> List[str]:
+    """
+    Expand glob patterns into the files to load. Files are listed in the
+    order they are matched, and files matched more than once, including
+    through other paths or links, are listed only once.
+
+    If a manifest is given and it was written for the same patterns, the
+    files listed in it are returned without globbing if none of them, nor
+    the directories the patterns search, have been modified since. Otherwise
+    the patterns are expanded and the manifest is rewritten.
+
+    Args:
+        patterns (List[str]): Paths or glob patterns.
+        manifest (Optional[str]): A file to record the resolved files in.
+
+    Returns:
+        List[str]: The files to load.
+    """
+    if manifest is not None:
+        found = _read_manifest(manifest, patterns)
+        if found is not None:
+            logging.info("Using the files listed in manifest %s", manifest)
+            return found
+
+    globbed: Dict[str, List[Tuple[str, os.stat_result]]] = {}
+    seen = set()
+    resolved = []
+    for pattern in patterns:
+        logging.info("Loading yaml file %s", pattern)
+        if pattern not in globbed:
+            globbed[pattern] = _glob_files(pattern)
+        if not globbed[pattern]:
+            raise FileNotFoundError(f"Could not find file {pattern}")
+        for path, st in globbed[pattern]:
+            if (st.st_dev, st.st_ino) in seen:
+                logging.info('Ignoring duplicate file "%s" in yaml load', path)
+            else:
+                seen.add((st.st_dev, st.st_ino))
+                resolved.append((path, st))
+
+    if manifest is not None:
+        _write_manifest(manifest, patterns, resolved)
+    return [path for path, _ in resolved]
@@ -0,0 +1,124 @@
+"""YAML reading and writing, using libyaml through PyYAML if it is available."""
+
+import logging
+from typing import Any, IO, Type, Union
+
+from accelergy.utils.yaml import to_yaml_string
+import yaml
+
+HAS_LIBYAML = getattr(yaml, "__with_libyaml__", False)
+
+
+def _get_tag(x: Any) -> str:
+    tag = getattr(x, "tag", None)
+    tag = getattr(tag, "value", tag)
+    return tag if isinstance(tag, str) and tag.startswith("!") else ""
+
+
+class TaggedDict(dict):
+    """A mapping loaded with a tag such as !Component."""
+
+    def __init__(self, *args, tag: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = tag
+
+
+class TaggedList(list):
+    """A sequence loaded with a tag such as !Parallel."""
+
+    def __init__(self, *args, tag: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tag = tag
+
+
+def _construct_tagged(loader: yaml.SafeLoader, suffix: str, node: yaml.Node) -> Any:
+    tag = "!" + suffix
+    if isinstance(node, yaml.MappingNode):
+        return TaggedDict(loader.construct_mapping(node, deep=True), tag=tag)
+    if isinstance(node, yaml.SequenceNode):
+        return TaggedList(loader.construct_sequence(node, deep=True), tag=tag)
+    return loader.construct_scalar(node)
+
+
+def _represent_dict(dumper: yaml.SafeDumper, data: dict) -> yaml.Node:
+    tag = _get_tag(data) or "tag:yaml.org,2002:map"
+    return dumper.represent_mapping(tag, data.items())
+
+
+def _represent_list(dumper: yaml.SafeDumper, data: list) -> yaml.Node:
+    tag = _get_tag(data) or "tag:yaml.org,2002:seq"
+    return dumper.represent_sequence(tag, data)
+
+
+def _make_loader(base: Type) -> Type:
+    loader = type(f"Timeloopfe{base.__name__}", (base,), {})
+    loader.add_multi_constructor("!", _construct_tagged)
+    return loader
+
+
+def _make_dumper(base: Type) -> Type:
+    # Repeated objects are written out in full rather than as aliases
+    dumper = type(
+        f"Timeloopfe{base.__name__}", (base,), {"ignore_aliases": lambda *_: True}
+    )
+    dumper.add_multi_representer(dict, _represent_dict)
+    dumper.add_multi_representer(list, _represent_list)
+    dumper.add_multi_representer(tuple, _represent_list)
+    # Subclasses of scalars, such as the floats ruamel loads, are written as
+    # the scalar they subclass. bool subclasses int, so it is listed first.
+    for t in (bool, str, int, float):
+        represent = base.yaml_representers[t]
+        dumper.add_multi_representer(
+            t, lambda d, data, t=t, represent=represent: represent(d, t(data))
+        )
+    return dumper
+
+
+_LOADERS = {False: _make_loader(yaml.SafeLoader)}
+_DUMPERS = {False: _make_dumper(yaml.SafeDumper)}
+if HAS_LIBYAML:
+    _LOADERS[True] = _make_loader(yaml.CSafeLoader)
+    _DUMPERS[True] = _make_dumper(yaml.CSafeDumper)
+
+
+def load_yaml_string(stream: Union[str, IO], use_libyaml: bool = True) -> Any:
+    """
+    Load YAML with the safe loader. Tagged mappings and sequences, such as
+    !Component, are loaded as a TaggedDict or TaggedList with the tag in
+    their tag attribute.
+
+    Args:
+        stream (Union[str, IO]): The YAML string or file.
+        use_libyaml (bool): Use libyaml if it is available.
+
+    Returns:
+        Any: The loaded object.
+    """
+    return yaml.load(stream, Loader=_LOADERS[use_libyaml and HAS_LIBYAML])
+
+
+def dump_yaml_string(data: Any, use_libyaml: bool = True) -> str:
+    """
+    Convert data to a YAML string. Dicts and lists, including nodes, keep
+    their tags. Falls back to accelergy's YAML writer if data holds values
+    the safe dumper can not write.
+
+    Args:
+        data (Any): The data.
+        use_libyaml (bool): Use libyaml if it is available.
+
+    Returns:
+        str: The YAML string.
+    """
+    try:
+        return yaml.dump(
+            data,
+            Dumper=_DUMPERS[use_libyaml and HAS_LIBYAML],
+            default_flow_style=False,
+            sort_keys=False,
+            allow_unicode=True,
+            width=2**31 - 1,
+        )
+    except yaml.representer.RepresenterError as e:
+        logging.debug("Writing YAML with accelergy: %s", e)
+        return to_yaml_string(data)
@@ -2,7 +2,7 @@ from abc import ABC
 from logging import Logger
 from numbers import Number
 from typing import Any, Dict, List, Optional, Tuple, Union
-from ..common.nodes import DictNode, ListNode, Node
+from ..common.nodes import DictNode, ListNode, Node, SymbolTable
 from . import constraints
 from .sparse_optimizations import SparseOptimizationGroup
 from .version import assert_version
@@ -13,6 +13,22 @@ NETWORK_CLASSES = ("XY_NoC", "Legacy", "ReductionTree", "SimpleMulticast")
 NOTHING_CLASSES = ("nothing",)
 
 
+class _LeafRegistry(dict):
+    """
+    Maps leaf names to the leaves under an ArchNode.
+
+    An ArchNode takes over the largest registry of its children and adds
+    the others to it, so each leaf is added O(log N) times while building
+    an architecture bottom-up. The child whose registry was taken over no
+    longer has one, since the registry then also holds the leaves of its
+    siblings.
+    """
+
+    def add(self, name: str, leaf: "Leaf"):
+        found = self.setdefault(name, leaf)
+        assert found is leaf, f"Duplicate name {name} found in architecture"
+
+
 class ArchNode(Node):
     """
     A node in the architecture hierarchy.
@@ -29,15 +45,52 @@ class ArchNode(Node):
         None
     """
 
+    _leaf_registry: Optional[_LeafRegistry] = None
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-
         # Make sure all leaf names are unique
-        leaves = {}
-        for l in self.get_nodes_of_type(Leaf):
-            n = l.name
-            leaves.setdefault(n, l)
-            assert l is leaves[n], f"Duplicate name {n} found in architecture"
+        self._leaf_registry = self._build_leaf_registry()
+
+    def _build_leaf_registry(self) -> _LeafRegistry:
+        registries, leaves = [], []
+        if isinstance(self, Leaf):
+            leaves.append(self)
+        for _, x in self.items():
+            # Leaves are only found under ArchNodes, not in the attributes
+            # or constraints of a leaf
+            if not isinstance(x, ArchNode):
+                continue
+            registry = x._leaf_registry
+            if registry is not None:
+                registries.append((x, registry))
+            else:
+                # Reused subtrees have had their registry taken over already
+                leaves += [x] if isinstance(x, Leaf) else []
+                leaves += x.get_nodes_of_type(Leaf)
+
+        registries.sort(key=lambda x: len(x[1]), reverse=True)
+        if registries:
+            taken_from, registry = registries.pop(0)
+            taken_from._leaf_registry = None
+        else:
+            registry = _LeafRegistry()
+        for _, r in registries:
+            if r is registry:  # The same child appears more than once
+                continue
+            for n, l in r.items():
+                registry.add(n, l)
+        for l in leaves:
+            registry.add(l.name, l)
+        return registry
+
+    def _contains_leaf(self, leaf: "Leaf") -> bool:
+        node = leaf
+        while node is not self:
+            node = node.parent_node
+            if not isinstance(node, ArchNode):
+                return False
+        return True
 
     def name2leaf(self, name: str) -> "Leaf":
         """
@@ -52,11 +105,22 @@ class ArchNode(Node):
         Raises:
             ValueError: If the leaf node with the given name is not found.
         """
+        leaf = (self._leaf_registry or {}).get(name, None)
+        if (
+            leaf is not None
+            and dict.get(leaf, "name", None) == name
+            and self._contains_leaf(leaf)
+        ):
+            return leaf
+        # The tree may have changed since the registry was built
+        return self._search_leaf(name)
+
+    def _search_leaf(self, name: str) -> "Leaf":
         if isinstance(self, Leaf) and getattr(self, "name", None) == name:
             return self
         for element in self if isinstance(self, list) else self.values():
             try:
-                return element.name2leaf(name)
+                return element._search_leaf(name)
             except (AttributeError, ValueError):
                 pass
         raise ValueError(f"Leaf {name} not found in {self}")
@@ -154,14 +218,15 @@ class ArchNodes(ArchNode, ListNode):
             The parsed `ArchNodes` instance.
 
         """
-        n_symbol_table = {} if symbol_table is None else symbol_table.copy()
+        n_symbol_table = SymbolTable.child_of(symbol_table)
         for l in self.get_nodes_of_type(Leaf):
             n_symbol_table[l.name] = l
 
         def callfunc(x, sym_table):
             if isinstance(x, Container) and not sym_table.get("_in_parallel", False):
                 sym_table.setdefault("_parent_container_attributes", {})
-                sym_table.update(x.attributes)
+                for k in x.attributes:
+                    sym_table.mirror(x.attributes, k)
             return x
 
         return super().parse_expressions(n_symbol_table, parsed_ids, callfunc)
@@ -189,7 +254,7 @@ class Branch(ArchNode, DictNode, ABC):
         symbol_table: Optional[Dict[str, Any]] = None,
         parsed_ids: Optional[set] = None,
     ):
-        n_symbol_table = {} if symbol_table is None else symbol_table.copy()
+        n_symbol_table = SymbolTable.child_of(symbol_table)
         n_symbol_table["_in_parallel"] = isinstance(self, Parallel)
         return super().parse_expressions(symbol_table, parsed_ids)
 
@@ -291,14 +356,13 @@ class Leaf(ArchNode, DictNode, ABC):
         Returns:
             Attributes: The parsed attributes.
         """
-        n_symbol_table = {} if symbol_table is None else symbol_table.copy()
+        n_symbol_table = SymbolTable.child_of(symbol_table)
 
         def callfunc(x, sym_table):
             # Fill the attributes with the parent attributes
-            sym_table["attributes"] = {
-                **sym_table.get("_parent_container_attributes", {}),
-                **sym_table.get("attributes", {}),
-            }
+            sym_table.merge(
+                "attributes", ["_parent_container_attributes", "attributes"]
+            )
             return x
 
         callfunc(None, n_symbol_table)
@@ -456,6 +520,8 @@ class Attributes(DictNode):
         has_power_gating (bool): Indicates whether the node has power gating.
     """
 
+    _default_parse = True
+
     @classmethod
     def declare_attrs(cls, *args, **kwargs):
         super().declare_attrs(*args, **kwargs)
@@ -463,10 +529,6 @@ class Attributes(DictNode):
         super().add_attr("power_gated_at", str, None)
         super().add_attr("", part_name_match=True, no_change_key=True)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self._default_parse = True
-
 
 class StorageAttributes(Attributes):
     """Represents the attributes of a storage element.
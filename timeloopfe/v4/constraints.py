@@ -1,5 +1,6 @@
+import functools
 import logging
-from typing import Iterable, List, Optional, Tuple, Type, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Type, Union
 from ..common.nodes import DictNode, ListNode, isempty, CombinableListNode
 import timeloopfe.v4.problem as problem
 import copy
@@ -392,6 +393,46 @@ class Factor(str):
     pass
 
 
+@functools.lru_cache(maxsize=4096)
+def _splitfactor(x: str) -> Tuple[str, str, int]:
+    checks = ["<=", ">=", "="]
+    for to_check in checks:
+        if to_check not in x:
+            continue
+        a, c = x.split(to_check)
+        return a, to_check, int(c)
+    raise ValueError(
+        f'Did not find any of {checks} in factor "{x}".'
+        f'Format each factor as "X=123", "X<=123", or "X>=123". '
+        f"Multiple factors may be given as a comma-separated string, "
+        f"a space-separated string, or a list of strings."
+    )
+
+
+class _FactorIndex:
+    """The factors of a Factors list, split once and indexed by name."""
+
+    def __init__(self):
+        # (name, operator, value) of each factor, or None if it can't be split
+        self.parsed: List[Optional[Tuple[str, str, int]]] = []
+        self.by_name: Dict[str, List[str]] = {}
+        self.unparsed: List[str] = []
+
+    def add(self, f: str):
+        try:
+            split = _splitfactor(str(f))
+        except ValueError:
+            self.parsed.append(None)
+            self.unparsed.append(f)
+            return
+        self.parsed.append(split)
+        self.by_name.setdefault(split[0], []).append(f)
+
+    @property
+    def split(self) -> List[Tuple[str, str, int]]:
+        return [s for s in self.parsed if s is not None]
+
+
 class Factors(CombinableListNode):
     """
     A list of factors used to describe loop bounds
@@ -472,28 +513,36 @@ class Factors(CombinableListNode):
         Example:
             splitfactor("X=123") returns ("X", "=", 123)
         """
-        checks = ["<=", ">=", "="]
-        for to_check in checks:
-            if to_check not in x:
-                continue
-            a, c = x.split(to_check)
-            return a, to_check, int(c)
-        raise ValueError(
-            f'Did not find any of {checks} in factor "{x}".'
-            f'Format each factor as "X=123", "X<=123", or "X>=123". '
-            f"Multiple factors may be given as a comma-separated string, "
-            f"a space-separated string, or a list of strings."
-        )
+        return _splitfactor(str(x))
 
-    def get_split_factors(self) -> List[Tuple[str, str, str]]:
+    def _get_factor_index(self) -> _FactorIndex:
+        """
+        Return the parsed factors, building them if they are not cached. The
+        cache is dropped whenever the list changes.
+        """
+        index = self.__dict__.get("_factor_index", None)
+        if index is None:
+            index = _FactorIndex()
+            for f in self:
+                index.add(f)
+            object.__setattr__(self, "_factor_index", index)
+        return index
+
+    def _get_parsed_factors(self) -> _FactorIndex:
+        index = self._get_factor_index()
+        if index.unparsed:
+            self.splitfactor(index.unparsed[0])  # Raises a ValueError
+        return index
+
+    def get_split_factors(self) -> List[Tuple[str, str, int]]:
         """
         Get a list of split factors.
 
         Example:
-            get_split_factors() returns [("X", "=", "123"), ("Y", "=", "456"), ("Z", "=", "789")] if the factors are "X=123", "Y=456", and "Z=789".
+            get_split_factors() returns [("X", "=", 123), ("Y", "=", 456), ("Z", "=", 789)] if the factors are "X=123", "Y=456", and "Z=789".
 
         """
-        return [self.splitfactor(x) for x in self]
+        return list(self._get_parsed_factors().split)
 
     def get_factor_names(self) -> List[str]:
         """
@@ -503,7 +552,13 @@ class Factors(CombinableListNode):
             get_factor_names() returns ["X", "Y", "Z"] if the factors are "X=123", "Y=456", and "Z=789".
 
         """
-        return [self.splitfactor(x)[0] for x in self]
+        return [n for n, _, _ in self._get_parsed_factors().split]
+
+    def has_factor(self, name: str) -> bool:
+        """
+        Return True if there is a factor with the given name.
+        """
+        return name in self._get_parsed_factors().by_name
 
     def remove_factor(self, name: str):
         """
@@ -519,9 +574,28 @@ class Factors(CombinableListNode):
             remove_factor("X") removes the factor "X=123" from the list of factors.
 
         """
-        for i in range(len(self) - 1, -1, -1):
-            if name == self.splitfactor(self[i])[0]:
-                self.pop(i)
+        if not self.has_factor(name):
+            return
+        parsed = self._get_factor_index().parsed
+        self[:] = [f for f, s in zip(self, parsed) if s is None or s[0] != name]
+
+    def _add_factor(self, name: str, operator: str, value: int, overwrite: bool):
+        if overwrite:
+            self.remove_factor(name)
+        f = Factor(f"{name}{operator}{value}")
+        index = self._get_factor_index()
+        if f in index.by_name.get(name, ()):
+            return
+        for other in index.by_name.get(name, ()):
+            if not self._check_factors_compatible(other, f):
+                raise ValueError(
+                    f"Found conflicting constraints {f} and {other} "
+                    f"for the same variable {name} in {self}."
+                )
+        self.append(f)
+        # Appending drops the index. Add the new factor instead of re-parsing.
+        index.add(f)
+        object.__setattr__(self, "_factor_index", index)
 
     def add_eq_factor(self, name: str, value: int, overwrite: bool = False):
         """
@@ -532,10 +606,7 @@ class Factors(CombinableListNode):
             value (int): The value of the factor.
             overwrite (bool, optional): If True, removes any existing factor with the same name before adding the new one. Defaults to False.
         """
-        if overwrite:
-            self.remove_factor(name)
-        self.append(f"{name}={value}")
-        self.check_unique_remove_repeat()
+        self._add_factor(name, "=", value, overwrite)
 
     def add_leq_factor(self, name: str, value: int, overwrite: bool = False):
         """
@@ -546,10 +617,7 @@ class Factors(CombinableListNode):
             value (int): The value of the factor.
             overwrite (bool, optional): If True, removes any existing factor with the same name before adding the new one. Defaults to False.
         """
-        if overwrite:
-            self.remove_factor(name)
-        self.append(f"{name}<={value}")
-        self.check_unique_remove_repeat()
+        self._add_factor(name, "<=", value, overwrite)
 
     def add_geq_factor(self, name: str, value: int, overwrite: bool = False):
         """
@@ -560,10 +628,7 @@ class Factors(CombinableListNode):
             value (int): The value of the factor.
             overwrite (bool, optional): If True, removes any existing factor with the same name before adding the new one. Defaults to False.
         """
-        if overwrite:
-            self.remove_factor(name)
-        self.append(f"{name}>={value}")
-        self.check_unique_remove_repeat()
+        self._add_factor(name, ">=", value, overwrite)
 
     def _check_factors_compatible(self, a, b):
         a_n, a_eq, a_v = self.splitfactor(a)
@@ -579,30 +644,25 @@ class Factors(CombinableListNode):
         return False
 
     def check_unique_remove_repeat(self):
-        unique = set()
-        # Identical factors OK
-        for i in range(len(self) - 1, -1, -1):
-            if self[i] in unique:
-                self.pop(i)
-            unique.add(self[i])
+        # Identical factors OK. The last of each is kept.
+        last = {f: i for i, f in enumerate(self)}
+        unique = [
+            self.check_valid_factor(f) for i, f in enumerate(self) if last[f] == i
+        ]
+        if len(unique) != len(self) or any(
+            type(a) is not type(b) for a, b in zip(unique, self)
+        ):
+            self[:] = unique
 
         # Non-identical, but same name, not OK
-        checked = {}
-        for i, f in enumerate(self):
-            self[i] = self.check_valid_factor(f)
-            try:
-                name, eq, v = self.splitfactor(f)
-            except ValueError:
-                continue
-            if name not in checked:
-                checked[name] = f
-                continue
-            if self._check_factors_compatible(checked[name], f):
-                continue
-            raise ValueError(
-                f"Found conflicting constraints {f} and {checked[name]} "
-                f"for the same variable {name} in {self}."
-            )
+        for name, factors in self._get_factor_index().by_name.items():
+            for f in factors[1:]:
+                if self._check_factors_compatible(factors[0], f):
+                    continue
+                raise ValueError(
+                    f"Found conflicting constraints {f} and {factors[0]} "
+                    f"for the same variable {name} in {self}."
+                )
 
     def combine(self, other: "Factors") -> "Factors":
         super().combine(other)
@@ -620,9 +680,7 @@ class Factors(CombinableListNode):
             int: The calculated minimum product.
         """
         allocated = 1
-        for f in self:
-            dim, comparator, value = self.splitfactor(f)
-            value = int(value)
+        for dim, comparator, value in self._get_parsed_factors().split:
             if value == 0:
                 value = problem_instance[dim]
             if comparator == "=" and int(value):
@@ -633,7 +691,7 @@ class Factors(CombinableListNode):
         """
         Add an "name=value" factor iff "name" is not already in the factor list. Return True if the factor was added.
         """
-        if name not in self.get_factor_names():
+        if not self.has_factor(name):
             self.add_eq_factor(name, value)
             return True
         return False
@@ -642,7 +700,7 @@ class Factors(CombinableListNode):
         """
         Add an "name<=value" factor iff "name" is not already in the factor list. Return True if the factor was added.
         """
-        if name not in self.get_factor_names():
+        if not self.has_factor(name):
             self.add_leq_factor(name, value)
             return True
         return False
@@ -651,11 +709,51 @@ class Factors(CombinableListNode):
         """
         Return the factor with the given name, or None if not found.
         """
-        for f in self:
-            if name == self.splitfactor(f)[0]:
-                return f
+        factors = self._get_parsed_factors().by_name.get(name, None)
+        if factors:
+            return factors[0]
         raise ValueError(f"Factor {name} not found in {self}.")
 
+    # The methods below drop the parsed factors when the list changes.
+    def _clear_factor_index(self):
+        self.__dict__.pop("_factor_index", None)
+
+    def __setitem__(self, key, value):
+        self._clear_factor_index()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._clear_factor_index()
+        super().__delitem__(key)
+
+    def append(self, value):
+        self._clear_factor_index()
+        super().append(value)
+
+    def extend(self, values):
+        self._clear_factor_index()
+        super().extend(values)
+
+    def insert(self, index, value):
+        self._clear_factor_index()
+        super().insert(index, value)
+
+    def pop(self, index=-1):
+        self._clear_factor_index()
+        return super().pop(index)
+
+    def clear(self):
+        self._clear_factor_index()
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._clear_factor_index()
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._clear_factor_index()
+        super().reverse()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.check_unique_remove_repeat()
@@ -2,7 +2,8 @@ import copy
 from numbers import Number
 import os
 from typing import Any, Dict, Tuple, List, Union
-import yaml
+
+from ..common.yaml_io import load_yaml_string
 
 
 def parse_stats_file(path: str) -> Tuple[int, int, float, dict]:
@@ -51,7 +52,7 @@ def get_area_from_art(path: str) -> dict:
         dict: The area of each component.
 
     """
-    d = yaml.load(open(path, "r").read(), Loader=yaml.SafeLoader)
+    d = load_yaml_string(open(path, "r").read())
     name2area = {}
     for x in d["ART"]["tables"]:
         namecount = x["name"].split(".", 1)[1]
@@ -19,8 +19,8 @@ EnableDummyTableProcessor = enable_dummy_table.EnableDummyTableProcessor
 PermutationOptimizerProcessor = permutation_optimizer.PermutationOptimizerProcessor
 SparseOptAttacherProcessor = sparse_opt_attacher.SparseOptAttacherProcessor
 RequiredActionsProcessor = required_actions.RequiredActionsProcessor
-# Order matters here. The processors will be run in the order they appear in
-# this list.
+# Processors run after the processors they declare in requires and runs_after.
+# Otherwise, they run in the order they appear in this list.
 
 
 REQUIRED_PROCESSORS = [
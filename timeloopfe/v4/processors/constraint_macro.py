@@ -2,6 +2,7 @@
 specification.
 """
 
+import functools
 import math
 from typing import Dict, List, Tuple, Union
 
@@ -22,15 +23,22 @@ def factors_only_init(x) -> Union[Factors, None]:
     return Factors.factory(x)
 
 
-def num2list_of_prime_factors(x: int):
+@functools.lru_cache(maxsize=4096)
+def _prime_factors(x: int) -> Tuple[int, ...]:
     factors = []
-    while x > 1:
-        for i in range(2, x + 1):
-            if x % i == 0:
-                factors.append(i)
-                x //= i
-                break
-    return factors
+    i = 2
+    while i * i <= x:
+        while x % i == 0:
+            factors.append(i)
+            x //= i
+        i += 1
+    if x > 1:
+        factors.append(x)
+    return tuple(factors)
+
+
+def num2list_of_prime_factors(x: int):
+    return list(_prime_factors(x))
 
 
 def get_call_stack_size():
@@ -39,14 +47,19 @@ def get_call_stack_size():
     return len(inspect.stack())
 
 
-def greedy_allocate(
-    factors: Dict[str, int], capacity: int
-) -> Tuple[Dict[str, int], Dict[str, int]]:
-    best_alloc, best_utilization = [], 1
+@functools.lru_cache(maxsize=2**16)
+def _allocate(
+    values: Tuple[int, ...], capacity: int
+) -> Tuple[Tuple[Tuple[int, int, int], ...], float]:
+    # Allocations refer to dimensions by their index in values, so results are
+    # shared between dimensions with different names. The capacity left in a
+    # state is fixed by the values left, since (c // a) // b == c // (a * b),
+    # so each state is searched once.
+    best_alloc, best_utilization = (), 1
     if capacity <= 1:
         return best_alloc, best_utilization
 
-    for k, v in factors.items():
+    for i, v in enumerate(values):
         if v > capacity:
             remaining = math.ceil(v / capacity)
             alloc = math.ceil(v / remaining)
@@ -54,26 +67,47 @@ def greedy_allocate(
             util = (alloc * (remaining - 1) + remainder) / remaining
             if util > best_utilization:
                 best_utilization = util
-                best_alloc = [(k, remainder, alloc)]
-            # print(' ' * get_call_stack_size(),
-            #   f'A: {k} = {alloc} -> {alloc} with capacity {capacity}. Utilization = {util}')
+                best_alloc = ((i, remainder, alloc),)
 
-        for p in set(num2list_of_prime_factors(v)):
+        for p in set(_prime_factors(v)):
             if p > capacity:
                 continue
-            newfactors = {k: v for k, v in factors.items()}
-            newfactors[k] //= p
-            alloc, util = greedy_allocate(newfactors, capacity // p)
+            newvalues = values[:i] + (v // p,) + values[i + 1 :]
+            alloc, util = _allocate(newvalues, capacity // p)
             util *= p
-            # print(' ' * get_call_stack_size(),
-            #       f'A: {k} = {p} -> {alloc} with capacity {capacity}. Utilization = {util}')
             if util > best_utilization:
                 best_utilization = util
-                best_alloc = [(k, p, p)] + alloc
+                best_alloc = ((i, p, p),) + alloc
 
     return best_alloc, best_utilization
 
 
+def greedy_allocate(
+    factors: Dict[str, int], capacity: int
+) -> Tuple[List[Tuple[str, int, int]], float]:
+    """
+    Split the given dimension sizes into loop bounds whose product fits in
+    capacity, maximizing the product.
+
+    Every way of assigning the prime factors of the dimensions to the
+    capacity is searched, memoized on the sizes left to assign. A dimension
+    larger than the capacity left may also take a bound that does not divide
+    it, with the utilization averaged over its uneven iterations.
+
+    Args:
+        factors (Dict[str, int]): The size of each dimension.
+        capacity (int): The product the bounds may not exceed.
+
+    Returns:
+        Tuple[List[Tuple[str, int, int]], float]: (dimension, minimum,
+            maximum) bounds, to be multiplied per dimension, and the
+            utilization they reach.
+    """
+    names = list(factors)
+    alloc, util = _allocate(tuple(factors.values()), capacity)
+    return [(names[i], lo, hi) for i, lo, hi in alloc], util
+
+
 class ConstraintMacroProcessor(Processor):
     """Defines constraint macros to be used for simplifying constraint specification.
 
@@ -103,6 +137,10 @@ class ConstraintMacroProcessor(Processor):
                    dataspaces are kept.
     """
 
+    requires = (References2CopiesProcessor,)
+    reads = ("architecture", "constraints", "mapping", "problem")
+    writes = ("architecture", "constraints", "mapping")
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -155,7 +193,6 @@ class ConstraintMacroProcessor(Processor):
 
     def process(self, spec: Specification):
         super().process(spec)
-        self.must_run_after(References2CopiesProcessor, spec)
         prob_shape = spec.problem.shape
         prob_data_spaces = [ds.name for ds in prob_shape.data_spaces]
         prob_dimensions = prob_shape.dimensions
@@ -308,7 +345,7 @@ class ConstraintMacroProcessor(Processor):
 
                 to_allocate = {}
                 for dim in m:
-                    if dim in factors.get_factor_names():
+                    if factors.has_factor(dim):
                         raise ValueError(
                             f'Cannot maximize dimension "{dim}" because it is '
                             f"already constrained to "
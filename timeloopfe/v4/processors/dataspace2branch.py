@@ -13,6 +13,11 @@ from ...v4 import Specification
 class Dataspace2BranchProcessor(Processor):
     """Resolves which data spaces are kept in which branches."""
 
+    requires = (References2CopiesProcessor, ConstraintAttacherProcessor)
+    runs_after = (ConstraintMacroProcessor,)
+    reads = ("architecture", "problem")
+    writes = ("architecture",)
+
     def get_problem_ds_names(self, spec) -> Set[str]:
         return set([x.name for x in spec.problem.shape.data_spaces])
 
@@ -68,7 +73,4 @@ class Dataspace2BranchProcessor(Processor):
 
     def process(self, spec: Specification):
         super().process(spec)
-        self.must_run_after(References2CopiesProcessor, spec)
-        self.must_run_after(ConstraintMacroProcessor, spec, ok_if_not_found=True)
-        self.must_run_after(ConstraintAttacherProcessor, spec)
         self._parse_branch(spec.architecture, self.get_problem_ds_names(spec), spec)
@@ -13,16 +13,16 @@ from ...v4 import Specification
 class PermutationOptimizerProcessor(Processor):
     """Optimizes permutation by pruning superfluous permutations."""
 
+    requires = (References2CopiesProcessor, ConstraintAttacherProcessor)
+    runs_after = (ConstraintMacroProcessor, Dataspace2BranchProcessor)
+    reads = ("architecture", "problem")
+    writes = ("architecture",)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def process(self, spec: Specification):
         super().process(spec)
-        # Assert that the constraint attacher processor has already run
-        self.must_run_after(ConstraintAttacherProcessor, spec)
-        self.must_run_after(References2CopiesProcessor, spec)
-        self.must_run_after(ConstraintMacroProcessor, spec, ok_if_not_found=True)
-        self.must_run_after(Dataspace2BranchProcessor, spec, ok_if_not_found=True)
         problem = spec.problem
 
         constraints = []
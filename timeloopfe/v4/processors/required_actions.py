@@ -47,6 +47,9 @@ class RequiredActionsProcessor(Processor):
     # - skipped_compute
     """
 
+    requires = (References2CopiesProcessor, SparseOptAttacherProcessor)
+    reads = writes = ("architecture",)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -83,8 +86,6 @@ class RequiredActionsProcessor(Processor):
 
     def process(self, spec: Specification):
         super().process(spec)
-        self.must_run_after(References2CopiesProcessor, spec)
-        self.must_run_after(SparseOptAttacherProcessor, spec)
         for s in spec.architecture.get_nodes_of_type(Storage):
             self.check_storage(s)  # type: ignore
         for c in spec.architecture.get_nodes_of_type(Compute):
@@ -1,7 +1,6 @@
 """Takes sparse optimizations from sparse optimizations lists and attaches them to the architecture.
 """
 from ...common.processor import References2CopiesProcessor
-from ...common.nodes import DictNode
 from ...common.processor import Processor
 from ...v4 import Specification
 
@@ -10,21 +9,28 @@ class SparseOptAttacherProcessor(Processor):
     """Takes sparse optimizations from sparse optimizations lists and attaches them to the architecture.
     """
 
+    requires = (References2CopiesProcessor,)
+    reads = writes = ("architecture", "sparse_optimizations")
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def process(self, spec: Specification):
         super().process(spec)
-        self.must_run_after(References2CopiesProcessor, spec)
-        while spec.sparse_optimizations.targets:
-            opt = spec.sparse_optimizations.targets.pop(0)
-            nodes = spec.architecture.get_nodes_of_type(DictNode)
-            for c in nodes:
-                if c.get("name", None) == opt.target and "sparse_optimizations" in c:
-                    c.combine_index("sparse_optimizations", opt)
-                    break
+        x = spec.sparse_optimizations.targets
+        targets = self.index_by_name(spec.architecture, "sparse_optimizations")
+        not_found = []
+        for opt in x:
+            node = targets.get(opt.target, None)
+            if node is None:
+                not_found.append(opt)
             else:
-                raise ValueError(
-                    f"Sparse optimization target '{opt.target}' not found in "
-                    f"the architecture. Problematic sparse optimization: {opt}"
-                )
+                node.combine_index("sparse_optimizations", opt)
+        x.clear()
+        if not_found:
+            raise ValueError(
+                f"Sparse optimization targets "
+                f"{list(dict.fromkeys(o.target for o in not_found))} not found "
+                f"in the architecture. Problematic sparse optimizations: "
+                f"{not_found}. Available targets: {list(targets)}."
+            )
@@ -1,6 +1,6 @@
 import time
 from . import arch, constraints, problem, variables
-from ..common.nodes import ListNode
+from ..common.nodes import ListNode, SymbolTable
 from .arch import Architecture
 from .art import Art
 from .constraints import Constraints, ConstraintsList
@@ -74,31 +74,15 @@ class Specification(BaseSpecification):
         self.sparse_optimizations: SparseOptimizations = self["sparse_optimizations"]
         self.mapspace: Mapspace = self["mapspace"]
 
-    def parse_expressions(
-        self,
-        symbol_table: Optional[Dict[str, Any]] = None,
-        parsed_ids: Optional[set] = None,
-    ):
-        if self.needs_processing([References2CopiesProcessor]):
-            raise ProcessorError(
-                f"Must run References2CopiesProcessor before "
-                f"parsing expressions. Call process() with "
-                f"any arguments."
-            )
-        for p in self.processors:
-            if self.needs_processing([p], pre_parse=True):
-                class2obj(p).pre_parse_process(self)
-                self._processors_run_pre_parse.append(p)
-
-        symbol_table = {} if symbol_table is None else symbol_table.copy()
-        parsed_ids = set() if parsed_ids is None else parsed_ids
-        parsed_ids.add(id(self))
+    def _parse_variables(
+        self, symbol_table: SymbolTable, parsed_ids: set
+    ) -> SymbolTable:
         parsed_ids.add(id(self.variables))
-        symbol_table["spec"] = self
         parsed_variables = self.variables.parse_expressions(symbol_table, parsed_ids)
-        symbol_table.update(parsed_variables)
+        # The variables table is layered on top of symbol_table already
+        symbol_table = SymbolTable.child_of(parsed_variables)
         symbol_table["variables"] = parsed_variables
-        super().parse_expressions(symbol_table, parsed_ids)
+        return symbol_table
 
     def to_diagram(
         self,
@@ -8,6 +8,8 @@ class Variables(DictNode):
     at all other points in the specification.
     """
 
+    _default_parse = True
+
     @classmethod
     def declare_attrs(cls, *args, **kwargs):
         super().declare_attrs(*args, **kwargs)
@@ -17,7 +19,6 @@ class Variables(DictNode):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._default_parse = True
         self.version: str = self["version"]
 
 